@@ -0,0 +1,218 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, text and vision, for
+benchmarking without network access or cost:
+
+    uvicorn benchmark.mock_openai_server:app --port 8003
+    OPENAI_APIKEY=mock OPENAI_BASE_URL=http://127.0.0.1:8003/v1 uvicorn main:app
+
+Answers are the canned ones of llm_client/mock_batch_server.py, with summaries
+padded to MOCK_OPENAI_SUMMARY_TOKENS. A response takes MOCK_OPENAI_LATENCY_SECONDS
+plus its completion tokens at MOCK_OPENAI_TOKENS_PER_SECOND. Requests beyond
+MOCK_OPENAI_RPM or MOCK_OPENAI_TPM in the last minute, and a random
+MOCK_OPENAI_429_RATE share of the rest, get a rate limit error like the real API.
+Prompt tokens are estimated like the page chunker does, plus a fixed cost per image.
+"""
+
+import asyncio
+from collections import deque
+import json
+import os
+import random
+import time
+from typing import AsyncIterator, Optional
+import uuid
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from llm_client.mock_batch_server import get_mock_message
+from utils.util import estimate_tokens
+
+MOCK_OPENAI_LATENCY_SECONDS = float(os.getenv("MOCK_OPENAI_LATENCY_SECONDS", "0.5"))
+# 0 generates every completion instantly
+MOCK_OPENAI_TOKENS_PER_SECOND = float(os.getenv("MOCK_OPENAI_TOKENS_PER_SECOND", "0"))
+MOCK_OPENAI_SUMMARY_TOKENS = int(os.getenv("MOCK_OPENAI_SUMMARY_TOKENS", "150"))
+MOCK_OPENAI_IMAGE_TOKENS = int(os.getenv("MOCK_OPENAI_IMAGE_TOKENS", "765"))
+MOCK_OPENAI_429_RATE = float(os.getenv("MOCK_OPENAI_429_RATE", "0"))
+# 0 disables the limit
+MOCK_OPENAI_RPM = int(os.getenv("MOCK_OPENAI_RPM", "0"))
+MOCK_OPENAI_TPM = int(os.getenv("MOCK_OPENAI_TPM", "0"))
+MOCK_RANDOM_SEED = int(os.getenv("MOCK_RANDOM_SEED", "0"))
+
+app = FastAPI()
+rng = random.Random(MOCK_RANDOM_SEED)
+stats = dict(requests=0, throttled=0, prompt_tokens=0, completion_tokens=0, images=0)
+# (time, prompt tokens) of the requests admitted in the last minute
+admitted_requests: deque[tuple[float, int]] = deque()
+
+
+def count_prompt_tokens(body: dict) -> tuple[int, int]:
+    """
+    Estimated prompt tokens and number of images of a chat completion request.
+    """
+    prompt_tokens = 0
+    images = 0
+    for message in body["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            prompt_tokens += estimate_tokens(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                prompt_tokens += estimate_tokens(part["text"])
+            elif part["type"] == "image_url":
+                images += 1
+                prompt_tokens += MOCK_OPENAI_IMAGE_TOKENS
+    if body.get("tools"):
+        prompt_tokens += estimate_tokens(json.dumps(body["tools"]))
+    return prompt_tokens, images
+
+
+def get_message(body: dict) -> dict:
+    message = get_mock_message(body)
+    content = message["content"]
+    # page table answers are JSON and tool calls have no content, pad summaries only
+    if content and not content.startswith("{"):
+        filler = " ".join(
+            f"finding-{index}" for index in range(MOCK_OPENAI_SUMMARY_TOKENS)
+        )
+        message["content"] = f"{content} {filler}"
+    return message
+
+
+def count_completion_tokens(message: dict) -> int:
+    if message["content"]:
+        return estimate_tokens(message["content"])
+    return sum(
+        estimate_tokens(tool_call["function"]["arguments"])
+        for tool_call in message["tool_calls"]
+    )
+
+
+def get_rate_limit_error(prompt_tokens: int) -> Optional[JSONResponse]:
+    now = time.monotonic()
+    while admitted_requests and admitted_requests[0][0] <= now - 60:
+        admitted_requests.popleft()
+
+    window_tokens = sum(tokens for _, tokens in admitted_requests)
+    if MOCK_OPENAI_RPM and len(admitted_requests) >= MOCK_OPENAI_RPM:
+        limit = f"requests per min (RPM): Limit {MOCK_OPENAI_RPM}"
+    elif MOCK_OPENAI_TPM and window_tokens + prompt_tokens > MOCK_OPENAI_TPM:
+        limit = f"tokens per min (TPM): Limit {MOCK_OPENAI_TPM}"
+    elif rng.random() < MOCK_OPENAI_429_RATE:
+        limit = "injected rate limit"
+    else:
+        admitted_requests.append((now, prompt_tokens))
+        return None
+
+    retry_after = 1.0
+    if admitted_requests and (MOCK_OPENAI_RPM or MOCK_OPENAI_TPM):
+        retry_after = max(1.0, admitted_requests[0][0] + 60 - now)
+    headers = {
+        "retry-after": str(int(retry_after)),
+        "x-ratelimit-remaining-requests": str(
+            max(0, MOCK_OPENAI_RPM - len(admitted_requests))
+        ),
+        "x-ratelimit-remaining-tokens": str(max(0, MOCK_OPENAI_TPM - window_tokens)),
+    }
+    stats["throttled"] += 1
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers=headers,
+        content={
+            "error": {
+                "message": f"Rate limit reached for mock model on {limit}.",
+                "type": "requests",
+                "param": None,
+                "code": "rate_limit_exceeded",
+            }
+        },
+    )
+
+
+def get_completion_seconds(completion_tokens: int) -> float:
+    if not MOCK_OPENAI_TOKENS_PER_SECOND:
+        return 0.0
+    return completion_tokens / MOCK_OPENAI_TOKENS_PER_SECOND
+
+
+async def stream_chunks(body: dict, message: dict, usage: dict) -> AsyncIterator[str]:
+    chunk = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body["model"],
+    }
+    await asyncio.sleep(MOCK_OPENAI_LATENCY_SECONDS)
+    words = (message["content"] or "").split(" ")
+    for index, word in enumerate(words):
+        await asyncio.sleep(get_completion_seconds(estimate_tokens(word)))
+        delta = {"content": word if index == 0 else f" {word}"}
+        if index == 0:
+            delta["role"] = "assistant"
+        choice = {"index": 0, "delta": delta, "finish_reason": None}
+        yield f"data: {json.dumps(dict(chunk, choices=[choice]))}\n\n"
+
+    choice = {"index": 0, "delta": {}, "finish_reason": "stop"}
+    yield f"data: {json.dumps(dict(chunk, choices=[choice]))}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield f"data: {json.dumps(dict(chunk, choices=[], usage=usage))}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    return stats
+
+
+@app.post("/stats/reset")
+async def reset_stats() -> dict:
+    stats.update(
+        requests=0, throttled=0, prompt_tokens=0, completion_tokens=0, images=0
+    )
+    admitted_requests.clear()
+    return stats
+
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    prompt_tokens, images = count_prompt_tokens(body)
+    rate_limit_error = get_rate_limit_error(prompt_tokens)
+    if rate_limit_error:
+        return rate_limit_error
+
+    message = get_message(body)
+    completion_tokens = count_completion_tokens(message)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+    stats["images"] += images
+
+    if body.get("stream"):
+        return StreamingResponse(
+            stream_chunks(body, message, usage), media_type="text/event-stream"
+        )
+
+    await asyncio.sleep(
+        MOCK_OPENAI_LATENCY_SECONDS + get_completion_seconds(completion_tokens)
+    )
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }
+        ],
+        "usage": usage,
+    }
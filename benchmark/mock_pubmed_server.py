@@ -0,0 +1,126 @@
+"""
+Local stand-in for PubMed and the full-text sites PaperDownloader follows, replayed
+from the pages in benchmark/fixtures:
+
+    uvicorn benchmark.mock_pubmed_server:app --port 8002
+
+Paper {paper_id} lives at /{paper_id}/. Even ids link to a PMC full-text page,
+odd ids to a Silverchair one, both carrying the citation_pdf_url meta tag.
+The PDF is MOCK_PUBMED_PDF_DIR/{paper_id}.pdf, or one of the PDFs in that
+directory picked by paper id. Every page and PDF response is delayed by
+MOCK_PUBMED_LATENCY_SECONDS and answered with a 429 at MOCK_PUBMED_429_RATE.
+"""
+
+import asyncio
+import os
+import random
+from string import Template
+
+from fastapi import FastAPI, HTTPException, Request, status
+from fastapi.responses import FileResponse, HTMLResponse, Response
+
+MOCK_PUBMED_PDF_DIR = os.getenv("MOCK_PUBMED_PDF_DIR", "data/downloaded_papers")
+MOCK_PUBMED_LATENCY_SECONDS = float(os.getenv("MOCK_PUBMED_LATENCY_SECONDS", "0.05"))
+MOCK_PUBMED_429_RATE = float(os.getenv("MOCK_PUBMED_429_RATE", "0"))
+MOCK_PUBMED_RETRY_AFTER_SECONDS = os.getenv("MOCK_PUBMED_RETRY_AFTER_SECONDS", "1")
+MOCK_RANDOM_SEED = int(os.getenv("MOCK_RANDOM_SEED", "0"))
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+app = FastAPI()
+rng = random.Random(MOCK_RANDOM_SEED)
+stats = dict(requests=0, throttled=0, pdf_bytes=0)
+
+
+def read_fixture(name: str) -> Template:
+    with open(os.path.join(FIXTURES_DIR, name), "r") as file:
+        return Template(file.read())
+
+
+FIXTURES = {
+    name: read_fixture(f"{name}.html")
+    for name in (
+        "pubmed_pmc",
+        "pubmed_silverchair",
+        "full_text_pmc",
+        "full_text_silverchair",
+    )
+}
+
+
+def get_pdf_path(paper_id: int) -> str:
+    pdf_path = os.path.join(MOCK_PUBMED_PDF_DIR, f"{paper_id}.pdf")
+    if os.path.exists(pdf_path):
+        return pdf_path
+
+    sample_pdfs = sorted(
+        filename
+        for filename in os.listdir(MOCK_PUBMED_PDF_DIR)
+        if filename.endswith(".pdf")
+    )
+    if not sample_pdfs:
+        raise HTTPException(status_code=404, detail=f"No PDF for paper {paper_id}")
+    return os.path.join(MOCK_PUBMED_PDF_DIR, sample_pdfs[paper_id % len(sample_pdfs)])
+
+
+@app.middleware("http")
+async def simulate_site(request: Request, call_next) -> Response:
+    if request.url.path.startswith("/stats"):
+        return await call_next(request)
+
+    stats["requests"] += 1
+    await asyncio.sleep(MOCK_PUBMED_LATENCY_SECONDS)
+    if rng.random() < MOCK_PUBMED_429_RATE:
+        stats["throttled"] += 1
+        return Response(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": MOCK_PUBMED_RETRY_AFTER_SECONDS},
+        )
+    return await call_next(request)
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    return stats
+
+
+@app.post("/stats/reset")
+async def reset_stats() -> dict:
+    stats.update(requests=0, throttled=0, pdf_bytes=0)
+    return stats
+
+
+@app.get("/{paper_id}/")
+async def get_pubmed_page(paper_id: int, request: Request) -> HTMLResponse:
+    if paper_id % 2 == 0:
+        fixture = FIXTURES["pubmed_pmc"]
+        full_text_url = request.url_for("get_pmc_page", paper_id=paper_id)
+    else:
+        fixture = FIXTURES["pubmed_silverchair"]
+        full_text_url = request.url_for("get_silverchair_page", paper_id=paper_id)
+    return HTMLResponse(
+        fixture.substitute(paper_id=paper_id, full_text_url=full_text_url)
+    )
+
+
+@app.get("/pmc/articles/PMC{paper_id}/")
+async def get_pmc_page(paper_id: int, request: Request) -> HTMLResponse:
+    pdf_url = request.url_for("get_pdf", paper_id=paper_id)
+    return HTMLResponse(
+        FIXTURES["full_text_pmc"].substitute(paper_id=paper_id, pdf_url=pdf_url)
+    )
+
+
+@app.get("/silverchair/article/{paper_id}")
+async def get_silverchair_page(paper_id: int, request: Request) -> HTMLResponse:
+    pdf_url = request.url_for("get_pdf", paper_id=paper_id)
+    return HTMLResponse(
+        FIXTURES["full_text_silverchair"].substitute(paper_id=paper_id, pdf_url=pdf_url)
+    )
+
+
+@app.get("/pdf/{paper_id}.pdf")
+async def get_pdf(paper_id: int) -> FileResponse:
+    pdf_path = get_pdf_path(paper_id)
+    stats["pdf_bytes"] += os.path.getsize(pdf_path)
+    return FileResponse(pdf_path, media_type="application/pdf")
@@ -0,0 +1,739 @@
+"""
+Reproducible throughput benchmark against local stand-ins for PubMed and OpenAI,
+so runs need neither network access nor an API key:
+
+    LOG_LEVEL=WARNING python -m benchmark.run_benchmark --papers 20 --concurrency 1,4,16
+    LOG_LEVEL=WARNING python -m benchmark.run_benchmark --compare benchmark/results/<baseline>.json
+
+Every scenario (download, summary, table, endpoints) runs at every concurrency level
+in its own work directory, so no run sees the artifacts or LLM cache of another.
+Results are written as JSON to benchmark/results, tagged with the git commit.
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import httpx
+from prometheus_client import generate_latest
+from prometheus_client.parser import text_string_to_metric_families
+import pymupdf
+
+from db.artifact_store import ArtifactStore
+from db.models import BenchmarkReport, BenchmarkResult, Paper
+from db.paper_index import PaperIndex
+from db.table_store import TableStore
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_client import LLMClient
+from llm_client.llm_limiter import LLMLimiter
+from paper_downloader.paper_downloader import PaperDownloader
+from paper_downloader.rate_limiter import HostRateLimiter
+from paper_summariser.paper_summariser import generate_paper_summary
+from pdf_processor.pdf_processor import PdfProcessor
+from setup_logger import setup_logger
+from table_extracter.table_extracter import generate_primary_result_table
+from utils.client_registry import ClientRegistry
+from utils.const import (
+    BENCHMARK_CONCURRENCY_LEVELS,
+    BENCHMARK_PAPER_ID_START,
+    BENCHMARK_PAPERS,
+    BENCHMARK_RESULTS_DIR,
+    BENCHMARK_RSS_SAMPLE_INTERVAL_SECONDS,
+    BENCHMARK_SERVER_START_TIMEOUT_SECONDS,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    MAX_PAGE_IMAGES_IN_MEMORY,
+    PDF_PROCESS_POOL_WORKERS,
+)
+from utils.metrics import monitor_event_loop_lag
+from utils.util import map_bounded
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF_DIR = os.path.join(REPO_DIR, "data", "downloaded_papers")
+SCENARIOS = ("download", "summary", "table", "endpoints", "analyze")
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_process_tree_rss(pid: int) -> Optional[int]:
+    """
+    Resident memory of pid and its child processes (the PdfProcessor workers).
+    """
+    if not os.path.exists("/proc"):
+        # without /proc (macOS) only this process's peak is known, in bytes there
+        if pid == os.getpid():
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return None
+
+    try:
+        with open(f"/proc/{pid}/statm", "r") as file:
+            rss = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        child_pids: list[int] = list()
+        for thread_id in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{thread_id}/children", "r") as file:
+                child_pids.extend(int(child_pid) for child_pid in file.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    return rss + sum(get_process_tree_rss(child_pid) or 0 for child_pid in child_pids)
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+
+def read_loop_lag_buckets(metrics_text: str) -> dict[float, float]:
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name == "event_loop_lag_seconds":
+            return {
+                float(sample.labels["le"]): sample.value
+                for sample in family.samples
+                if sample.name.endswith("_bucket")
+            }
+    return dict()
+
+
+def get_histogram_quantile(
+    buckets_before: dict[float, float],
+    buckets_after: dict[float, float],
+    quantile: float,
+) -> Optional[float]:
+    """
+    Quantile of the observations made between two reads of a histogram,
+    interpolated within its bucket like Prometheus' histogram_quantile.
+    """
+    buckets = sorted(
+        (bound, count - buckets_before.get(bound, 0))
+        for bound, count in buckets_after.items()
+    )
+    if not buckets or not buckets[-1][1]:
+        return None
+
+    rank = quantile * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return round(
+                lower_bound
+                + (bound - lower_bound) * (rank - lower_count) / (count - lower_count),
+                6,
+            )
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def make_fixture_pdfs(paper_ids: list[int], pdf_dir: str) -> None:
+    """
+    Copy the sample PDFs round robin with the paper id stamped on every page, so
+    each benchmark paper has its own page text and images and papers never
+    share LLM cache entries.
+    """
+    sample_paths = sorted(
+        os.path.join(SAMPLE_PDF_DIR, filename)
+        for filename in os.listdir(SAMPLE_PDF_DIR)
+        if filename.endswith(".pdf")
+    )
+    if not sample_paths:
+        raise Exception(f"No sample PDFs in {SAMPLE_PDF_DIR}")
+
+    os.makedirs(pdf_dir, exist_ok=True)
+    for index, paper_id in enumerate(paper_ids):
+        with pymupdf.open(sample_paths[index % len(sample_paths)]) as pdf_doc:
+            for pdf_page in pdf_doc:
+                pdf_page.insert_text(
+                    (36, 18), f"Benchmark paper {paper_id}", fontsize=6
+                )
+            pdf_doc.save(os.path.join(pdf_dir, f"{paper_id}.pdf"))
+
+
+def get_git_commit() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(changes)
+
+
+class LocalServer:
+    """
+    A uvicorn app run in its own process for the benchmark, so its CPU time
+    never shows up in the event loop being measured.
+    """
+
+    def __init__(self, app: str, env: dict[str, str], cwd: str = REPO_DIR):
+        self.app = app
+        self.env = env
+        self.cwd = cwd
+        self.port = get_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process: Optional[subprocess.Popen] = None
+
+    async def start(self, client: httpx.AsyncClient, ready_path: str) -> None:
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                self.app,
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--log-level",
+                "warning",
+            ],
+            cwd=self.cwd,
+            env={**os.environ, "PYTHONPATH": REPO_DIR, **self.env},
+        )
+
+        deadline = time.monotonic() + BENCHMARK_SERVER_START_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise Exception(
+                    f"{self.app} exited with code {self.process.returncode}"
+                )
+            try:
+                response = await client.get(f"{self.url}{ready_path}")
+                if response.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        self.stop()
+        raise Exception(f"{self.app} did not start on port {self.port}")
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    async def get_stats(self, client: httpx.AsyncClient) -> dict:
+        return (await client.get(f"{self.url}/stats")).json()
+
+    async def reset_stats(self, client: httpx.AsyncClient) -> None:
+        await client.post(f"{self.url}/stats/reset")
+
+
+class PeakRssSampler:
+    def __init__(
+        self, pid: int, interval: float = BENCHMARK_RSS_SAMPLE_INTERVAL_SECONDS
+    ):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_bytes: Optional[int] = None
+
+    async def run(self) -> None:
+        while True:
+            rss = get_process_tree_rss(self.pid)
+            if rss is not None:
+                self.peak_rss_bytes = max(self.peak_rss_bytes or 0, rss)
+            await asyncio.sleep(self.interval)
+
+
+class Benchmark:
+    def __init__(
+        self,
+        args: argparse.Namespace,
+        workdir: str,
+        client: httpx.AsyncClient,
+        pubmed_server: LocalServer,
+        openai_server: LocalServer,
+    ):
+        self.args = args
+        self.workdir = workdir
+        self.client = client
+        self.pubmed_server = pubmed_server
+        self.openai_server = openai_server
+        self.paper_ids = [
+            BENCHMARK_PAPER_ID_START + index for index in range(args.papers)
+        ]
+        self.fixture_pdf_dir = os.path.join(workdir, "fixtures")
+
+    def prepare_run_dir(self, scenario: str, concurrency: int, with_pdfs: bool) -> str:
+        """
+        A fresh data/ tree for one run, with the fixture PDFs already downloaded
+        unless the download itself is measured. In-process scenarios run in it.
+        """
+        run_dir = os.path.join(self.workdir, f"{scenario}_{concurrency}")
+        pdf_dir = os.path.join(run_dir, "data", "downloaded_papers")
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.makedirs(pdf_dir)
+        if with_pdfs:
+            for paper_id in self.paper_ids:
+                shutil.copy(
+                    os.path.join(self.fixture_pdf_dir, f"{paper_id}.pdf"), pdf_dir
+                )
+        os.chdir(run_dir)
+        return run_dir
+
+    def get_llm_rate_limit(self) -> tuple[int, int]:
+        # the limiter is told the mock's limits, like it is told the real API's
+        return self.args.llm_rpm, self.args.llm_tpm
+
+    @asynccontextmanager
+    async def open_services(
+        self,
+    ) -> AsyncIterator[tuple[ClientRegistry, LLMClient, PdfProcessor, PaperIndex]]:
+        client_registry = ClientRegistry(
+            openai_api_key="mock", openai_base_url=f"{self.openai_server.url}/v1"
+        )
+        await client_registry.start()
+        llm_client = LLMClient(
+            openai_client=client_registry.openai_client,
+            llm_cache=LLMCache(),
+            llm_limiter=LLMLimiter(
+                rate_limits=dict(), default_rate_limit=self.get_llm_rate_limit()
+            ),
+        )
+        pdf_processor = PdfProcessor()
+        paper_index = PaperIndex()
+        paper_index.open()
+        await paper_index.reconcile()
+        try:
+            yield client_registry, llm_client, pdf_processor, paper_index
+        finally:
+            paper_index.close()
+            pdf_processor.close()
+            await client_registry.close()
+
+    async def read_loop_lag_buckets(
+        self, metrics_url: Optional[str]
+    ) -> dict[float, float]:
+        if metrics_url:
+            metrics_text = (await self.client.get(metrics_url)).text
+        else:
+            metrics_text = generate_latest().decode("utf-8")
+        return read_loop_lag_buckets(metrics_text)
+
+    async def measure(
+        self,
+        scenario: str,
+        concurrency: int,
+        process_paper: Callable[[int], Awaitable[None]],
+        pid: Optional[int] = None,
+        metrics_url: Optional[str] = None,
+    ) -> BenchmarkResult:
+        """
+        Run process_paper over every paper with at most concurrency in flight.
+        Memory is sampled from pid and event loop lag read from metrics_url,
+        this process by default.
+        """
+        await self.pubmed_server.reset_stats(self.client)
+        await self.openai_server.reset_stats(self.client)
+
+        background_tasks: list[asyncio.Task] = list()
+        if not metrics_url:
+            background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+        rss_sampler = PeakRssSampler(pid or os.getpid())
+        background_tasks.append(asyncio.create_task(rss_sampler.run()))
+        loop_lag_before = await self.read_loop_lag_buckets(metrics_url)
+
+        latencies: list[float] = list()
+        errors: Counter[str] = Counter()
+
+        async def timed_process_paper(paper_id: int) -> None:
+            started_at = time.monotonic()
+            try:
+                await process_paper(paper_id)
+            except Exception as e:
+                errors[f"{type(e).__name__}: {str(e)[:200]}"] += 1
+            latencies.append(time.monotonic() - started_at)
+
+        started_at = time.monotonic()
+        await map_bounded(
+            self.paper_ids,
+            timed_process_paper,
+            max_concurrency=concurrency,
+            name=f"benchmark_{scenario}",
+        )
+        elapsed_seconds = time.monotonic() - started_at
+
+        loop_lag_after = await self.read_loop_lag_buckets(metrics_url)
+        for background_task in background_tasks:
+            background_task.cancel()
+        pubmed_stats = await self.pubmed_server.get_stats(self.client)
+        openai_stats = await self.openai_server.get_stats(self.client)
+
+        result = BenchmarkResult(
+            scenario=scenario,
+            concurrency=concurrency,
+            papers=len(self.paper_ids),
+            failed=sum(errors.values()),
+            elapsed_seconds=round(elapsed_seconds, 3),
+            papers_per_minute=round(
+                (len(self.paper_ids) - sum(errors.values())) / elapsed_seconds * 60, 2
+            ),
+            latency_p50_seconds=round(get_percentile(latencies, 50), 3),
+            latency_p99_seconds=round(get_percentile(latencies, 99), 3),
+            latency_max_seconds=round(max(latencies, default=0.0), 3),
+            peak_rss_bytes=rss_sampler.peak_rss_bytes,
+            loop_lag_p50_seconds=get_histogram_quantile(
+                loop_lag_before, loop_lag_after, 0.5
+            ),
+            loop_lag_p99_seconds=get_histogram_quantile(
+                loop_lag_before, loop_lag_after, 0.99
+            ),
+            llm_requests=openai_stats["requests"],
+            llm_throttled=openai_stats["throttled"],
+            llm_prompt_tokens=openai_stats["prompt_tokens"],
+            llm_completion_tokens=openai_stats["completion_tokens"],
+            pubmed_requests=pubmed_stats["requests"],
+            pubmed_throttled=pubmed_stats["throttled"],
+            errors=dict(errors),
+        )
+        logger.info(
+            f"{scenario} at concurrency {concurrency}: {result.papers_per_minute} papers/min, p50 {result.latency_p50_seconds}s, p99 {result.latency_p99_seconds}s, {result.failed} failed"
+        )
+        return result
+
+    async def run_download(self, concurrency: int) -> BenchmarkResult:
+        self.prepare_run_dir("download", concurrency, with_pdfs=False)
+        async with self.open_services() as (client_registry, _, _, paper_index):
+            # the mock site is one host, give it a limit that is not the bottleneck
+            downloader = PaperDownloader(
+                client=client_registry.http_client,
+                rate_limiter=HostRateLimiter(
+                    host_rate_limits={
+                        "127.0.0.1": (self.args.host_rate, self.args.host_rate)
+                    }
+                ),
+                paper_index=paper_index,
+                artifact_store=ArtifactStore(),
+            )
+
+            async def download(paper_id: int) -> None:
+                await downloader.download(
+                    Paper(
+                        paper_id=paper_id,
+                        paper_url=f"{self.pubmed_server.url}/{paper_id}/",
+                    )
+                )
+
+            return await self.measure("download", concurrency, download)
+
+    async def run_summary(self, concurrency: int) -> BenchmarkResult:
+        self.prepare_run_dir("summary", concurrency, with_pdfs=True)
+        async with self.open_services() as (_, llm_client, pdf_processor, paper_index):
+            artifact_store = ArtifactStore()
+
+            async def summarise(paper_id: int) -> None:
+                await generate_paper_summary(
+                    paper_id,
+                    f"data/summaries/{paper_id}.md",
+                    llm_client,
+                    pdf_processor,
+                    paper_index,
+                    artifact_store,
+                )
+
+            return await self.measure("summary", concurrency, summarise)
+
+    async def run_table(self, concurrency: int) -> BenchmarkResult:
+        self.prepare_run_dir("table", concurrency, with_pdfs=True)
+        async with self.open_services() as (_, llm_client, pdf_processor, paper_index):
+            artifact_store = ArtifactStore()
+            table_store = TableStore()
+
+            async def extract_table(paper_id: int) -> None:
+                await generate_primary_result_table(
+                    paper_id,
+                    f"data/extracted_tables/{paper_id}.csv",
+                    llm_client,
+                    pdf_processor,
+                    paper_index,
+                    artifact_store,
+                    table_store,
+                )
+
+            return await self.measure("table", concurrency, extract_table)
+
+    async def run_endpoints(
+        self, concurrency: int, scenario: str = "endpoints"
+    ) -> BenchmarkResult:
+        """
+        The API in its own uvicorn process, asked for the summary and the primary
+        result table of each paper at once, like a client opening a paper. The
+        "analyze" scenario asks for both with a single /analyze request.
+        """
+        run_dir = self.prepare_run_dir(scenario, concurrency, with_pdfs=True)
+        api_server = LocalServer(
+            "main:app",
+            env={
+                "OPENAI_APIKEY": "mock",
+                "OPENAI_BASE_URL": f"{self.openai_server.url}/v1",
+                "LLM_RATE_LIMITS": json.dumps(
+                    {
+                        model: self.get_llm_rate_limit()
+                        for model in ("gpt-4o-mini", "gpt-4o")
+                    }
+                ),
+                "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            },
+            cwd=run_dir,
+        )
+        await api_server.start(self.client, "/metrics")
+
+        async def analyse(paper_id: int) -> None:
+            if scenario == "analyze":
+                response = await self.client.get(f"{api_server.url}/analyze/{paper_id}")
+                response.raise_for_status()
+                # one failed stage still answers 200
+                for stage, result in response.json()["stages"].items():
+                    if result["status"] == "failed":
+                        raise Exception(f"{stage} failed: {result['error']}")
+                return
+
+            responses = await asyncio.gather(
+                self.client.get(f"{api_server.url}/get_paper_summary/{paper_id}"),
+                self.client.get(
+                    f"{api_server.url}/get_primary_result_table/{paper_id}"
+                ),
+            )
+            for response in responses:
+                response.raise_for_status()
+
+        try:
+            return await self.measure(
+                scenario,
+                concurrency,
+                analyse,
+                pid=api_server.process.pid,
+                metrics_url=f"{api_server.url}/metrics",
+            )
+        finally:
+            api_server.stop()
+
+    async def run(self) -> list[BenchmarkResult]:
+        make_fixture_pdfs(self.paper_ids, self.fixture_pdf_dir)
+        scenario_runners = {
+            "download": self.run_download,
+            "summary": self.run_summary,
+            "table": self.run_table,
+            "endpoints": self.run_endpoints,
+            "analyze": lambda concurrency: self.run_endpoints(concurrency, "analyze"),
+        }
+        results: list[BenchmarkResult] = list()
+        try:
+            for scenario in self.args.scenarios:
+                for concurrency in self.args.concurrency:
+                    results.append(await scenario_runners[scenario](concurrency))
+        finally:
+            os.chdir(REPO_DIR)
+        return results
+
+
+def format_results(results: list[BenchmarkResult]) -> str:
+    lines = [
+        f"{'scenario':<10} {'conc':>4} {'papers/min':>10} {'p50 s':>8} {'p99 s':>8} {'rss MB':>8} {'lag p99 ms':>10} {'failed':>6}"
+    ]
+    for result in results:
+        rss = (
+            f"{result.peak_rss_bytes / 1024 / 1024:.0f}"
+            if result.peak_rss_bytes
+            else "-"
+        )
+        lag = (
+            f"{result.loop_lag_p99_seconds * 1000:.1f}"
+            if result.loop_lag_p99_seconds is not None
+            else "-"
+        )
+        lines.append(
+            f"{result.scenario:<10} {result.concurrency:>4} {result.papers_per_minute:>10.1f} {result.latency_p50_seconds:>8.2f} {result.latency_p99_seconds:>8.2f} {rss:>8} {lag:>10} {result.failed:>6}"
+        )
+    return "\n".join(lines)
+
+
+def compare_reports(baseline: BenchmarkReport, report: BenchmarkReport) -> str:
+    baseline_results = {
+        (result.scenario, result.concurrency): result for result in baseline.results
+    }
+    lines = [
+        f"Compared with {baseline.git_commit[:8]} ({baseline.created_at:%Y-%m-%d %H:%M}):",
+        f"{'scenario':<10} {'conc':>4} {'papers/min':>22} {'p99 s':>22}",
+    ]
+    for result in report.results:
+        baseline_result = baseline_results.get((result.scenario, result.concurrency))
+        if not baseline_result:
+            continue
+        changes = list()
+        for before, after in (
+            (baseline_result.papers_per_minute, result.papers_per_minute),
+            (baseline_result.latency_p99_seconds, result.latency_p99_seconds),
+        ):
+            change = f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+            changes.append(f"{before:.2f} -> {after:.2f} {change:>5}")
+        lines.append(
+            f"{result.scenario:<10} {result.concurrency:>4} {changes[0]:>22} {changes[1]:>22}"
+        )
+    if len(lines) == 2:
+        lines.append("No scenario and concurrency level in common")
+    return "\n".join(lines)
+
+
+async def main(args: argparse.Namespace) -> None:
+    setup_logger()
+    logger.setLevel(logging.INFO)
+
+    created_at = datetime.now(timezone.utc)
+    git_commit, git_dirty = get_git_commit()
+    output_path = os.path.abspath(
+        args.output
+        or os.path.join(
+            REPO_DIR,
+            BENCHMARK_RESULTS_DIR,
+            f"{created_at:%Y%m%dT%H%M%S}_{git_commit[:8]}.json",
+        )
+    )
+    workdir = args.workdir or tempfile.mkdtemp(prefix="paper_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+
+    pubmed_server = LocalServer(
+        "benchmark.mock_pubmed_server:app",
+        env={
+            "MOCK_PUBMED_PDF_DIR": os.path.join(workdir, "fixtures"),
+            "MOCK_PUBMED_LATENCY_SECONDS": str(args.pubmed_latency),
+            "MOCK_PUBMED_429_RATE": str(args.pubmed_429_rate),
+            "MOCK_RANDOM_SEED": str(args.seed),
+        },
+    )
+    openai_server = LocalServer(
+        "benchmark.mock_openai_server:app",
+        env={
+            "MOCK_OPENAI_LATENCY_SECONDS": str(args.llm_latency),
+            "MOCK_OPENAI_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+            "MOCK_OPENAI_429_RATE": str(args.llm_429_rate),
+            "MOCK_OPENAI_RPM": str(args.llm_rpm),
+            "MOCK_OPENAI_TPM": str(args.llm_tpm),
+            "MOCK_RANDOM_SEED": str(args.seed),
+        },
+    )
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600)) as client:
+        try:
+            await pubmed_server.start(client, "/stats")
+            await openai_server.start(client, "/stats")
+            results = await Benchmark(
+                args, workdir, client, pubmed_server, openai_server
+            ).run()
+        finally:
+            pubmed_server.stop()
+            openai_server.stop()
+            if not args.keep_workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    settings = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "workdir", "keep_workdir", "compare")
+    }
+    settings.update(
+        llm_initial_concurrency=LLM_INITIAL_CONCURRENCY,
+        llm_max_concurrency=LLM_MAX_CONCURRENCY,
+        max_page_images_in_memory=MAX_PAGE_IMAGES_IN_MEMORY,
+        pdf_process_pool_workers=PDF_PROCESS_POOL_WORKERS,
+    )
+    report = BenchmarkReport(
+        git_commit=git_commit,
+        git_dirty=git_dirty,
+        created_at=created_at,
+        python_version=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count() or 1,
+        settings=settings,
+        results=results,
+    )
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as file:
+        file.write(report.model_dump_json(indent=2))
+
+    print(format_results(results))
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = BenchmarkReport.model_validate(json.load(file))
+        print(compare_reports(baseline, report))
+    print(f"Results written to {output_path}")
+
+
+def parse_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the downloader, summariser, table extracter and API against local mock PubMed and OpenAI servers."
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=parse_list,
+        default=list(SCENARIOS),
+        help=f"comma separated, any of {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(item) for item in parse_list(value)],
+        default=list(BENCHMARK_CONCURRENCY_LEVELS),
+        help="comma separated papers in flight, one run per level",
+    )
+    parser.add_argument("--papers", type=int, default=BENCHMARK_PAPERS)
+    parser.add_argument("--pubmed-latency", type=float, default=0.05)
+    parser.add_argument("--pubmed-429-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--host-rate", type=float, default=20.0, help="requests/s to the mock site"
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--llm-429-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=int, default=0)
+    parser.add_argument("--llm-tpm", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="defaults to a temporary directory")
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--output", help=f"defaults to {BENCHMARK_RESULTS_DIR}/")
+    parser.add_argument("--compare", help="a previous results file to compare with")
+    args = parser.parse_args()
+    unknown_scenarios = set(args.scenarios) - set(SCENARIOS)
+    if unknown_scenarios:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown_scenarios))}")
+    asyncio.run(main(args))
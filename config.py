@@ -1,5 +1,11 @@
+import json
 import os
 
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 OPENAI_APIKEY = os.getenv("OPENAI_APIKEY", "")
+# point at llm_client/mock_batch_server.py to run the batch mode offline
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# per-model (requests per minute, tokens per minute) overriding LLM_RATE_LIMITS,
+# e.g. {"gpt-4o": [5000, 800000]}
+LLM_RATE_LIMIT_OVERRIDES = json.loads(os.getenv("LLM_RATE_LIMITS") or "{}")
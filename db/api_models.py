@@ -1,11 +1,171 @@
+from datetime import datetime
+from typing import Any, Optional
+
 from pydantic import BaseModel
 
-from db.models import Paper
+from db.models import (
+    ArtifactCacheStats,
+    ClientPoolStats,
+    DownloadStatus,
+    LLMCacheStats,
+    LLMLimiterStats,
+    Paper,
+    PaperAnalysisStage,
+    PaperCheckpoints,
+    PaperRecord,
+    SearchHit,
+    SearchIndexStats,
+    SingleFlightStats,
+    TableCandidate,
+    TableStoreStats,
+)
 
 
 class GetDownloadedPapersResponse(BaseModel):
     papers: list[Paper] = []
+    total: int = 0
+    next_cursor: Optional[int] = None
 
 
 class TriggerPaperDownloadRequest(BaseModel):
     paper_ids: list[int] = []
+
+
+class TriggerPaperDownloadResponse(BaseModel):
+    message: str
+    job_id: str
+    paper_count: int
+
+
+class PaperDownloadStatusResponse(BaseModel):
+    paper_id: int
+    paper_url: str
+    status: DownloadStatus
+    queued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    wait_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class GetDownloadJobResponse(BaseModel):
+    job_id: str
+    status: DownloadStatus
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    status_counts: dict[DownloadStatus, int] = {}
+    papers: list[PaperDownloadStatusResponse] = []
+
+
+class GetClientPoolStatsResponse(BaseModel):
+    pools: list[ClientPoolStats] = []
+
+
+class GetLLMCacheStatsResponse(BaseModel):
+    cache: LLMCacheStats
+
+
+class GetArtifactCacheStatsResponse(BaseModel):
+    cache: ArtifactCacheStats
+
+
+class GetPaperSummariesResponse(BaseModel):
+    # paper id -> stored summary
+    summaries: dict[int, str] = dict()
+    # requested papers without a stored summary
+    missing: list[int] = []
+
+
+class GetLLMLimiterStatsResponse(BaseModel):
+    models: list[LLMLimiterStats]
+
+
+class GetSingleFlightStatsResponse(BaseModel):
+    single_flight: SingleFlightStats
+
+
+class GetTableCandidatesResponse(BaseModel):
+    paper_id: int
+    threshold: float
+    pages: list[TableCandidate] = []
+
+
+class TriggerBulkAnalysisRequest(BaseModel):
+    # all papers in data/pubmed_paper_links.txt when empty
+    paper_ids: list[int] = []
+    download_concurrency: Optional[int] = None
+    summary_concurrency: Optional[int] = None
+    table_concurrency: Optional[int] = None
+
+
+class PipelineStageReport(BaseModel):
+    name: str
+    concurrency: int
+    queued: int
+    running: int
+    done: int
+    skipped: int
+    failed: int
+    average_seconds: Optional[float] = None
+
+
+class BulkAnalysisReport(BaseModel):
+    run_id: str
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    elapsed_seconds: float
+    paper_count: int
+    papers_completed: int
+    papers_per_minute: float
+    stages: list[PipelineStageReport] = []
+    errors: dict[str, str] = {}
+
+
+class GetPapersResponse(BaseModel):
+    papers: list[PaperRecord] = []
+    total: int = 0
+    next_cursor: Optional[int] = None
+
+
+class GetPaperCheckpointsResponse(BaseModel):
+    paper_id: int
+    summary: PaperCheckpoints
+    table: PaperCheckpoints
+
+
+class AnalyzePaperResponse(BaseModel):
+    paper_id: int
+    summary: Optional[str] = None
+    table_path: Optional[str] = None
+    # "summary" and "table", with the time each took
+    stages: dict[str, PaperAnalysisStage] = {}
+    elapsed_seconds: float
+
+
+class QueryTablesResponse(BaseModel):
+    # one per matching table cell, with the requested fields
+    rows: list[dict[str, Any]] = []
+    total: int = 0
+    papers: int = 0
+    next_offset: Optional[int] = None
+    elapsed_ms: float = 0.0
+
+
+class GetTableStoreStatsResponse(BaseModel):
+    store: TableStoreStats
+
+
+class SearchResponse(BaseModel):
+    hits: list[SearchHit] = []
+    # terms left out of the ranking for matching too many documents
+    common_terms: list[str] = []
+    # False when every term was that common, the most recent matches come first
+    ranked: bool = True
+    next_offset: Optional[int] = None
+    elapsed_ms: float = 0.0
+
+
+class GetSearchIndexStatsResponse(BaseModel):
+    index: SearchIndexStats
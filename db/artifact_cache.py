@@ -0,0 +1,163 @@
+import asyncio
+from collections import OrderedDict
+import gzip
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from pydantic import BaseModel
+
+from db.models import ArtifactCacheStats
+from utils.const import (
+    ARTIFACT_CACHE_MAX_BYTES,
+    ARTIFACT_CACHE_MAX_ENTRY_BYTES,
+    ARTIFACT_GZIP_MIN_BYTES,
+)
+from utils.metrics import ARTIFACT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class Artifact(BaseModel):
+    """
+    Content of a stored summary or table, with a strong ETag from its hash.
+    """
+
+    content: bytes
+    etag: str
+    size: int
+    mtime_ns: int
+    # compressed on the first request that accepts gzip
+    gzip_content: Optional[bytes] = None
+
+    @property
+    def gzip_etag(self) -> str:
+        return f'{self.etag[:-1]}-gzip"'
+
+    def get_size_bytes(self) -> int:
+        return len(self.content) + len(self.gzip_content or b"")
+
+
+def read_artifact(path: str) -> Optional[Artifact]:
+    try:
+        with open(path, "rb") as file:
+            file_stat = os.fstat(file.fileno())
+            content = file.read()
+    except FileNotFoundError:
+        return None
+    return Artifact(
+        content=content,
+        etag=f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        size=file_stat.st_size,
+        mtime_ns=file_stat.st_mtime_ns,
+    )
+
+
+class ArtifactCache:
+    """
+    Bounded in-memory LRU of the summaries and tables served by the API, so a
+    polled artifact is read from disk once and answered from memory or with a
+    304 afterwards. Every lookup checks the file's size and modification time,
+    so a rewritten artifact is never served stale. Files are read off the event
+    loop, and the least recently used entries are evicted past max_size_bytes.
+    """
+
+    def __init__(
+        self,
+        max_size_bytes: int = ARTIFACT_CACHE_MAX_BYTES,
+        max_entry_bytes: int = ARTIFACT_CACHE_MAX_ENTRY_BYTES,
+    ):
+        self.max_size_bytes = max_size_bytes
+        self.max_entry_bytes = max_entry_bytes
+        # path -> artifact, ordered from least to most recently used
+        self.entries: OrderedDict[str, Artifact] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def is_fresh(self, artifact: Artifact, path: str) -> bool:
+        try:
+            path_stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        return (
+            path_stat.st_size == artifact.size
+            and path_stat.st_mtime_ns == artifact.mtime_ns
+        )
+
+    def drop(self, path: str) -> None:
+        if path in self.entries:
+            self.size_bytes -= self.entries.pop(path).get_size_bytes()
+
+    def keep(self, path: str, artifact: Artifact) -> None:
+        self.drop(path)
+        if artifact.get_size_bytes() > self.max_entry_bytes:
+            return
+        self.entries[path] = artifact
+        self.size_bytes += artifact.get_size_bytes()
+        self.evict()
+
+    def evict(self) -> None:
+        while self.size_bytes > self.max_size_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size_bytes -= evicted.get_size_bytes()
+            self.evictions += 1
+
+    async def get(self, path: str) -> Optional[Artifact]:
+        """
+        The artifact at path, or None if there is no file.
+        """
+        artifact = self.entries.get(path)
+        if artifact and self.is_fresh(artifact, path):
+            self.hits += 1
+            ARTIFACT_CACHE_LOOKUPS.labels("hit").inc()
+            self.entries.move_to_end(path)
+            return artifact
+
+        self.misses += 1
+        ARTIFACT_CACHE_LOOKUPS.labels("miss").inc()
+        artifact = await asyncio.to_thread(read_artifact, path)
+        if artifact is None:
+            self.drop(path)
+            return None
+        self.keep(path, artifact)
+        return artifact
+
+    async def get_gzip_content(self, path: str, artifact: Artifact) -> Optional[bytes]:
+        """
+        The gzipped content, or None when it is too small to be worth it.
+        """
+        if artifact.size < ARTIFACT_GZIP_MIN_BYTES:
+            return None
+        if artifact.gzip_content is None:
+            # mtime=0 keeps the bytes, and so the ETag, the same across compressions
+            gzip_content = await asyncio.to_thread(
+                gzip.compress, artifact.content, mtime=0
+            )
+            # another request may have compressed it meanwhile
+            if artifact.gzip_content is None:
+                artifact.gzip_content = gzip_content
+                if self.entries.get(path) is artifact:
+                    self.size_bytes += len(gzip_content)
+                    self.evict()
+        return artifact.gzip_content
+
+    def record_not_modified(self) -> None:
+        self.not_modified += 1
+        ARTIFACT_CACHE_LOOKUPS.labels("not_modified").inc()
+
+    def get_stats(self) -> ArtifactCacheStats:
+        lookups = self.hits + self.misses
+        return ArtifactCacheStats(
+            entries=len(self.entries),
+            size_bytes=self.size_bytes,
+            max_size_bytes=self.max_size_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            not_modified=self.not_modified,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else 0.0,
+        )
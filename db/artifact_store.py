@@ -0,0 +1,142 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import fcntl
+import json
+import logging
+import os
+import socket
+import time
+from typing import AsyncIterator, IO
+
+from utils.const import (
+    ARTIFACT_CLAIM_DIR,
+    ARTIFACT_CLAIM_MAX_POLL_INTERVAL_SECONDS,
+    ARTIFACT_CLAIM_POLL_INTERVAL_SECONDS,
+    ARTIFACT_STALE_TEMP_FILE_SECONDS,
+    PAPER_ARTIFACT_PATHS,
+)
+from utils.deadline import wait_within_deadline
+from utils.metrics import ARTIFACT_CLAIM_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def try_lock(lock_file: IO) -> bool:
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def read_holder(lock_file: IO) -> str:
+    lock_file.seek(0)
+    return lock_file.read().strip() or "unknown holder"
+
+
+class ArtifactStore:
+    """
+    Where the downloaded PDFs, summaries and tables live, and who may produce
+    them. Artifacts are written with write_file_atomic (or, for PDFs, renamed
+    from a .part file), so readers in any process see a complete file or none.
+
+    Producing an artifact is claimed with a flock on a per-paper lock file, so
+    with several uvicorn workers or pipeline processes on one data/ tree a paper
+    is downloaded, summarised or extracted once while the other workers wait and
+    reuse the result. The kernel drops the lock when its holder dies, so the
+    claim of a crashed worker is recovered at once rather than after a lease
+    timeout. Lock files are never removed, unlinking one under a waiting worker
+    would let two workers hold "the" lock.
+    """
+
+    def __init__(self, claim_dir: str = ARTIFACT_CLAIM_DIR):
+        self.claim_dir = claim_dir
+
+    @classmethod
+    def get_path(cls, paper_id: int, artifact: str) -> str:
+        return PAPER_ARTIFACT_PATHS[artifact].format(paper_id=paper_id)
+
+    def get_claim_path(self, paper_id: int, artifact: str) -> str:
+        return os.path.join(self.claim_dir, artifact, f"{paper_id}.lock")
+
+    def open_claim(self, paper_id: int, artifact: str) -> IO:
+        claim_path = self.get_claim_path(paper_id, artifact)
+        os.makedirs(os.path.dirname(claim_path), exist_ok=True)
+        # not "w", which would truncate the holder written by another worker
+        return open(claim_path, "a+")
+
+    def is_claimed(self, paper_id: int, artifact: str) -> bool:
+        """
+        Whether another worker, in this process or another, holds the claim.
+        """
+        with self.open_claim(paper_id, artifact) as lock_file:
+            # closing the file releases the lock taken to probe it
+            return not try_lock(lock_file)
+
+    async def wait_for_lock(self, lock_file: IO, paper_id: int, artifact: str) -> None:
+        interval = ARTIFACT_CLAIM_POLL_INTERVAL_SECONDS
+        logger.info(
+            f"Waiting for the {artifact} of paper {paper_id}, claimed by {read_holder(lock_file)}"
+        )
+        while not try_lock(lock_file):
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, ARTIFACT_CLAIM_MAX_POLL_INTERVAL_SECONDS)
+
+    @asynccontextmanager
+    async def claim(self, paper_id: int, artifact: str) -> AsyncIterator[None]:
+        """
+        Hold the claim on producing the artifact of a paper, waiting (within the
+        current deadline) while another worker holds it. Callers check whether
+        the artifact is done once they have the claim, the previous holder may
+        have produced it.
+        """
+        lock_file = self.open_claim(paper_id, artifact)
+        try:
+            if not try_lock(lock_file):
+                started_at = time.monotonic()
+                await wait_within_deadline(
+                    self.wait_for_lock(lock_file, paper_id, artifact),
+                    f"the {artifact} claim of paper {paper_id}",
+                )
+                ARTIFACT_CLAIM_WAIT_SECONDS.labels(artifact).observe(
+                    time.monotonic() - started_at
+                )
+
+            holder = dict(
+                pid=os.getpid(),
+                host=socket.gethostname(),
+                claimed_at=datetime.now(timezone.utc).isoformat(),
+            )
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(json.dumps(holder))
+            lock_file.flush()
+            yield
+        finally:
+            lock_file.close()
+
+    def remove_stale_temp_files(self) -> int:
+        """
+        Remove the temp files that workers which crashed mid-write left next to
+        the artifacts. Partial PDF downloads are kept, the next claim resumes them.
+        """
+        removed = 0
+        now = time.time()
+        for path_template in PAPER_ARTIFACT_PATHS.values():
+            directory = os.path.dirname(path_template)
+            if not os.path.exists(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    if now - entry.stat().st_mtime < ARTIFACT_STALE_TEMP_FILE_SECONDS:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} stale temp files of interrupted writes")
+        return removed
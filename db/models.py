@@ -1,6 +1,315 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class Paper(BaseModel):
     paper_id: int
     paper_url: str
+
+
+class DownloadStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class PaperDownloadStatus(BaseModel):
+    paper_id: int
+    paper_url: str
+    status: DownloadStatus = DownloadStatus.QUEUED
+    queued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+    @property
+    def wait_seconds(self) -> Optional[float]:
+        if not self.started_at:
+            return None
+        return (self.started_at - self.queued_at).total_seconds()
+
+    @property
+    def run_seconds(self) -> Optional[float]:
+        if not self.started_at or not self.finished_at:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+class DownloadJob(BaseModel):
+    job_id: str
+    created_at: datetime
+    paper_ids: list[int] = []
+
+
+class ClientPoolStats(BaseModel):
+    name: str
+    http2: bool
+    requests: int = 0
+    new_connections: int = 0
+    reuse_ratio: float = 0.0
+    connections: int = 0
+    active_connections: int = 0
+    idle_connections: int = 0
+    waiters: int = 0
+
+
+class LLMCacheStats(BaseModel):
+    entries: int = 0
+    size_bytes: int = 0
+    max_size_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    hit_ratio: float = 0.0
+
+
+class ArtifactCacheStats(BaseModel):
+    entries: int = 0
+    size_bytes: int = 0
+    max_size_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    not_modified: int = 0
+    hit_ratio: float = 0.0
+
+
+class LLMPriority(int, Enum):
+    # lower values are served first
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class LLMLimiterStats(BaseModel):
+    model: str
+    concurrency_limit: int
+    in_flight: int
+    queued: dict[str, int] = dict()
+    requests_per_minute: int
+    tokens_per_minute: int
+    available_requests: float
+    available_tokens: float
+    latency_recent_seconds: Optional[float] = None
+    latency_baseline_seconds: Optional[float] = None
+    requests: int = 0
+    throttled: int = 0
+    errors: int = 0
+
+
+class SingleFlightStats(BaseModel):
+    calls: int = 0
+    executions: int = 0
+    coalesced: int = 0
+    # runs cancelled once every caller had disconnected or timed out
+    cancelled: int = 0
+    in_flight: int = 0
+
+
+class TableCandidate(BaseModel):
+    page_number: int
+    score: float
+    is_candidate: bool
+    table_count: int = 0
+    caption_count: int = 0
+    horizontal_lines: int = 0
+    vertical_lines: int = 0
+    numeric_line_ratio: float = 0.0
+    text_chars: int = 0
+    image_count: int = 0
+    # (x0, y0, x1, y1) of each detected table, used to crop page renders
+    table_bboxes: list[tuple[float, float, float, float]] = []
+
+
+class PageChunk(BaseModel):
+    page_numbers: list[int]
+    text: str
+    token_count: int
+
+    @property
+    def label(self) -> str:
+        if len(self.page_numbers) == 1:
+            return f"Page {self.page_numbers[0]}"
+        return f"Pages {self.page_numbers[0]}-{self.page_numbers[-1]}"
+
+
+class PipelineStageStats(BaseModel):
+    name: str
+    concurrency: int
+    queued: int = 0
+    running: int = 0
+    done: int = 0
+    skipped: int = 0
+    failed: int = 0
+    total_seconds: float = 0.0
+
+    @property
+    def average_seconds(self) -> Optional[float]:
+        if not self.done:
+            return None
+        return self.total_seconds / self.done
+
+
+class BatchWaveStats(BaseModel):
+    name: str
+    requests: int
+    cached: int = 0
+    submitted: int = 0
+    failed: int = 0
+    batch_ids: list[str] = []
+    elapsed_seconds: float = 0.0
+
+
+class BatchRunReport(BaseModel):
+    run_id: str
+    paper_count: int
+    summaries_written: int = 0
+    tables_written: int = 0
+    skipped: int = 0
+    waves: list[BatchWaveStats] = []
+    errors: dict[str, str] = dict()
+
+
+class ArtifactStatus(str, Enum):
+    MISSING = "missing"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class PaperArtifact(BaseModel):
+    status: ArtifactStatus = ArtifactStatus.MISSING
+    size_bytes: Optional[int] = None
+    sha256: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+class PaperRecord(BaseModel):
+    paper_id: int
+    paper_url: str
+    page_count: Optional[int] = None
+    download: PaperArtifact = PaperArtifact()
+    summary: PaperArtifact = PaperArtifact()
+    table: PaperArtifact = PaperArtifact()
+
+
+class PageCheckpoint(BaseModel):
+    label: str
+    # hash of the request the output was produced from, a changed input is redone
+    input_key: str
+    status: ArtifactStatus = ArtifactStatus.MISSING
+    output: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    updated_at: Optional[datetime] = None
+
+
+class PaperCheckpoints(BaseModel):
+    paper_id: int
+    stage: str
+    pages: dict[str, PageCheckpoint] = dict()
+
+
+class PaperAnalysisStage(BaseModel):
+    status: ArtifactStatus
+    # the artifact already existed and was returned as is
+    cached: bool = False
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class PaperIndexReconcileReport(BaseModel):
+    scanned_files: int
+    updated_files: int
+    removed_files: int
+    elapsed_seconds: float
+
+
+class TableStoreCompactionReport(BaseModel):
+    merged_segments: int
+    # tables on disk the store did not have, read from their CSV
+    backfilled_tables: int
+    # CSVs that could not be parsed and were skipped
+    unreadable_tables: int = 0
+    papers: int
+    rows: int
+    size_bytes: int
+    elapsed_seconds: float
+
+
+class TableStoreStats(BaseModel):
+    papers: int = 0
+    rows: int = 0
+    # segments appended since the last compaction
+    segments: int = 0
+    compacted_size_bytes: int = 0
+    last_compaction: Optional[TableStoreCompactionReport] = None
+
+
+class SearchDocumentKind(str, Enum):
+    PAGE = "page"
+    SUMMARY = "summary"
+
+
+class SearchHit(BaseModel):
+    paper_id: int
+    kind: SearchDocumentKind
+    # None for a summary
+    page_number: Optional[int] = None
+    # BM25, None when the hits are not ranked
+    score: Optional[float] = None
+    snippet: str
+
+
+class SearchIndexUpdateReport(BaseModel):
+    indexed_papers: int
+    indexed_summaries: int
+    removed_documents: int
+    failed: int
+    elapsed_seconds: float
+
+
+class SearchIndexStats(BaseModel):
+    documents: int = 0
+    papers: int = 0
+    summaries: int = 0
+    size_bytes: int = 0
+    last_update: Optional[SearchIndexUpdateReport] = None
+
+
+class BenchmarkResult(BaseModel):
+    scenario: str
+    concurrency: int
+    papers: int
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    papers_per_minute: float = 0.0
+    # per paper, failed papers included
+    latency_p50_seconds: float = 0.0
+    latency_p99_seconds: float = 0.0
+    latency_max_seconds: float = 0.0
+    peak_rss_bytes: Optional[int] = None
+    # approximated from the event_loop_lag_seconds histogram buckets
+    loop_lag_p50_seconds: Optional[float] = None
+    loop_lag_p99_seconds: Optional[float] = None
+    llm_requests: int = 0
+    llm_throttled: int = 0
+    llm_prompt_tokens: int = 0
+    llm_completion_tokens: int = 0
+    pubmed_requests: int = 0
+    pubmed_throttled: int = 0
+    errors: dict[str, int] = dict()
+
+
+class BenchmarkReport(BaseModel):
+    git_commit: str
+    git_dirty: bool
+    created_at: datetime
+    python_version: str
+    platform: str
+    cpu_count: int
+    settings: dict
+    results: list[BenchmarkResult] = []
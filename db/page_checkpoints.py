@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from pydantic import ValidationError
+
+from db.models import ArtifactStatus, PageCheckpoint, PaperCheckpoints
+from utils.const import PAGE_CHECKPOINT_DIR
+from utils.util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class PageCheckpointStore:
+    """
+    Per-page outputs of one stage ("summary", "table") of one paper, stored in
+    data/checkpoints/{stage}/{paper_id}.json and rewritten atomically as each page
+    completes or fails. A rerun only calls the model for pages that are not done
+    with the same input, and the combine step can be redone from the stored pages.
+    """
+
+    def __init__(
+        self, paper_id: int, stage: str, checkpoint_dir: str = PAGE_CHECKPOINT_DIR
+    ):
+        self.path = os.path.join(checkpoint_dir, stage, f"{paper_id}.json")
+        self.checkpoints = PaperCheckpoints(paper_id=paper_id, stage=stage)
+
+    def load(self) -> PaperCheckpoints:
+        try:
+            with open(self.path, "r") as file:
+                self.checkpoints = PaperCheckpoints.model_validate_json(file.read())
+        except FileNotFoundError:
+            pass
+        except ValidationError as e:
+            # a checkpoint only saves work, start over rather than fail the paper
+            logger.warning(f"Ignoring unreadable checkpoints {self.path}: {e}")
+        return self.checkpoints
+
+    def save(self) -> None:
+        write_file_atomic(self.path, self.checkpoints.model_dump_json())
+
+    def get_done(self, label: str, input_key: str) -> Optional[PageCheckpoint]:
+        page = self.checkpoints.pages.get(label)
+        if page and page.status == ArtifactStatus.DONE and page.input_key == input_key:
+            return page
+        return None
+
+    def record(
+        self,
+        label: str,
+        input_key: str,
+        status: ArtifactStatus,
+        output: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        page = self.checkpoints.pages.get(label)
+        attempts = page.attempts if page and page.input_key == input_key else 0
+        self.checkpoints.pages[label] = PageCheckpoint(
+            label=label,
+            input_key=input_key,
+            status=status,
+            output=output,
+            error=error,
+            attempts=attempts + 1,
+            updated_at=datetime.now(timezone.utc),
+        )
+        self.save()
+
+    async def run_page(
+        self,
+        label: str,
+        input_key: str,
+        call: Callable[[], Awaitable[Optional[str]]],
+    ) -> Optional[str]:
+        """
+        The stored output of the page, or the output of call() once it is stored.
+        A failure is stored before it is raised.
+        """
+        page = self.get_done(label, input_key)
+        if page:
+            return page.output
+        try:
+            output = await call()
+        except Exception as e:
+            self.record(label, input_key, ArtifactStatus.FAILED, error=str(e))
+            raise
+        self.record(label, input_key, ArtifactStatus.DONE, output=output)
+        return output
+
+    def get_outputs(self, labels: list[str]) -> list[Optional[str]]:
+        return [self.checkpoints.pages[label].output for label in labels]
+
+    def raise_failed(self, labels: list[str]) -> None:
+        """
+        Raise if any of labels is not done, after every page had its attempt.
+        """
+        failed_labels = [
+            label
+            for label in labels
+            if label not in self.checkpoints.pages
+            or self.checkpoints.pages[label].status != ArtifactStatus.DONE
+        ]
+        if failed_labels:
+            page = self.checkpoints.pages.get(failed_labels[0])
+            raise Exception(
+                f"{len(failed_labels)} of {len(labels)} pages failed for the {self.checkpoints.stage} of paper {self.checkpoints.paper_id} ({', '.join(failed_labels)}), rerun to retry them: {page.error if page else 'not attempted'}"
+            )
@@ -0,0 +1,309 @@
+import asyncio
+from datetime import datetime, timezone
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional
+
+import pymupdf
+
+from db.models import (
+    ArtifactStatus,
+    PaperArtifact,
+    PaperIndexReconcileReport,
+    PaperRecord,
+)
+from utils.const import PAPER_ARTIFACT_PATHS, PAPER_INDEX_PATH
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS = tuple(PAPER_ARTIFACT_PATHS)
+ARTIFACT_COLUMNS = ("status", "size", "mtime_ns", "sha256", "updated_at", "error")
+
+
+def get_file_info(path: str, count_pages: bool = False) -> dict:
+    """
+    Size, modification time, sha256 and (for PDFs) page count of an artifact.
+    """
+    stat = os.stat(path)
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            sha256.update(chunk)
+
+    file_info = dict(
+        size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256.hexdigest()
+    )
+    if count_pages:
+        try:
+            with pymupdf.open(path) as pdf_doc:
+                file_info["page_count"] = pdf_doc.page_count
+        except Exception as e:
+            logger.warning(f"Failed to count the pages of {path}: {e}")
+    return file_info
+
+
+class PaperIndex:
+    """
+    SQLite index of every paper and the state of its artifacts (downloaded PDF,
+    summary and primary result table), so listings and "is it done" checks are
+    indexed queries instead of directory scans and os.path.exists probes.
+
+    Every statement is a single-row lookup or upsert, or a keyset-paginated page,
+    cheap enough to run on the event loop. The data/ tree stays the source of
+    truth: reconcile() rebuilds the index from it, hashing only changed files.
+    """
+
+    def __init__(self, db_path: str = PAPER_INDEX_PATH):
+        self.db_path = db_path
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        # WAL lets readers in other processes carry on while a write commits
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        artifact_columns = ", ".join(
+            f"{artifact}_status TEXT NOT NULL DEFAULT '{ArtifactStatus.MISSING.value}', "
+            f"{artifact}_size INTEGER, {artifact}_mtime_ns INTEGER, "
+            f"{artifact}_sha256 TEXT, {artifact}_updated_at TEXT, {artifact}_error TEXT"
+            for artifact in ARTIFACTS
+        )
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS papers (
+                paper_id INTEGER PRIMARY KEY,
+                paper_url TEXT NOT NULL,
+                page_count INTEGER,
+                {artifact_columns}
+            )
+            """)
+        # status filters walk these in paper_id order, which is also the page order
+        for artifact in ARTIFACTS:
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS papers_{artifact}_status "
+                f"ON papers ({artifact}_status, paper_id)"
+            )
+        logger.info(f"Paper index opened at {self.db_path}")
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    @classmethod
+    def to_paper_record(cls, row: sqlite3.Row) -> PaperRecord:
+        artifacts = {
+            artifact: PaperArtifact(
+                status=row[f"{artifact}_status"],
+                size_bytes=row[f"{artifact}_size"],
+                sha256=row[f"{artifact}_sha256"],
+                updated_at=row[f"{artifact}_updated_at"],
+                error=row[f"{artifact}_error"],
+            )
+            for artifact in ARTIFACTS
+        }
+        return PaperRecord(
+            paper_id=row["paper_id"],
+            paper_url=row["paper_url"],
+            page_count=row["page_count"],
+            **artifacts,
+        )
+
+    def get_paper(self, paper_id: int) -> Optional[PaperRecord]:
+        row = self.connection.execute(
+            "SELECT * FROM papers WHERE paper_id = ?", (paper_id,)
+        ).fetchone()
+        return self.to_paper_record(row) if row else None
+
+    def get_status(self, paper_id: int, artifact: str) -> ArtifactStatus:
+        row = self.connection.execute(
+            f"SELECT {artifact}_status FROM papers WHERE paper_id = ?", (paper_id,)
+        ).fetchone()
+        return ArtifactStatus(row[0]) if row else ArtifactStatus.MISSING
+
+    def is_done(self, paper_id: int, artifact: str) -> bool:
+        return self.get_status(paper_id, artifact) == ArtifactStatus.DONE
+
+    def get_done_sha256s(self, artifact: str) -> dict[int, str]:
+        """
+        sha256 of the artifact of every paper that has it, by paper_id.
+        """
+        return dict(
+            self.connection.execute(
+                f"SELECT paper_id, {artifact}_sha256 FROM papers "
+                f"WHERE {artifact}_status = ?",
+                (ArtifactStatus.DONE.value,),
+            ).fetchall()
+        )
+
+    def list_papers(
+        self,
+        statuses: dict[str, ArtifactStatus],
+        after: int = 0,
+        limit: int = 100,
+    ) -> tuple[list[PaperRecord], int]:
+        """
+        One page of papers with paper_id > after matching every artifact status
+        in statuses, and the total number of matching papers.
+        """
+        conditions = [f"{artifact}_status = ?" for artifact in statuses]
+        params = [status.value for status in statuses.values()]
+        where = " AND ".join(conditions) if conditions else "1"
+
+        rows = self.connection.execute(
+            f"SELECT * FROM papers WHERE {where} AND paper_id > ? "
+            f"ORDER BY paper_id LIMIT ?",
+            (*params, after, limit),
+        ).fetchall()
+        (total,) = self.connection.execute(
+            f"SELECT COUNT(*) FROM papers WHERE {where}", params
+        ).fetchone()
+        return [self.to_paper_record(row) for row in rows], total
+
+    def upsert_artifact(
+        self,
+        paper_id: int,
+        artifact: str,
+        status: ArtifactStatus,
+        file_info: Optional[dict] = None,
+        error: Optional[str] = None,
+        paper_url: Optional[str] = None,
+    ) -> None:
+        file_info = file_info or dict()
+        values = dict(
+            status=status.value,
+            size=file_info.get("size"),
+            mtime_ns=file_info.get("mtime_ns"),
+            sha256=file_info.get("sha256"),
+            updated_at=datetime.now(timezone.utc).isoformat(),
+            error=error,
+        )
+        columns = [f"{artifact}_{column}" for column in ARTIFACT_COLUMNS]
+        assignments = [f"{column} = excluded.{column}" for column in columns]
+        if paper_url:
+            assignments.append("paper_url = excluded.paper_url")
+        if "page_count" in file_info:
+            assignments.append("page_count = excluded.page_count")
+
+        self.connection.execute(
+            f"""
+            INSERT INTO papers (paper_id, paper_url, page_count, {", ".join(columns)})
+            VALUES (?, ?, ?, {", ".join("?" for _ in columns)})
+            ON CONFLICT (paper_id) DO UPDATE SET {", ".join(assignments)}
+            """,
+            (
+                paper_id,
+                paper_url or f"https://pubmed.ncbi.nlm.nih.gov/{paper_id}",
+                file_info.get("page_count"),
+                *(values[column] for column in ARTIFACT_COLUMNS),
+            ),
+        )
+
+    async def record_done(
+        self, paper_id: int, artifact: str, paper_url: Optional[str] = None
+    ) -> None:
+        path = PAPER_ARTIFACT_PATHS[artifact].format(paper_id=paper_id)
+        file_info = await asyncio.to_thread(
+            get_file_info, path, count_pages=artifact == "download"
+        )
+        self.upsert_artifact(
+            paper_id, artifact, ArtifactStatus.DONE, file_info, paper_url=paper_url
+        )
+
+    def record_failed(
+        self,
+        paper_id: int,
+        artifact: str,
+        error: str,
+        paper_url: Optional[str] = None,
+    ) -> None:
+        self.upsert_artifact(
+            paper_id, artifact, ArtifactStatus.FAILED, error=error, paper_url=paper_url
+        )
+
+    def record_missing(self, paper_id: int, artifact: str) -> None:
+        self.upsert_artifact(paper_id, artifact, ArtifactStatus.MISSING)
+
+    def scan_artifacts(
+        self, known_files: dict[tuple[int, str], tuple[int, int]]
+    ) -> dict[tuple[int, str], Optional[dict]]:
+        """
+        Walk the artifact directories and return the file info of every artifact
+        on disk, or None when its size and mtime match the index so it is not
+        hashed again.
+        """
+        scanned_files: dict[tuple[int, str], Optional[dict]] = dict()
+        for artifact, path_template in PAPER_ARTIFACT_PATHS.items():
+            directory, filename_template = os.path.split(path_template)
+            extension = os.path.splitext(filename_template)[1]
+            if not os.path.exists(directory):
+                continue
+
+            for entry in os.scandir(directory):
+                paper_id, entry_extension = os.path.splitext(entry.name)
+                if entry_extension != extension or not paper_id.isdigit():
+                    continue
+                key = (int(paper_id), artifact)
+                stat = entry.stat()
+                if known_files.get(key) == (stat.st_size, stat.st_mtime_ns):
+                    scanned_files[key] = None
+                else:
+                    scanned_files[key] = get_file_info(
+                        entry.path, count_pages=artifact == "download"
+                    )
+        return scanned_files
+
+    async def reconcile(self) -> PaperIndexReconcileReport:
+        """
+        Rebuild the index from the data/ tree: new or changed files are hashed and
+        marked done, done entries whose file disappeared are marked missing.
+        Failures of artifacts that are still missing are kept.
+        """
+        started_at = time.monotonic()
+        known_files: dict[tuple[int, str], tuple[int, int]] = dict()
+        done_artifacts: set[tuple[int, str]] = set()
+        for row in self.connection.execute("SELECT * FROM papers"):
+            for artifact in ARTIFACTS:
+                if row[f"{artifact}_status"] != ArtifactStatus.DONE.value:
+                    continue
+                done_artifacts.add((row["paper_id"], artifact))
+                known_files[(row["paper_id"], artifact)] = (
+                    row[f"{artifact}_size"],
+                    row[f"{artifact}_mtime_ns"],
+                )
+
+        # stat and hash off the event loop, then apply everything in one transaction
+        scanned_files = await asyncio.to_thread(self.scan_artifacts, known_files)
+        updated = 0
+        removed = 0
+        self.connection.execute("BEGIN")
+        try:
+            for (paper_id, artifact), file_info in scanned_files.items():
+                if file_info is not None:
+                    self.upsert_artifact(
+                        paper_id, artifact, ArtifactStatus.DONE, file_info
+                    )
+                    updated += 1
+            for paper_id, artifact in done_artifacts - set(scanned_files):
+                self.record_missing(paper_id, artifact)
+                removed += 1
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        report = PaperIndexReconcileReport(
+            scanned_files=len(scanned_files),
+            updated_files=updated,
+            removed_files=removed,
+            elapsed_seconds=round(time.monotonic() - started_at, 3),
+        )
+        logger.info(
+            f"Paper index reconciled: {report.scanned_files} files scanned, {report.updated_files} updated, {report.removed_files} removed in {report.elapsed_seconds}s"
+        )
+        return report
@@ -0,0 +1,399 @@
+import asyncio
+from datetime import datetime, timezone
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from db.models import (
+    SearchDocumentKind,
+    SearchHit,
+    SearchIndexStats,
+    SearchIndexUpdateReport,
+)
+from db.paper_index import PaperIndex
+from pdf_processor.pdf_processor import PdfProcessor
+from utils.const import (
+    PAPER_ARTIFACT_PATHS,
+    SEARCH_INDEX_PATH,
+    SEARCH_INDEX_UPDATE_INTERVAL_SECONDS,
+    SEARCH_MAX_RANKED_DOCUMENTS,
+    SEARCH_PAGE_SIZE,
+    SEARCH_ROWID_STRIDE,
+    SEARCH_SNIPPET_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# the paper index artifact each kind of document is made from
+SOURCE_ARTIFACTS = {
+    SearchDocumentKind.PAGE: "download",
+    SearchDocumentKind.SUMMARY: "summary",
+}
+
+
+def get_search_terms(query: str) -> list[str]:
+    """
+    The words of query, "quoted words" as one phrase. FTS5 operators and
+    punctuation in query are taken as plain words.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\w+)', query):
+        words = re.findall(r"\w+", phrase or word)
+        if words:
+            terms.append(" ".join(words))
+    return terms
+
+
+def to_match_query(terms: list[str]) -> str:
+    # every term must match
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def read_summary(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+class SearchIndex:
+    """
+    Local BM25 full-text index (SQLite FTS5) over the text of every page of the
+    downloaded papers and over their summaries, in data/search_index.sqlite3.
+
+    FTS5 keeps the postings as delta-encoded doclists and ranks with BM25, so a
+    query reads the postings of its terms only. A document's rowid encodes its
+    paper and page, so a paper's documents are replaced with a rowid range.
+    update() brings the index in line with the paper index, re-indexing only
+    papers whose PDF or summary sha256 changed, so it also picks up what other
+    processes (the batch pipeline) produced.
+
+    Statements run in worker threads, serialised on one connection.
+    """
+
+    def __init__(self, db_path: str = SEARCH_INDEX_PATH):
+        self.db_path = db_path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+        # (paper_id, kind) -> sha256 that failed to index, not retried until it changes
+        self.failed: dict[tuple[int, SearchDocumentKind], str] = dict()
+        self.last_update: Optional[SearchIndexUpdateReport] = None
+
+    def open(self) -> None:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            self.db_path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents
+            USING fts5(text, tokenize='porter unicode61 remove_diacritics 2')
+            """)
+        # what each paper's documents were indexed from
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                paper_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                indexed_at TEXT NOT NULL,
+                PRIMARY KEY (paper_id, kind)
+            )
+            """)
+        logger.info(f"Search index opened at {self.db_path}")
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    @classmethod
+    def get_rowid_range(
+        cls, paper_id: int, kind: SearchDocumentKind
+    ) -> tuple[int, int]:
+        first_rowid = paper_id * SEARCH_ROWID_STRIDE
+        if kind == SearchDocumentKind.SUMMARY:
+            return first_rowid, first_rowid
+        return first_rowid + 1, first_rowid + SEARCH_ROWID_STRIDE - 1
+
+    def get_indexed_sha256s(self) -> dict[tuple[int, SearchDocumentKind], str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT paper_id, kind, sha256 FROM sources"
+            ).fetchall()
+        return {
+            (paper_id, SearchDocumentKind(kind)): sha256
+            for paper_id, kind, sha256 in rows
+        }
+
+    def replace_documents(
+        self,
+        paper_id: int,
+        kind: SearchDocumentKind,
+        sha256: Optional[str],
+        texts: list[str],
+    ) -> None:
+        """
+        Replace the documents of one kind of a paper with texts, the pages in
+        order or the summary alone. Without a sha256 they are only removed.
+        """
+        first_rowid, last_rowid = self.get_rowid_range(paper_id, kind)
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.execute(
+                    "DELETE FROM documents WHERE rowid BETWEEN ? AND ?",
+                    (first_rowid, last_rowid),
+                )
+                self.connection.execute(
+                    "DELETE FROM sources WHERE paper_id = ? AND kind = ?",
+                    (paper_id, kind.value),
+                )
+                if sha256 is not None:
+                    self.connection.executemany(
+                        "INSERT INTO documents (rowid, text) VALUES (?, ?)",
+                        [
+                            (first_rowid + index, text)
+                            for index, text in enumerate(
+                                texts[: last_rowid - first_rowid + 1]
+                            )
+                            if text.strip()
+                        ],
+                    )
+                    self.connection.execute(
+                        "INSERT INTO sources (paper_id, kind, sha256, indexed_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (
+                            paper_id,
+                            kind.value,
+                            sha256,
+                            datetime.now(timezone.utc).isoformat(),
+                        ),
+                    )
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    async def index_source(
+        self,
+        paper_id: int,
+        kind: SearchDocumentKind,
+        sha256: str,
+        pdf_processor: PdfProcessor,
+    ) -> bool:
+        path = PAPER_ARTIFACT_PATHS[SOURCE_ARTIFACTS[kind]].format(paper_id=paper_id)
+        try:
+            if kind == SearchDocumentKind.PAGE:
+                # stored in the page store, so the summariser reuses them
+                texts = await pdf_processor.extract_page_texts(path)
+            else:
+                texts = [await asyncio.to_thread(read_summary, path)]
+            await asyncio.to_thread(
+                self.replace_documents, paper_id, kind, sha256, texts
+            )
+        except Exception as e:
+            logger.warning(
+                f"Failed to index the {kind.value}s of paper {paper_id}: {e}"
+            )
+            self.failed[(paper_id, kind)] = sha256
+            return False
+        self.failed.pop((paper_id, kind), None)
+        return True
+
+    async def update(
+        self, paper_index: PaperIndex, pdf_processor: PdfProcessor
+    ) -> SearchIndexUpdateReport:
+        """
+        Index the pages and summaries the paper index has and this index lacks
+        or has from an older file, and remove those it no longer has.
+        """
+        started_at = time.monotonic()
+        sources = {
+            (paper_id, kind): sha256
+            for kind, artifact in SOURCE_ARTIFACTS.items()
+            for paper_id, sha256 in paper_index.get_done_sha256s(artifact).items()
+        }
+        indexed_sha256s = await asyncio.to_thread(self.get_indexed_sha256s)
+
+        indexed = {kind: 0 for kind in SearchDocumentKind}
+        failed = 0
+        # one paper at a time, so indexing never crowds out the requests
+        for (paper_id, kind), sha256 in sources.items():
+            if sha256 in (
+                indexed_sha256s.get((paper_id, kind)),
+                self.failed.get((paper_id, kind)),
+            ):
+                continue
+            if await self.index_source(paper_id, kind, sha256, pdf_processor):
+                indexed[kind] += 1
+            else:
+                failed += 1
+
+        removed_sources = set(indexed_sha256s) - set(sources)
+        for paper_id, kind in removed_sources:
+            await asyncio.to_thread(self.replace_documents, paper_id, kind, None, [])
+
+        report = SearchIndexUpdateReport(
+            indexed_papers=indexed[SearchDocumentKind.PAGE],
+            indexed_summaries=indexed[SearchDocumentKind.SUMMARY],
+            removed_documents=len(removed_sources),
+            failed=failed,
+            elapsed_seconds=round(time.monotonic() - started_at, 3),
+        )
+        self.last_update = report
+        if report.indexed_papers or report.indexed_summaries or removed_sources:
+            logger.info(
+                f"Search index updated: {report.indexed_papers} papers and {report.indexed_summaries} summaries indexed, {report.removed_documents} removed in {report.elapsed_seconds}s"
+            )
+        return report
+
+    async def update_periodically(
+        self,
+        paper_index: PaperIndex,
+        pdf_processor: PdfProcessor,
+        interval: float = SEARCH_INDEX_UPDATE_INTERVAL_SECONDS,
+    ) -> None:
+        while True:
+            try:
+                await self.update(paper_index, pdf_processor)
+            except Exception as e:
+                logger.error(f"Failed to update the search index: {e}")
+            await asyncio.sleep(interval)
+
+    def count_matches(self, term: str, max_count: int) -> int:
+        # stops reading the postings at max_count
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM "
+            "(SELECT 1 FROM documents WHERE documents MATCH ? LIMIT ?)",
+            (to_match_query([term]), max_count),
+        ).fetchone()
+        return count
+
+    def find_documents(
+        self,
+        match_query: str,
+        ranked: bool,
+        conditions: list[str],
+        params: list,
+        limit: int,
+        offset: int = 0,
+    ) -> list[tuple[int, Optional[float], str]]:
+        return self.connection.execute(
+            f"""
+            SELECT rowid, {"rank" if ranked else "NULL"},
+                snippet(documents, 0, '<mark>', '</mark>', '…', {SEARCH_SNIPPET_TOKENS})
+            FROM documents WHERE {" AND ".join(["documents MATCH ?", *conditions])}
+            ORDER BY {"rank" if ranked else "rowid DESC"} LIMIT ? OFFSET ?
+            """,
+            (match_query, *params, limit, offset),
+        ).fetchall()
+
+    def search(
+        self,
+        query: str,
+        kind: Optional[SearchDocumentKind] = None,
+        paper_ids: Optional[list[int]] = None,
+        offset: int = 0,
+        limit: int = SEARCH_PAGE_SIZE,
+        max_ranked_documents: int = SEARCH_MAX_RANKED_DOCUMENTS,
+    ) -> tuple[list[SearchHit], list[str], bool]:
+        """
+        The pages and summaries matching every word of query, best BM25 score
+        first, with a snippet around the matches.
+
+        BM25 reads every posting of a term for its IDF, so a query costs as
+        much as its most common term. Terms matching max_ranked_documents or
+        more documents are left out when rarer ones remain, their IDF is low
+        anyway. When every term is that common, the most recent matches
+        (highest paper_id) are returned unranked. Returns the hits, the terms
+        left out and whether the hits are ranked.
+        """
+        terms = get_search_terms(query)
+        conditions = []
+        if kind == SearchDocumentKind.SUMMARY:
+            conditions.append(f"rowid % {SEARCH_ROWID_STRIDE} = 0")
+        elif kind == SearchDocumentKind.PAGE:
+            conditions.append(f"rowid % {SEARCH_ROWID_STRIDE} != 0")
+
+        with self.lock:
+            common_terms = [
+                term
+                for term in terms
+                if self.count_matches(term, max_ranked_documents)
+                >= max_ranked_documents
+            ]
+            ranked = len(common_terms) < len(terms)
+            if ranked:
+                terms = [term for term in terms if term not in common_terms]
+            else:
+                common_terms = []
+            match_query = to_match_query(terms)
+
+            if not paper_ids:
+                rows = self.find_documents(
+                    match_query, ranked, conditions, [], limit, offset
+                )
+            else:
+                # a rowid range per paper only reads the postings of that paper,
+                # and BM25 uses corpus-wide statistics so the scores compare
+                rows = sorted(
+                    (
+                        row
+                        for paper_id in set(paper_ids)
+                        for row in self.find_documents(
+                            match_query,
+                            ranked,
+                            [*conditions, "rowid BETWEEN ? AND ?"],
+                            [
+                                paper_id * SEARCH_ROWID_STRIDE,
+                                (paper_id + 1) * SEARCH_ROWID_STRIDE - 1,
+                            ],
+                            offset + limit,
+                        )
+                    ),
+                    key=lambda row: row[1] if ranked else -row[0],
+                )[offset : offset + limit]
+
+        search_hits = []
+        for rowid, rank, snippet in rows:
+            paper_id, page_number = divmod(rowid, SEARCH_ROWID_STRIDE)
+            search_hits.append(
+                SearchHit(
+                    paper_id=paper_id,
+                    kind=(
+                        SearchDocumentKind.PAGE
+                        if page_number
+                        else SearchDocumentKind.SUMMARY
+                    ),
+                    page_number=page_number or None,
+                    # bm25() is lower for better matches
+                    score=round(-rank, 4) if ranked else None,
+                    snippet=snippet,
+                )
+            )
+        return search_hits, common_terms, ranked
+
+    def get_stats(self) -> SearchIndexStats:
+        with self.lock:
+            (documents,) = self.connection.execute(
+                "SELECT COUNT(*) FROM documents"
+            ).fetchone()
+            papers, summaries = self.connection.execute(f"""
+                SELECT COUNT(DISTINCT paper_id),
+                    COALESCE(SUM(kind = '{SearchDocumentKind.SUMMARY.value}'), 0)
+                FROM sources
+                """).fetchone()
+            page_count, page_size = (
+                self.connection.execute("PRAGMA page_count").fetchone()[0],
+                self.connection.execute("PRAGMA page_size").fetchone()[0],
+            )
+        return SearchIndexStats(
+            documents=documents,
+            papers=papers,
+            summaries=summaries,
+            size_bytes=page_count * page_size,
+            last_update=self.last_update,
+        )
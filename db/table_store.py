@@ -0,0 +1,433 @@
+import argparse
+import asyncio
+import csv
+from datetime import datetime, timezone
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from db.models import TableStoreCompactionReport, TableStoreStats
+from db.paper_index import PaperIndex
+from setup_logger import setup_logger
+from utils.const import (
+    PAPER_ARTIFACT_PATHS,
+    TABLE_QUERY_PAGE_SIZE,
+    TABLE_STORE_COMPACT_INTERVAL_SECONDS,
+    TABLE_STORE_COMPACT_MIN_SEGMENTS,
+    TABLE_STORE_DIR,
+    TABLE_STORE_VERSION,
+)
+from utils.util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# one row per cell of a primary result table
+TABLE_SCHEMA = pa.schema(
+    [
+        ("paper_id", pa.int64()),
+        # sha256 of the table's CSV, as in the paper index
+        ("table_sha256", pa.string()),
+        ("extracted_at", pa.timestamp("us", tz="UTC")),
+        ("row_index", pa.int32()),
+        ("column_index", pa.int32()),
+        # first cell of the row, usually the outcome or group it reports
+        ("row_label", pa.string()),
+        # header lowercased with whitespace collapsed, header as extracted
+        ("column_name", pa.string()),
+        ("header", pa.string()),
+        ("value", pa.string()),
+        # leading number of the cell, null when it does not start with one
+        ("numeric_value", pa.float64()),
+    ]
+)
+TABLE_FIELDS = tuple(TABLE_SCHEMA.names)
+
+# cells like "12.5%", "1,204 (45%)", "0.82 (0.71-0.95)", "<0.001" or "−3.1"
+NUMBER_PATTERN = re.compile(
+    r"\s*[<>≤≥~=]*\s*([-+]?(?:\d{1,3}(?:,\d{3})+|\d+)?(?:\.\d+)?(?:[eE][-+]?\d+)?)"
+)
+
+
+def normalise_column_name(header: str) -> str:
+    return " ".join(header.lower().split())
+
+
+def parse_numeric_value(value: str) -> Optional[float]:
+    match = NUMBER_PATTERN.match(value.replace("−", "-"))
+    if not match or not any(char.isdigit() for char in match.group(1)):
+        return None
+    try:
+        return float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def to_cell_table(
+    paper_id: int,
+    columns: list,
+    rows: list[list],
+    table_sha256: str,
+    extracted_at: datetime,
+) -> pa.Table:
+    """
+    The cells of one extracted table, in TABLE_SCHEMA.
+    """
+    headers = ["" if column is None else str(column) for column in columns]
+    cells: dict[str, list] = {field: [] for field in TABLE_FIELDS}
+    for row_index, row in enumerate(rows):
+        values = ["" if value is None else str(value) for value in row]
+        for column_index in range(max(len(headers), len(values))):
+            header = headers[column_index] if column_index < len(headers) else ""
+            value = values[column_index] if column_index < len(values) else ""
+            cells["row_index"].append(row_index)
+            cells["column_index"].append(column_index)
+            cells["row_label"].append(values[0] if values else "")
+            cells["column_name"].append(normalise_column_name(header))
+            cells["header"].append(header)
+            cells["value"].append(value)
+            cells["numeric_value"].append(parse_numeric_value(value))
+
+    cell_count = len(cells["value"])
+    cells["paper_id"] = [paper_id] * cell_count
+    cells["table_sha256"] = [table_sha256] * cell_count
+    cells["extracted_at"] = [extracted_at] * cell_count
+    return pa.Table.from_pydict(cells, schema=TABLE_SCHEMA)
+
+
+def merge_tables(table: pa.Table, paper_tables: list[pa.Table]) -> pa.Table:
+    """
+    table with paper_tables (one paper each) added, each replacing the older
+    table of its paper. An older one arriving late is dropped instead.
+    """
+    latest: dict[int, pa.Table] = dict()
+    for paper_table in paper_tables:
+        if paper_table.num_rows == 0:
+            continue
+        paper_id = paper_table["paper_id"][0].as_py()
+        if (
+            paper_id not in latest
+            or latest[paper_id]["extracted_at"][0].as_py()
+            <= paper_table["extracted_at"][0].as_py()
+        ):
+            latest[paper_id] = paper_table
+    if not latest:
+        return table
+
+    is_replaced = pc.is_in(table["paper_id"], value_set=pa.array(list(latest)))
+    replaced = table.filter(is_replaced)
+    if replaced.num_rows:
+        existing = replaced.group_by("paper_id").aggregate([("extracted_at", "max")])
+        for paper_id, extracted_at in zip(
+            existing["paper_id"].to_pylist(),
+            existing["extracted_at_max"].to_pylist(),
+        ):
+            if extracted_at > latest[paper_id]["extracted_at"][0].as_py():
+                del latest[paper_id]
+        is_replaced = pc.is_in(table["paper_id"], value_set=pa.array(list(latest)))
+    return pa.concat_tables(
+        [table.filter(pc.invert(is_replaced)), *latest.values()]
+    ).combine_chunks()
+
+
+def read_table_csv(paper_id: int, path: str) -> Optional[pa.Table]:
+    try:
+        with open(path, "rb") as file:
+            content = file.read()
+            extracted_at = datetime.fromtimestamp(
+                os.fstat(file.fileno()).st_mtime, timezone.utc
+            )
+    except FileNotFoundError:
+        return None
+    columns, *rows = csv.reader(io.StringIO(content.decode("utf-8"), newline=""))
+    return to_cell_table(
+        paper_id, columns, rows, hashlib.sha256(content).hexdigest(), extracted_at
+    )
+
+
+class TableStore:
+    """
+    Every extracted primary result table in one long-format columnar dataset
+    under data/table_store/v{version}/, so questions across papers filter a few
+    columns in memory instead of parsing every CSV in data/extracted_tables/:
+
+    - segments/: one small Parquet file per table, appended when it is extracted
+    - tables.parquet: the segments merged by compact(), the latest table of
+      each paper only
+
+    Readers load tables.parquet once and then only the segments written since,
+    by this or any other process. Compactions take a file lock, so two
+    processes never merge the same segments.
+    """
+
+    def __init__(self, store_dir: str = TABLE_STORE_DIR):
+        self.store_dir = os.path.join(store_dir, f"v{TABLE_STORE_VERSION}")
+        self.segments_dir = os.path.join(self.store_dir, "segments")
+        self.compacted_path = os.path.join(self.store_dir, "tables.parquet")
+        self.lock = threading.Lock()
+        self.table = TABLE_SCHEMA.empty_table()
+        # (size, mtime_ns) of the loaded tables.parquet and the segments read since
+        self.compacted_key: Optional[tuple[int, int]] = None
+        self.loaded_segments: set[str] = set()
+        self.last_compaction: Optional[TableStoreCompactionReport] = None
+
+    def append(
+        self, paper_id: int, columns: list, rows: list[list], table_sha256: str
+    ) -> None:
+        cell_table = to_cell_table(
+            paper_id, columns, rows, table_sha256, datetime.now(timezone.utc)
+        )
+        sink = pa.BufferOutputStream()
+        pq.write_table(cell_table, sink)
+        # named by time so segments sort in the order they were written
+        write_file_atomic(
+            os.path.join(
+                self.segments_dir,
+                f"{time.time_ns()}-{paper_id}-{os.getpid()}.parquet",
+            ),
+            sink.getvalue().to_pybytes(),
+        )
+
+    def list_segments(self) -> list[str]:
+        if not os.path.exists(self.segments_dir):
+            return []
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.segments_dir)
+            if entry.name.endswith(".parquet")
+        )
+
+    def get_compacted_key(self) -> Optional[tuple[int, int]]:
+        try:
+            compacted_stat = os.stat(self.compacted_path)
+        except FileNotFoundError:
+            return None
+        return compacted_stat.st_size, compacted_stat.st_mtime_ns
+
+    def read_compacted(self) -> pa.Table:
+        try:
+            return pq.read_table(self.compacted_path, schema=TABLE_SCHEMA)
+        except FileNotFoundError:
+            return TABLE_SCHEMA.empty_table()
+
+    def read_segment(self, name: str) -> pa.Table:
+        return pq.read_table(os.path.join(self.segments_dir, name), schema=TABLE_SCHEMA)
+
+    def refresh(self) -> pa.Table:
+        """
+        The dataset with whatever was appended or compacted since the last call.
+        """
+        with self.lock:
+            for _ in range(2):
+                compacted_key = self.get_compacted_key()
+                if compacted_key != self.compacted_key:
+                    table, loaded_segments = self.read_compacted(), set()
+                else:
+                    table, loaded_segments = self.table, self.loaded_segments
+                new_segments = [
+                    name for name in self.list_segments() if name not in loaded_segments
+                ]
+                try:
+                    paper_tables = [self.read_segment(name) for name in new_segments]
+                except FileNotFoundError:
+                    # a compaction merged it meanwhile, start over from its output
+                    self.compacted_key = None
+                    continue
+                self.table = merge_tables(table, paper_tables)
+                self.compacted_key = compacted_key
+                self.loaded_segments = loaded_segments | set(new_segments)
+                break
+            return self.table
+
+    def compact_segments(
+        self, table_sha256s: dict[int, str]
+    ) -> TableStoreCompactionReport:
+        started_at = time.monotonic()
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(os.path.join(self.store_dir, "compact.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            segments = self.list_segments()
+            table = merge_tables(
+                self.read_compacted(),
+                [self.read_segment(name) for name in segments],
+            )
+
+            # tables written before the store existed, or whose append failed
+            stored = set(
+                zip(
+                    table["paper_id"].to_pylist(),
+                    table["table_sha256"].to_pylist(),
+                )
+            )
+            backfilled_tables = []
+            unreadable_tables = 0
+            for paper_id, table_sha256 in table_sha256s.items():
+                if (paper_id, table_sha256) in stored:
+                    continue
+                try:
+                    paper_table = read_table_csv(
+                        paper_id,
+                        PAPER_ARTIFACT_PATHS["table"].format(paper_id=paper_id),
+                    )
+                except ValueError as e:
+                    # empty or not UTF-8, one bad CSV must not stop the compaction
+                    logger.warning(f"Skipped the table of paper {paper_id}: {e}")
+                    unreadable_tables += 1
+                    continue
+                if paper_table is not None:
+                    backfilled_tables.append(paper_table)
+            table = merge_tables(table, backfilled_tables).sort_by(
+                [
+                    ("paper_id", "ascending"),
+                    ("row_index", "ascending"),
+                    ("column_index", "ascending"),
+                ]
+            )
+
+            temp_path = f"{self.compacted_path}.{os.getpid()}.tmp"
+            pq.write_table(table, temp_path, compression="zstd")
+            os.replace(temp_path, self.compacted_path)
+            for name in segments:
+                os.remove(os.path.join(self.segments_dir, name))
+
+            with self.lock:
+                self.table = table
+                self.compacted_key = self.get_compacted_key()
+                self.loaded_segments = set()
+
+        report = TableStoreCompactionReport(
+            merged_segments=len(segments),
+            backfilled_tables=len(backfilled_tables),
+            unreadable_tables=unreadable_tables,
+            papers=len(pc.unique(table["paper_id"])),
+            rows=table.num_rows,
+            size_bytes=os.path.getsize(self.compacted_path),
+            elapsed_seconds=round(time.monotonic() - started_at, 3),
+        )
+        self.last_compaction = report
+        logger.info(
+            f"Table store compacted: {report.merged_segments} segments merged, {report.backfilled_tables} tables backfilled ({report.unreadable_tables} unreadable), {report.papers} papers and {report.rows} rows in {report.elapsed_seconds}s"
+        )
+        return report
+
+    async def compact(
+        self, paper_index: Optional[PaperIndex] = None
+    ) -> TableStoreCompactionReport:
+        """
+        Merge the segments into tables.parquet off the event loop. With a paper
+        index, tables it has that the store lacks are read from their CSV.
+        """
+        table_sha256s = paper_index.get_done_sha256s("table") if paper_index else {}
+        return await asyncio.to_thread(self.compact_segments, table_sha256s)
+
+    async def compact_periodically(
+        self,
+        paper_index: PaperIndex,
+        interval: float = TABLE_STORE_COMPACT_INTERVAL_SECONDS,
+        min_segments: int = TABLE_STORE_COMPACT_MIN_SEGMENTS,
+    ) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if len(await asyncio.to_thread(self.list_segments)) < min_segments:
+                continue
+            try:
+                await self.compact(paper_index)
+            except Exception as e:
+                logger.error(f"Failed to compact the table store: {e}")
+
+    def query(
+        self,
+        paper_ids: Optional[list[int]] = None,
+        column: Optional[str] = None,
+        row_label: Optional[str] = None,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+        numeric_only: bool = False,
+        fields: tuple[str, ...] = TABLE_FIELDS,
+        offset: int = 0,
+        limit: int = TABLE_QUERY_PAGE_SIZE,
+    ) -> tuple[list[dict[str, Any]], int, int]:
+        """
+        One page of the cells matching every filter with only fields kept, the
+        number of matching cells and the number of papers they come from.
+        column and row_label match case-insensitive substrings.
+        """
+        table = self.refresh()
+        conditions = []
+        if paper_ids:
+            conditions.append(
+                pc.is_in(table["paper_id"], value_set=pa.array(paper_ids, pa.int64()))
+            )
+        if column:
+            conditions.append(
+                pc.match_substring(table["column_name"], normalise_column_name(column))
+            )
+        if row_label:
+            conditions.append(
+                pc.match_substring(table["row_label"], row_label, ignore_case=True)
+            )
+        if min_value is not None:
+            conditions.append(pc.greater_equal(table["numeric_value"], min_value))
+        if max_value is not None:
+            conditions.append(pc.less_equal(table["numeric_value"], max_value))
+        if numeric_only:
+            conditions.append(pc.is_valid(table["numeric_value"]))
+
+        matched = table
+        if conditions:
+            mask = conditions[0]
+            for condition in conditions[1:]:
+                mask = pc.and_kleene(mask, condition)
+            # cells without a numeric value compare as null and are dropped
+            matched = table.filter(mask)
+
+        rows = matched.slice(offset, limit).select(list(fields)).to_pylist()
+        return rows, matched.num_rows, len(pc.unique(matched["paper_id"]))
+
+    def get_stats(self) -> TableStoreStats:
+        table = self.refresh()
+        compacted_key = self.get_compacted_key()
+        return TableStoreStats(
+            papers=len(pc.unique(table["paper_id"])),
+            rows=table.num_rows,
+            segments=len(self.list_segments()),
+            compacted_size_bytes=compacted_key[0] if compacted_key else 0,
+            last_compaction=self.last_compaction,
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    setup_logger()
+    logger.setLevel(logging.INFO)
+
+    paper_index = PaperIndex()
+    paper_index.open()
+    try:
+        if args.reconcile:
+            await paper_index.reconcile()
+        report = await TableStore().compact(paper_index)
+        print(report.model_dump_json(indent=2))
+    finally:
+        paper_index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Merge the appended table segments into the columnar table store, backfilling tables it does not have yet."
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="Reconcile the paper index with the data/ tree first",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from openai import AsyncOpenAI
+from openai.types import Batch
+from openai.types.chat import ChatCompletion
+
+from db.models import BatchWaveStats
+from llm_client.llm_cache import LLMCache
+from utils.const import (
+    LLM_BATCH_COMPLETION_WINDOW,
+    LLM_BATCH_DIR,
+    LLM_BATCH_MAX_BYTES,
+    LLM_BATCH_MAX_REQUESTS,
+    LLM_BATCH_PRICE_DISCOUNT,
+    LLM_BATCH_POLL_INTERVAL_SECONDS,
+    LLM_BATCH_UPLOAD_TIMEOUT_SECONDS,
+)
+from utils.metrics import LLM_CACHE_LOOKUPS, LLM_ERRORS, observe_llm_usage
+from utils.util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchClient:
+    """
+    Runs chat-completion requests through the OpenAI Batch API instead of one call
+    per request: they are written to JSONL files, uploaded, submitted as batches and
+    polled until the batches finish.
+
+    The custom_id of every request is its LLMCache key. Requests answered before,
+    by a batch or a synchronous call, are served from the cache and never
+    resubmitted, and every batch result is cached for the synchronous endpoints.
+    """
+
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        llm_cache: LLMCache,
+        batch_dir: str = LLM_BATCH_DIR,
+        poll_interval: float = LLM_BATCH_POLL_INTERVAL_SECONDS,
+        max_requests: int = LLM_BATCH_MAX_REQUESTS,
+        max_bytes: int = LLM_BATCH_MAX_BYTES,
+    ):
+        self.openai_client = openai_client
+        self.llm_cache = llm_cache
+        self.batch_dir = batch_dir
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.waves: list[BatchWaveStats] = list()
+
+    def split_batch_files(self, request_lines: list[str]) -> list[list[str]]:
+        batch_files: list[list[str]] = [[]]
+        batch_file_bytes = 0
+        for request_line in request_lines:
+            line_bytes = len(request_line.encode("utf-8")) + 1
+            if batch_files[-1] and (
+                len(batch_files[-1]) >= self.max_requests
+                or batch_file_bytes + line_bytes > self.max_bytes
+            ):
+                batch_files.append([])
+                batch_file_bytes = 0
+            batch_files[-1].append(request_line)
+            batch_file_bytes += line_bytes
+        return batch_files
+
+    async def submit(self, name: str, request_lines: list[str]) -> Batch:
+        batch_path = os.path.join(self.batch_dir, f"{name}.jsonl")
+        batch_content = "\n".join(request_lines) + "\n"
+        write_file_atomic(batch_path, batch_content)
+
+        batch_file = await self.openai_client.files.create(
+            file=(os.path.basename(batch_path), batch_content.encode("utf-8")),
+            purpose="batch",
+            timeout=LLM_BATCH_UPLOAD_TIMEOUT_SECONDS,
+        )
+        batch = await self.openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=LLM_BATCH_COMPLETION_WINDOW,
+            metadata={"name": name},
+        )
+        logger.info(
+            f"Submitted batch {batch.id} with {len(request_lines)} requests from {batch_path}"
+        )
+        return batch
+
+    async def wait(self, batch: Batch) -> Batch:
+        while batch.status not in BATCH_TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.openai_client.batches.retrieve(batch.id)
+            if batch.request_counts:
+                logger.info(
+                    f"Batch {batch.id} {batch.status}: {batch.request_counts.completed}/{batch.request_counts.total} completed, {batch.request_counts.failed} failed"
+                )
+        if batch.status != "completed":
+            logger.error(f"Batch {batch.id} ended {batch.status}: {batch.errors}")
+        return batch
+
+    async def read_results(self, batch: Batch) -> dict[str, Optional[ChatCompletion]]:
+        results: dict[str, Optional[ChatCompletion]] = dict()
+        # an expired batch still returns whatever completed in its window
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.openai_client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[result["custom_id"]] = ChatCompletion.model_validate(
+                        response["body"]
+                    )
+                else:
+                    logger.error(
+                        f"Batch request {result['custom_id']} failed: {result.get('error') or response.get('body')}"
+                    )
+                    results[result["custom_id"]] = None
+        return results
+
+    async def run(
+        self, name: str, requests: list[dict]
+    ) -> list[Optional[ChatCompletion]]:
+        """
+        Complete every request through the cache or the Batch API, in order.
+        A request that failed in its batch comes back as None.
+        """
+        started_at = time.monotonic()
+        wave = BatchWaveStats(name=name, requests=len(requests))
+        self.waves.append(wave)
+
+        cache_keys = [LLMCache.get_key(params) for params in requests]
+        models = {
+            cache_key: params["model"]
+            for cache_key, params in zip(cache_keys, requests)
+        }
+        responses: dict[str, Optional[ChatCompletion]] = dict()
+        request_lines: list[str] = list()
+        for cache_key, params in zip(cache_keys, requests):
+            # identical requests, e.g. the same page in two runs, are sent once
+            if cache_key in responses:
+                continue
+            cached_response = await self.llm_cache.get(cache_key)
+            if cached_response:
+                responses[cache_key] = ChatCompletion.model_validate_json(
+                    cached_response
+                )
+                wave.cached += 1
+                LLM_CACHE_LOOKUPS.labels("batch", "hit").inc()
+                continue
+            LLM_CACHE_LOOKUPS.labels("batch", "miss").inc()
+            responses[cache_key] = None
+            request_lines.append(
+                json.dumps(
+                    {
+                        "custom_id": cache_key,
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": params,
+                    }
+                )
+            )
+
+        if request_lines:
+            batch_files = self.split_batch_files(request_lines)
+            batches = [
+                await self.submit(f"{name}_{index}", batch_file)
+                for index, batch_file in enumerate(batch_files)
+            ]
+            wave.submitted = len(request_lines)
+            wave.batch_ids = [batch.id for batch in batches]
+
+            batches = await asyncio.gather(*(self.wait(batch) for batch in batches))
+            for batch in batches:
+                for cache_key, response in (await self.read_results(batch)).items():
+                    if response is None:
+                        LLM_ERRORS.labels(
+                            "batch", models[cache_key], "BatchRequestFailed"
+                        ).inc()
+                        continue
+                    observe_llm_usage(
+                        "batch",
+                        models[cache_key],
+                        response.usage,
+                        discount=LLM_BATCH_PRICE_DISCOUNT,
+                    )
+                    responses[cache_key] = response
+                    await self.llm_cache.put(cache_key, response.model_dump_json())
+
+        wave.failed = sum(1 for cache_key in cache_keys if responses[cache_key] is None)
+        wave.elapsed_seconds = round(time.monotonic() - started_at, 3)
+        logger.info(
+            f"Batch wave {name}: {wave.requests} requests, {wave.cached} cached, {wave.submitted} submitted, {wave.failed} failed"
+        )
+        return [responses[cache_key] for cache_key in cache_keys]
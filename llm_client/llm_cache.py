@@ -0,0 +1,133 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from db.models import LLMCacheStats
+from utils.const import LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES
+from utils.util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """
+    Content-addressed, disk-backed cache of chat-completion responses.
+
+    The key is a hash of the full request (model, messages including page text or
+    base64 page images, and every parameter), so a prompt change only misses for the
+    calls it actually touches. Entries are evicted least recently used first once
+    the store grows past max_size_bytes.
+    """
+
+    def __init__(
+        self, cache_dir: str = LLM_CACHE_DIR, max_size_bytes: int = LLM_CACHE_MAX_BYTES
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        # key -> entry size, ordered from least to most recently used
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def get_key(cls, params: dict[str, Any]) -> str:
+        payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self) -> None:
+        """
+        Rebuild the LRU index from the files on disk, oldest modification first.
+        """
+        entries: list[tuple[float, str, int]] = list()
+        if os.path.exists(self.cache_dir):
+            for dirpath, _, filenames in os.walk(self.cache_dir):
+                for filename in filenames:
+                    if not filename.endswith(".json"):
+                        continue
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    entries.append((stat.st_mtime, filename[:-5], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self.entries[key] = size
+            self.size_bytes += size
+        logger.info(
+            f"LLM cache loaded with {len(self.entries)} entries, {self.size_bytes} bytes"
+        )
+
+    def read(self, key: str) -> Optional[str]:
+        path = self.get_path(key)
+        try:
+            with open(path, "r") as file:
+                value = file.read()
+            # the modification time doubles as the last access time across restarts
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, value: str) -> None:
+        # unique temp names, two flights may write the same key at once
+        write_file_atomic(self.get_path(key), value)
+
+    def remove(self, keys: list[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self.get_path(key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[str]:
+        # keys missing from the index are read too, another worker or the batch
+        # pipeline may have written them since load()
+        value = await asyncio.to_thread(self.read, key)
+
+        if value is None:
+            self.misses += 1
+            if key in self.entries:
+                self.size_bytes -= self.entries.pop(key)
+            return None
+
+        self.hits += 1
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = len(value.encode("utf-8"))
+            self.size_bytes += self.entries[key]
+        return value
+
+    async def put(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self.write, key, value)
+        if key in self.entries:
+            self.size_bytes -= self.entries.pop(key)
+        self.entries[key] = len(value.encode("utf-8"))
+        self.size_bytes += self.entries[key]
+
+        evicted_keys: list[str] = list()
+        while self.size_bytes > self.max_size_bytes and len(self.entries) > 1:
+            evicted_key, size = self.entries.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+            evicted_keys.append(evicted_key)
+        if evicted_keys:
+            await asyncio.to_thread(self.remove, evicted_keys)
+
+    def get_stats(self) -> LLMCacheStats:
+        lookups = self.hits + self.misses
+        return LLMCacheStats(
+            entries=len(self.entries),
+            size_bytes=self.size_bytes,
+            max_size_bytes=self.max_size_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            hit_ratio=round(self.hits / lookups, 4) if lookups else 0.0,
+        )
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator
+
+import backoff
+import openai
+from openai import AsyncOpenAI, AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+from db.models import LLMPriority
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_limiter import LLMLimiter, ModelLimiter, estimate_request_tokens
+from utils.const import LLM_MAX_RETRIES, OPENAI_TIMEOUT_SECONDS
+from utils.deadline import get_call_timeout, is_deadline_exceeded, wait_within_deadline
+from utils.exception import DeadlineExceededException
+from utils.metrics import (
+    LLM_CACHE_LOOKUPS,
+    LLM_ERRORS,
+    LLM_REQUEST_SECONDS,
+    observe_llm_usage,
+)
+
+logger = logging.getLogger(__name__)
+
+# errors worth retrying once the limiter has backed off, timeouts included
+RETRYABLE_LLM_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
+
+
+def is_quota_exhausted(e: Exception) -> bool:
+    # a 429 that no amount of waiting fixes
+    return getattr(e, "code", None) == "insufficient_quota"
+
+
+def should_give_up(e: Exception) -> bool:
+    return is_quota_exhausted(e) or is_deadline_exceeded()
+
+
+class LLMClient:
+    """
+    Single entry point for chat completions used by PaperSummariser and TableExtracter.
+    Responses are served from the shared LLMCache when the exact same request was
+    made before. caller ("summariser", "table_extracter") only labels the metrics
+    and is not part of the request or its cache key.
+
+    Every request goes through the process-wide LLMLimiter, which decides how many
+    run at once per model and in which order (priority, then arrival). Rate limits,
+    5xx and connection errors are retried up to LLM_MAX_RETRIES times.
+
+    Under a request deadline, waiting for a slot and each call are cut short
+    when it passes, and nothing is retried after it.
+    """
+
+    def __init__(
+        self, openai_client: AsyncOpenAI, llm_cache: LLMCache, llm_limiter: LLMLimiter
+    ):
+        self.openai_client = openai_client
+        self.llm_cache = llm_cache
+        self.llm_limiter = llm_limiter
+
+    @backoff.on_exception(
+        backoff.expo,
+        RETRYABLE_LLM_ERRORS,
+        max_tries=LLM_MAX_RETRIES,
+        giveup=should_give_up,
+        on_giveup=lambda details: logger.error(
+            f"LLM request gave up after {details['tries']} tries: {details['exception']}"
+        ),
+    )
+    async def create_chat_completion(
+        self, caller: str, priority: LLMPriority, params: dict
+    ) -> ChatCompletion:
+        model = params["model"]
+        model_limiter = self.llm_limiter.get_model_limiter(model)
+        reserved_tokens = estimate_request_tokens(params)
+        started_at = await wait_within_deadline(
+            model_limiter.acquire(reserved_tokens, priority), f"a {model} slot"
+        )
+        try:
+            timeout = get_call_timeout(OPENAI_TIMEOUT_SECONDS, f"{caller} {model} call")
+            with LLM_REQUEST_SECONDS.labels(caller, model).time():
+                response = await self.openai_client.chat.completions.create(
+                    **params, timeout=timeout
+                )
+        except DeadlineExceededException:
+            raise
+        except Exception as e:
+            if is_deadline_exceeded():
+                # cut short by the deadline, which says nothing about the model
+                raise DeadlineExceededException(f"{caller} {model} call") from e
+            LLM_ERRORS.labels(caller, model, type(e).__name__).inc()
+            model_limiter.on_error(started_at, e)
+            raise
+        else:
+            used_tokens = response.usage.total_tokens if response.usage else None
+            model_limiter.on_success(started_at, reserved_tokens, used_tokens)
+        finally:
+            model_limiter.release()
+        return response
+
+    async def chat_completion(
+        self,
+        caller: str = "unknown",
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        **params,
+    ) -> ChatCompletion:
+        cache_key = LLMCache.get_key(params)
+        cached_response = await self.llm_cache.get(cache_key)
+        if cached_response:
+            LLM_CACHE_LOOKUPS.labels(caller, "hit").inc()
+            logger.debug(f"LLM cache hit for {params.get('model')}: {cache_key}")
+            return ChatCompletion.model_validate_json(cached_response)
+        LLM_CACHE_LOOKUPS.labels(caller, "miss").inc()
+
+        response = await self.create_chat_completion(caller, priority, params)
+        observe_llm_usage(caller, params["model"], response.usage)
+        await self.llm_cache.put(cache_key, response.model_dump_json())
+        return response
+
+    @backoff.on_exception(
+        backoff.expo,
+        RETRYABLE_LLM_ERRORS,
+        max_tries=LLM_MAX_RETRIES,
+        giveup=should_give_up,
+        on_giveup=lambda details: logger.error(
+            f"LLM stream gave up after {details['tries']} tries: {details['exception']}"
+        ),
+    )
+    async def open_chat_completion_stream(
+        self, caller: str, priority: LLMPriority, params: dict
+    ) -> tuple[AsyncStream[ChatCompletionChunk], float, int]:
+        """
+        Acquire a limiter slot and open the stream, retrying until the first
+        response. The caller must release the slot once the stream is consumed.
+        """
+        model = params["model"]
+        model_limiter = self.llm_limiter.get_model_limiter(model)
+        reserved_tokens = estimate_request_tokens(params)
+        started_at = await wait_within_deadline(
+            model_limiter.acquire(reserved_tokens, priority), f"a {model} slot"
+        )
+        try:
+            timeout = get_call_timeout(OPENAI_TIMEOUT_SECONDS, f"{caller} {model} call")
+            # the final chunk carries the token usage when include_usage is set
+            stream = await self.openai_client.chat.completions.create(
+                **params,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+        except BaseException as e:
+            # cut short by the deadline, which says nothing about the model
+            deadline_exceeded = isinstance(e, Exception) and is_deadline_exceeded()
+            if isinstance(e, Exception) and not deadline_exceeded:
+                LLM_ERRORS.labels(caller, model, type(e).__name__).inc()
+                model_limiter.on_error(started_at, e)
+            model_limiter.release()
+            if deadline_exceeded and not isinstance(e, DeadlineExceededException):
+                raise DeadlineExceededException(f"{caller} {model} call") from e
+            raise
+        return stream, started_at, reserved_tokens
+
+    async def stream_chat_completion(
+        self,
+        caller: str = "unknown",
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+        **params,
+    ) -> AsyncIterator[str]:
+        """
+        Yield the completion text as it is generated. The assembled response is
+        cached under the same key as the non-streaming call, and a cache hit is
+        yielded as a single chunk.
+        """
+        cache_key = LLMCache.get_key(params)
+        cached_response = await self.llm_cache.get(cache_key)
+        if cached_response:
+            LLM_CACHE_LOOKUPS.labels(caller, "hit").inc()
+            response = ChatCompletion.model_validate_json(cached_response)
+            yield response.choices[0].message.content or ""
+            return
+        LLM_CACHE_LOOKUPS.labels(caller, "miss").inc()
+
+        model = params["model"]
+        model_limiter = self.llm_limiter.get_model_limiter(model)
+        content_parts: list[str] = list()
+        finish_reason = "stop"
+        response_id = ""
+        usage = None
+        stream, started_at, reserved_tokens = await self.open_chat_completion_stream(
+            caller, priority, params
+        )
+        try:
+            async for chunk in stream:
+                response_id = chunk.id
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    content_parts.append(delta)
+                    yield delta
+        except Exception as e:
+            LLM_ERRORS.labels(caller, model, type(e).__name__).inc()
+            model_limiter.on_error(started_at, e)
+            raise
+        else:
+            used_tokens = usage.total_tokens if usage else None
+            model_limiter.on_success(started_at, reserved_tokens, used_tokens)
+        finally:
+            # a disconnect or deadline stops the iteration early, hand the HTTP
+            # stream and its pooled connection back instead of waiting for GC
+            try:
+                await stream.close()
+            finally:
+                model_limiter.release()
+        LLM_REQUEST_SECONDS.labels(caller, model).observe(
+            asyncio.get_running_loop().time() - started_at
+        )
+        observe_llm_usage(caller, model, usage)
+
+        response = ChatCompletion(
+            id=response_id,
+            object="chat.completion",
+            created=int(time.time()),
+            model=params["model"],
+            choices=[
+                Choice(
+                    index=0,
+                    finish_reason=finish_reason,
+                    message=ChatCompletionMessage(
+                        role="assistant", content="".join(content_parts)
+                    ),
+                )
+            ],
+            usage=usage,
+        )
+        await self.llm_cache.put(cache_key, response.model_dump_json())
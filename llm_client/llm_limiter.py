@@ -0,0 +1,315 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import math
+from typing import Optional
+
+import openai
+
+from config import LLM_RATE_LIMIT_OVERRIDES
+from db.models import LLMLimiterStats, LLMPriority
+from utils.const import (
+    DEFAULT_LLM_RATE_LIMIT,
+    LLM_CONCURRENCY_DECREASE,
+    LLM_DEFAULT_COMPLETION_TOKENS,
+    LLM_IMAGE_TOKENS,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_LATENCY_BASELINE_ALPHA,
+    LLM_LATENCY_DECREASE,
+    LLM_LATENCY_RECENT_ALPHA,
+    LLM_LATENCY_TOLERANCE,
+    LLM_MAX_CONCURRENCY,
+    LLM_MIN_CONCURRENCY,
+    LLM_RATE_LIMITS,
+)
+from utils.metrics import (
+    LLM_CONCURRENCY_LIMIT,
+    LLM_LIMITER_WAIT_SECONDS,
+    LLM_REQUESTS_IN_FLIGHT,
+)
+from utils.util import estimate_tokens, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_request_tokens(params: dict) -> int:
+    """
+    Tokens a chat completion counts against the tokens-per-minute budget before
+    its usage is known: the prompt plus the completion it may generate.
+    """
+    prompt_tokens = 0
+    for message in params["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            prompt_tokens += estimate_tokens(content)
+            continue
+        for part in content:
+            if part["type"] == "text":
+                prompt_tokens += estimate_tokens(part["text"])
+            elif part["type"] == "image_url":
+                prompt_tokens += LLM_IMAGE_TOKENS
+    if params.get("tools"):
+        prompt_tokens += estimate_tokens(json.dumps(params["tools"]))
+    return prompt_tokens + (params.get("max_tokens") or LLM_DEFAULT_COMPLETION_TOKENS)
+
+
+def get_retry_after(e: openai.APIStatusError) -> Optional[float]:
+    retry_after_ms = e.response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_retry_after(e.response.headers.get("retry-after"))
+
+
+class RateBudget:
+    """
+    A per-minute budget as a token bucket holding at most one minute's worth and
+    refilled continuously. A budget of 0 is unlimited.
+    """
+
+    def __init__(self, per_minute: int, now: float):
+        self.per_minute = per_minute
+        self.available = float(per_minute)
+        self.updated_at = now
+
+    def refill(self, now: float) -> None:
+        if self.per_minute:
+            elapsed = now - self.updated_at
+            self.available = min(
+                self.per_minute, self.available + elapsed * self.per_minute / 60
+            )
+        self.updated_at = now
+
+    def get_wait(self, amount: float) -> float:
+        # a request larger than the whole budget waits for a full bucket
+        if not self.per_minute:
+            return 0.0
+        amount = min(amount, self.per_minute)
+        return max(0.0, (amount - self.available) * 60 / self.per_minute)
+
+    def adjust(self, amount: float) -> None:
+        if self.per_minute:
+            self.available = min(self.per_minute, self.available + amount)
+
+
+class ModelLimiter:
+    """
+    Admission control for one model. A request waits until it is at the head of
+    the queue (by priority, then arrival), a concurrency slot is free and the
+    requests and tokens per minute budgets cover it.
+
+    The concurrency limit is sized with AIMD: it grows by one per window of
+    successes while it is in use, and is cut on 429s, 5xx and timeouts, or
+    when recent latency drifts well above the baseline. Requests that started
+    before a cut do not cut it again.
+    """
+
+    def __init__(self, model: str, requests_per_minute: int, tokens_per_minute: int):
+        now = asyncio.get_running_loop().time()
+        self.model = model
+        self.limit = float(LLM_INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.request_budget = RateBudget(requests_per_minute, now)
+        self.token_budget = RateBudget(tokens_per_minute, now)
+        self.blocked_until = 0.0
+        self.last_decrease_at = 0.0
+        self.latency_recent: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        # (priority, arrival, tokens, future) heap of waiting requests
+        self.waiters: list[tuple[int, int, int, asyncio.Future]] = list()
+        self.arrivals = itertools.count()
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        LLM_CONCURRENCY_LIMIT.labels(model).set(self.concurrency_limit)
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(LLM_MIN_CONCURRENCY, math.floor(self.limit))
+
+    def dispatch(self) -> None:
+        """
+        Grant slots from the head of the queue while the limits allow it, and
+        schedule another pass for when the rate limit budget has refilled.
+        """
+        loop = asyncio.get_running_loop()
+        if self.wakeup:
+            self.wakeup.cancel()
+            self.wakeup = None
+
+        while self.waiters:
+            _, _, tokens, future = self.waiters[0]
+            if future.done():
+                # its caller was cancelled while waiting
+                heapq.heappop(self.waiters)
+                continue
+            if self.in_flight >= self.concurrency_limit:
+                return
+
+            now = loop.time()
+            self.request_budget.refill(now)
+            self.token_budget.refill(now)
+            wait = max(
+                self.blocked_until - now,
+                self.request_budget.get_wait(1),
+                self.token_budget.get_wait(tokens),
+            )
+            if wait > 0:
+                self.wakeup = loop.call_later(wait, self.dispatch)
+                return
+
+            heapq.heappop(self.waiters)
+            self.request_budget.adjust(-1)
+            self.token_budget.adjust(-tokens)
+            self.in_flight += 1
+            LLM_REQUESTS_IN_FLIGHT.labels(self.model).set(self.in_flight)
+            future.set_result(now)
+
+    async def acquire(self, tokens: int, priority: LLMPriority) -> float:
+        """
+        Wait for a slot and the budget for tokens, and return the loop time it
+        was granted at. Every acquire must be followed by release().
+        """
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        future = loop.create_future()
+        heapq.heappush(
+            self.waiters, (priority.value, next(self.arrivals), tokens, future)
+        )
+        self.dispatch()
+        try:
+            granted_at = await future
+        except asyncio.CancelledError:
+            # granted just before the caller was cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        LLM_LIMITER_WAIT_SECONDS.labels(self.model, priority.name.lower()).observe(
+            granted_at - queued_at
+        )
+        return granted_at
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        LLM_REQUESTS_IN_FLIGHT.labels(self.model).set(self.in_flight)
+        self.dispatch()
+
+    def decrease(self, factor: float, started_at: float, reason: str) -> None:
+        if started_at < self.last_decrease_at or self.limit <= LLM_MIN_CONCURRENCY:
+            return
+        self.limit = max(LLM_MIN_CONCURRENCY, self.limit * factor)
+        self.last_decrease_at = asyncio.get_running_loop().time()
+        LLM_CONCURRENCY_LIMIT.labels(self.model).set(self.concurrency_limit)
+        logger.warning(
+            f"LLM concurrency of {self.model} lowered to {self.concurrency_limit} after {reason}"
+        )
+
+    def on_success(
+        self, started_at: float, reserved_tokens: int, used_tokens: Optional[int]
+    ) -> None:
+        latency = asyncio.get_running_loop().time() - started_at
+        self.requests += 1
+        if used_tokens is not None:
+            # settle the reservation against the tokens actually used
+            self.token_budget.adjust(reserved_tokens - used_tokens)
+
+        if self.latency_recent is None or self.latency_baseline is None:
+            self.latency_recent = self.latency_baseline = latency
+        else:
+            self.latency_recent += LLM_LATENCY_RECENT_ALPHA * (
+                latency - self.latency_recent
+            )
+            self.latency_baseline += LLM_LATENCY_BASELINE_ALPHA * (
+                latency - self.latency_baseline
+            )
+
+        if self.latency_recent > LLM_LATENCY_TOLERANCE * self.latency_baseline:
+            self.decrease(
+                LLM_LATENCY_DECREASE,
+                started_at,
+                f"latency rose to {self.latency_recent:.2f}s from {self.latency_baseline:.2f}s",
+            )
+        elif self.in_flight >= self.concurrency_limit:
+            # only grow a limit that is actually being hit
+            self.limit = min(LLM_MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            LLM_CONCURRENCY_LIMIT.labels(self.model).set(self.concurrency_limit)
+
+    def on_error(self, started_at: float, e: Exception) -> None:
+        if isinstance(e, openai.RateLimitError):
+            self.throttled += 1
+            retry_after = get_retry_after(e)
+            if retry_after:
+                now = asyncio.get_running_loop().time()
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.decrease(LLM_CONCURRENCY_DECREASE, started_at, "a 429")
+        elif isinstance(e, (openai.InternalServerError, openai.APIConnectionError)):
+            self.errors += 1
+            self.decrease(LLM_CONCURRENCY_DECREASE, started_at, type(e).__name__)
+        else:
+            self.errors += 1
+
+    def get_stats(self) -> LLMLimiterStats:
+        now = asyncio.get_running_loop().time()
+        self.request_budget.refill(now)
+        self.token_budget.refill(now)
+        queued = {priority.name.lower(): 0 for priority in LLMPriority}
+        for priority, _, _, future in self.waiters:
+            if not future.done():
+                queued[LLMPriority(priority).name.lower()] += 1
+        return LLMLimiterStats(
+            model=self.model,
+            concurrency_limit=self.concurrency_limit,
+            in_flight=self.in_flight,
+            queued=queued,
+            requests_per_minute=self.request_budget.per_minute,
+            tokens_per_minute=self.token_budget.per_minute,
+            available_requests=round(self.request_budget.available, 2),
+            available_tokens=round(self.token_budget.available, 2),
+            latency_recent_seconds=self.latency_recent,
+            latency_baseline_seconds=self.latency_baseline,
+            requests=self.requests,
+            throttled=self.throttled,
+            errors=self.errors,
+        )
+
+
+class LLMLimiter:
+    """
+    One ModelLimiter per model shared by every LLM call in the process, so
+    concurrent papers, endpoints and bulk runs draw on the same concurrency and
+    rate limit budgets instead of each opening a fixed number of requests.
+    """
+
+    def __init__(
+        self,
+        rate_limits: dict[str, tuple[int, int]] = {
+            **LLM_RATE_LIMITS,
+            **LLM_RATE_LIMIT_OVERRIDES,
+        },
+        default_rate_limit: tuple[int, int] = DEFAULT_LLM_RATE_LIMIT,
+    ):
+        self.rate_limits = rate_limits
+        self.default_rate_limit = default_rate_limit
+        self.model_limiters: dict[str, ModelLimiter] = dict()
+
+    def get_model_limiter(self, model: str) -> ModelLimiter:
+        if model not in self.model_limiters:
+            requests_per_minute, tokens_per_minute = self.rate_limits.get(
+                model, self.default_rate_limit
+            )
+            self.model_limiters[model] = ModelLimiter(
+                model=model,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+            )
+        return self.model_limiters[model]
+
+    def get_stats(self) -> list[LLMLimiterStats]:
+        return [
+            model_limiter.get_stats() for model_limiter in self.model_limiters.values()
+        ]
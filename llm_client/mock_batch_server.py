@@ -0,0 +1,196 @@
+"""
+Local stand-in for the OpenAI file and batch endpoints, so the batch mode can run
+without network access or cost:
+
+    uvicorn llm_client.mock_batch_server:app --port 8001
+    OPENAI_APIKEY=mock OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python -m pipeline.batch_pipeline
+
+Batches complete after MOCK_BATCH_DELAY_SECONDS with canned answers shaped like the
+real ones: a text summary, a JSON table for page images and a
+create_result_table_csv tool call when tools are offered.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+MOCK_BATCH_DELAY_SECONDS = float(os.getenv("MOCK_BATCH_DELAY_SECONDS", "1"))
+
+app = FastAPI()
+files: dict[str, dict] = dict()
+file_contents: dict[str, bytes] = dict()
+batches: dict[str, dict] = dict()
+batch_tasks: set[asyncio.Task[None]] = set()
+
+
+def get_mock_message(body: dict) -> dict:
+    request_digest = hashlib.sha256(
+        json.dumps(body, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:8]
+
+    if body.get("tools"):
+        arguments = {
+            "columns": ["Outcome", "Value"],
+            "rows": [["mock outcome", request_digest]],
+        }
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{request_digest}",
+                    "type": "function",
+                    "function": {
+                        "name": body["tools"][0]["function"]["name"],
+                        "arguments": json.dumps(arguments),
+                    },
+                }
+            ],
+        }
+
+    content = body["messages"][-1]["content"]
+    if isinstance(content, list):
+        table = {"headers": ["Outcome", "Value"], "rows": [["mock", request_digest]]}
+        return {"role": "assistant", "content": json.dumps({"tables": [table]})}
+
+    return {
+        "role": "assistant",
+        "content": f"Mock summary {request_digest} of {len(content)} characters.",
+    }
+
+
+def get_mock_result(request_line: str) -> dict:
+    request = json.loads(request_line)
+    body = request["body"]
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": request["custom_id"],
+        "response": {
+            "status_code": 200,
+            "request_id": uuid.uuid4().hex,
+            "body": {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": get_mock_message(body),
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            },
+        },
+        "error": None,
+    }
+
+
+def save_file(filename: str, purpose: str, content: bytes) -> dict:
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+    file_contents[file_id] = content
+    return files[file_id]
+
+
+async def process_batch(batch_id: str) -> None:
+    batch = batches[batch_id]
+    batch["status"] = "in_progress"
+    batch["in_progress_at"] = int(time.time())
+    await asyncio.sleep(MOCK_BATCH_DELAY_SECONDS)
+
+    request_lines = [
+        line
+        for line in file_contents[batch["input_file_id"]].decode("utf-8").splitlines()
+        if line.strip()
+    ]
+    results = [json.dumps(get_mock_result(line)) for line in request_lines]
+    output_file = save_file(
+        f"{batch_id}_output.jsonl",
+        "batch_output",
+        ("\n".join(results) + "\n").encode("utf-8"),
+    )
+    batch.update(
+        status="completed",
+        output_file_id=output_file["id"],
+        finalizing_at=int(time.time()),
+        completed_at=int(time.time()),
+        request_counts={
+            "total": len(request_lines),
+            "completed": len(request_lines),
+            "failed": 0,
+        },
+    )
+
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile, purpose: str = Form(...)) -> dict:
+    return save_file(file.filename, purpose, await file.read())
+
+
+@app.get("/v1/files/{file_id}")
+async def get_file(file_id: str) -> dict:
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    return files[file_id]
+
+
+@app.get("/v1/files/{file_id}/content")
+async def get_file_content(file_id: str) -> Response:
+    if file_id not in file_contents:
+        raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    return Response(content=file_contents[file_id], media_type="application/jsonl")
+
+
+@app.post("/v1/batches")
+async def create_batch(request: Request) -> dict:
+    params = await request.json()
+    if params["input_file_id"] not in file_contents:
+        raise HTTPException(
+            status_code=400, detail=f"File {params['input_file_id']} not found"
+        )
+
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    created_at = int(time.time())
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": params["endpoint"],
+        "input_file_id": params["input_file_id"],
+        "completion_window": params["completion_window"],
+        "status": "validating",
+        "created_at": created_at,
+        "expires_at": created_at + 24 * 60 * 60,
+        "metadata": params.get("metadata"),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+    }
+    batch_task = asyncio.create_task(process_batch(batch_id))
+    batch_tasks.add(batch_task)
+    batch_task.add_done_callback(batch_tasks.discard)
+    return batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str) -> dict:
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return batches[batch_id]
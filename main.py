@@ -1,18 +1,97 @@
+import asyncio
 from contextlib import asynccontextmanager
+import hashlib
+import json
 import logging
-import os
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+import time
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from db.api_models import (
+    AnalyzePaperResponse,
+    BulkAnalysisReport,
+    GetArtifactCacheStatsResponse,
+    GetClientPoolStatsResponse,
+    GetDownloadJobResponse,
     GetDownloadedPapersResponse,
+    GetLLMCacheStatsResponse,
+    GetLLMLimiterStatsResponse,
+    GetPaperCheckpointsResponse,
+    GetPaperSummariesResponse,
+    GetPapersResponse,
+    GetSearchIndexStatsResponse,
+    GetTableStoreStatsResponse,
+    GetSingleFlightStatsResponse,
+    GetTableCandidatesResponse,
     Paper,
+    PaperDownloadStatusResponse,
+    QueryTablesResponse,
+    SearchResponse,
+    TriggerBulkAnalysisRequest,
     TriggerPaperDownloadRequest,
+    TriggerPaperDownloadResponse,
+)
+from db.artifact_cache import Artifact, ArtifactCache
+from db.artifact_store import ArtifactStore
+from db.models import (
+    ArtifactStatus,
+    PaperIndexReconcileReport,
+    PaperRecord,
+    SearchDocumentKind,
+    SearchIndexUpdateReport,
+    TableStoreCompactionReport,
 )
-from paper_downloader.paper_downloader import PaperDownloader
-from paper_summariser.paper_summariser import PaperSummariser
+from db.page_checkpoints import PageCheckpointStore
+from db.paper_index import PaperIndex
+from db.search_index import SearchIndex, get_search_terms
+from db.table_store import TABLE_FIELDS, TableStore
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_client import LLMClient
+from llm_client.llm_limiter import LLMLimiter
+from paper_downloader.download_scheduler import DownloadScheduler
+from paper_summariser.paper_summariser import (
+    PaperSummariser,
+    generate_paper_summary,
+    read_paper_summary,
+)
+from pdf_processor.pdf_processor import PdfProcessor
+from pipeline.analysis_pipeline import AnalysisPipeline, prune_finished_pipelines
+from pipeline.paper_analysis import analyse_paper
 from setup_logger import setup_logger
-from table_extracter.table_extracter import TableExtracter
-from utils.util import get_paper_id, run_async_task
+from table_extracter.table_extracter import generate_primary_result_table
+from utils.client_registry import ClientRegistry
+from utils.const import (
+    ARTIFACT_STREAM_CHUNK_SIZE,
+    CLIENT_CLOSED_REQUEST_STATUS,
+    MAX_BULK_SUMMARIES,
+    PAPER_INDEX_MAX_PAGE_SIZE,
+    PAPER_INDEX_PAGE_SIZE,
+    SEARCH_MAX_PAGE_SIZE,
+    SEARCH_MAX_PAPER_IDS,
+    SEARCH_PAGE_SIZE,
+    TABLE_CANDIDATE_THRESHOLD,
+    TABLE_QUERY_MAX_ROWS,
+    TABLE_QUERY_PAGE_SIZE,
+)
+from utils.deadline import (
+    Deadline,
+    current_deadline,
+    get_request_deadline,
+    run_while_connected,
+)
+from utils.exception import ClientDisconnectedException, DeadlineExceededException
+from utils.metrics import HTTP_REQUEST_SECONDS, monitor_event_loop_lag
+from utils.single_flight import SingleFlight
+from utils.util import (
+    accepts_gzip,
+    format_sse,
+    is_etag_match,
+    read_paper_links,
+    write_file_atomic,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,8 +101,92 @@ async def lifespan(app: FastAPI):
     # setup the logger
     setup_logger()
 
+    # event loop lag is exported with the other metrics
+    loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+    # build the pooled http and openai clients shared by every request
+    client_registry = ClientRegistry()
+    await client_registry.start()
+    app.state.client_registry = client_registry
+
+    # shared LLM entry point with the on-disk response cache, every LLM call of
+    # the process goes through the same per-model limiter
+    llm_cache = LLMCache()
+    await asyncio.to_thread(llm_cache.load)
+    app.state.llm_limiter = LLMLimiter()
+    app.state.llm_client = LLMClient(
+        openai_client=client_registry.openai_client,
+        llm_cache=llm_cache,
+        llm_limiter=app.state.llm_limiter,
+    )
+
+    # worker processes for pymupdf extraction and rendering
+    pdf_processor = PdfProcessor()
+    app.state.pdf_processor = pdf_processor
+
+    # per-paper artifact index, brought in line with the data/ tree on startup
+    paper_index = PaperIndex()
+    paper_index.open()
+    await paper_index.reconcile()
+    app.state.paper_index = paper_index
+
+    # coalesces concurrent analyses of the same paper
+    app.state.single_flight = SingleFlight()
+
+    # claims per-paper work across processes, so uvicorn workers never duplicate it
+    artifact_store = ArtifactStore()
+    await asyncio.to_thread(artifact_store.remove_stale_temp_files)
+    app.state.artifact_store = artifact_store
+
+    # hot summaries and tables served from memory, revalidated with ETags
+    app.state.artifact_cache = ArtifactCache()
+
+    # every extracted table in one columnar dataset, tables extracted before it
+    # existed are backfilled here and segments are merged in the background
+    table_store = TableStore()
+    try:
+        await table_store.compact(paper_index)
+    except Exception as e:
+        logger.error(f"Failed to compact the table store: {e}")
+    app.state.table_store = table_store
+    table_compaction_task = asyncio.create_task(
+        table_store.compact_periodically(paper_index)
+    )
+
+    # full-text index over page texts and summaries, following the paper index
+    search_index = SearchIndex()
+    search_index.open()
+    app.state.search_index = search_index
+    search_index_task = asyncio.create_task(
+        search_index.update_periodically(paper_index, pdf_processor)
+    )
+
+    # start the shared download queue on the app's event loop
+    download_scheduler = DownloadScheduler(
+        client=client_registry.http_client,
+        paper_index=paper_index,
+        artifact_store=artifact_store,
+    )
+    await download_scheduler.start()
+    app.state.download_scheduler = download_scheduler
+
+    # bulk analysis runs by run_id and the tasks driving them
+    app.state.pipelines = dict()
+    app.state.pipeline_tasks = set()
+
     yield
 
+    for pipeline_task in app.state.pipeline_tasks:
+        pipeline_task.cancel()
+    table_compaction_task.cancel()
+    search_index_task.cancel()
+    await download_scheduler.stop()
+    pdf_processor.close()
+    search_index.close()
+    paper_index.close()
+    await client_registry.close()
+    loop_lag_task.cancel()
+
 
 app = FastAPI(
     title="Paper Analyzer API",
@@ -32,94 +195,675 @@ app = FastAPI(
 )
 
 
+@app.exception_handler(DeadlineExceededException)
+async def handle_deadline_exceeded(
+    request: Request, e: DeadlineExceededException
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=504,
+        content={"detail": f"{e}, the pages done so far are kept for a retry"},
+    )
+
+
+@app.exception_handler(ClientDisconnectedException)
+async def handle_client_disconnected(
+    request: Request, e: ClientDisconnectedException
+) -> Response:
+    # nobody reads this response, the status only shows in logs and metrics
+    return Response(status_code=CLIENT_CLOSED_REQUEST_STATUS)
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next) -> Response:
+    started_at = time.monotonic()
+    # streaming responses return here once their headers are sent
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method,
+        route.path if route else "unmatched",
+        str(response.status_code),
+    ).observe(time.monotonic() - started_at)
+    return response
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get("/trigger_all_paper_download")
-async def trigger_all_paper_download(background_tasks: BackgroundTasks):
-    papers: list[Paper] = []
-    with open("data/pubmed_paper_links.txt", "r") as file:
-        urls = [line.strip() for line in file.readlines()]
-        for url in urls:
-            paper_id, is_paper_id_present = get_paper_id(url)
-            if is_paper_id_present:
-                papers.append(Paper(paper_id=paper_id, paper_url=url))
-    downloader = PaperDownloader(papers=papers)
-    # Wrap the coroutine in a synchronous wrapper
-    background_tasks.add_task(run_async_task, downloader.download())
-    return {"message": "All Paper downloads started in the background"}
+async def trigger_all_paper_download(request: Request) -> TriggerPaperDownloadResponse:
+    papers = read_paper_links("data/pubmed_paper_links.txt")
+    job = request.app.state.download_scheduler.submit(papers)
+    return TriggerPaperDownloadResponse(
+        message="All Paper downloads queued in the background",
+        job_id=job.job_id,
+        paper_count=len(job.paper_ids),
+    )
 
 
 @app.post("/trigger_paper_download")
 async def trigger_paper_download(
     trigger_paper_download_requests: TriggerPaperDownloadRequest,
-    background_tasks: BackgroundTasks,
-):
+    request: Request,
+) -> TriggerPaperDownloadResponse:
     papers: list[Paper] = []
     for paper_id in trigger_paper_download_requests.paper_ids:
         paper_url = f"https://pubmed.ncbi.nlm.nih.gov/{paper_id}"
         papers.append(Paper(paper_id=paper_id, paper_url=paper_url))
-    downloader = PaperDownloader(papers=papers)
-    # Wrap the coroutine in a synchronous wrapper
-    background_tasks.add_task(run_async_task, downloader.download())
-    return {"message": "Paper download started in the background"}
+    job = request.app.state.download_scheduler.submit(papers)
+    return TriggerPaperDownloadResponse(
+        message="Paper download queued in the background",
+        job_id=job.job_id,
+        paper_count=len(job.paper_ids),
+    )
+
+
+@app.get("/get_download_job/{job_id}")
+async def get_download_job(job_id: str, request: Request) -> GetDownloadJobResponse:
+    job = request.app.state.download_scheduler.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Download job {job_id} not found")
+    return job
+
+
+@app.get("/get_paper_download_status/{paper_id}")
+async def get_paper_download_status(
+    paper_id: int, request: Request
+) -> PaperDownloadStatusResponse:
+    paper_status = request.app.state.download_scheduler.get_paper_status(paper_id)
+    if not paper_status:
+        raise HTTPException(
+            status_code=404, detail=f"No download scheduled for paper {paper_id}"
+        )
+    return paper_status
 
 
 @app.get("/get_downloaded_papers")
-async def get_downloaded_papers() -> GetDownloadedPapersResponse:
+async def get_downloaded_papers(
+    request: Request,
+    after: int = 0,
+    limit: int = Query(PAPER_INDEX_PAGE_SIZE, ge=1, le=PAPER_INDEX_MAX_PAGE_SIZE),
+) -> GetDownloadedPapersResponse:
     logger.info("Getting available papers")
-    directory = "data/downloaded_papers"
-    if not os.path.exists(directory):
-        return {"paper_ids": []}
+    paper_records, total = request.app.state.paper_index.list_papers(
+        {"download": ArtifactStatus.DONE}, after=after, limit=limit
+    )
+    papers = [
+        Paper(paper_id=paper_record.paper_id, paper_url=paper_record.paper_url)
+        for paper_record in paper_records
+    ]
+    return GetDownloadedPapersResponse(
+        papers=papers,
+        total=total,
+        next_cursor=papers[-1].paper_id if len(papers) == limit else None,
+    )
+
+
+@app.get("/get_papers")
+async def get_papers(
+    request: Request,
+    download_status: Optional[ArtifactStatus] = None,
+    summary_status: Optional[ArtifactStatus] = None,
+    table_status: Optional[ArtifactStatus] = None,
+    after: int = 0,
+    limit: int = Query(PAPER_INDEX_PAGE_SIZE, ge=1, le=PAPER_INDEX_MAX_PAGE_SIZE),
+) -> GetPapersResponse:
+    """
+    Papers in the index with the state of their artifacts, filtered by status and
+    paginated by paper_id: pass next_cursor back as after for the next page.
+    """
+    statuses = {
+        artifact: status
+        for artifact, status in (
+            ("download", download_status),
+            ("summary", summary_status),
+            ("table", table_status),
+        )
+        if status
+    }
+    papers, total = request.app.state.paper_index.list_papers(
+        statuses, after=after, limit=limit
+    )
+    return GetPapersResponse(
+        papers=papers,
+        total=total,
+        next_cursor=papers[-1].paper_id if len(papers) == limit else None,
+    )
+
+
+@app.get("/get_paper/{paper_id}")
+async def get_paper(paper_id: int, request: Request) -> PaperRecord:
+    paper_record = request.app.state.paper_index.get_paper(paper_id)
+    if not paper_record:
+        raise HTTPException(status_code=404, detail=f"Paper {paper_id} not indexed")
+    return paper_record
 
-    papers: list[Paper] = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".pdf"):
-            paper_id = os.path.splitext(filename)[0]
-            paper_url = f"https://pubmed.ncbi.nlm.nih.gov/{paper_id}"
-            papers.append(Paper(paper_id=int(paper_id), paper_url=paper_url))
 
-    return GetDownloadedPapersResponse(papers=papers)
+@app.get("/get_paper_checkpoints/{paper_id}")
+async def get_paper_checkpoints(paper_id: int) -> GetPaperCheckpointsResponse:
+    """
+    Status and output of every checkpointed page of the summary and table stages.
+    """
+    return GetPaperCheckpointsResponse(
+        paper_id=paper_id,
+        summary=PageCheckpointStore(paper_id, "summary").load(),
+        table=PageCheckpointStore(paper_id, "table").load(),
+    )
+
+
+@app.post("/reconcile_paper_index")
+async def reconcile_paper_index(request: Request) -> PaperIndexReconcileReport:
+    return await request.app.state.paper_index.reconcile()
+
+
+async def get_stored_artifact(
+    request: Request, paper_id: int, stage: str, path: str
+) -> Optional[Artifact]:
+    """
+    The stored summary or table of a paper, or None when there is none yet. One
+    the index knows about but that was removed from disk is marked missing.
+    """
+    if not request.app.state.paper_index.is_done(paper_id, stage):
+        return None
+    artifact = await request.app.state.artifact_cache.get(path)
+    if artifact is None:
+        request.app.state.paper_index.record_missing(paper_id, stage)
+    return artifact
+
+
+def get_not_modified_response(
+    request: Request, etag: str, headers: dict[str, str] = dict()
+) -> Optional[Response]:
+    if not is_etag_match(request.headers.get("If-None-Match"), etag):
+        return None
+    request.app.state.artifact_cache.record_not_modified()
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", **headers}
+    )
+
+
+def get_summary_response(request: Request, artifact: Artifact) -> Response:
+    # clients may keep the summary but must revalidate it, which costs a 304
+    not_modified_response = get_not_modified_response(request, artifact.etag)
+    if not_modified_response:
+        return not_modified_response
+    return Response(
+        content=json.dumps(artifact.content.decode("utf-8")),
+        media_type="application/json",
+        headers={"ETag": artifact.etag, "Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/get_paper_summary/{paper_id}")
-async def get_paper_summary(paper_id: int) -> str:
+async def get_paper_summary(paper_id: int, request: Request) -> str:
     try:
         # Define the path to the summary file
         summary_path = f"data/summaries/{paper_id}.md"
 
-        # Check if the file exists
-        if os.path.exists(summary_path):
-            # If the file exists, read and return its content
-            with open(summary_path, "r") as file:
-                return file.read()
+        # Serve the stored summary if the index has one
+        artifact = await get_stored_artifact(request, paper_id, "summary", summary_path)
+        if artifact is None:
+            # If the file doesn't exist, generate the summary, sharing any in-flight run
+            paper_summary = await run_while_connected(
+                request,
+                request.app.state.single_flight.do(
+                    f"summary:{paper_id}",
+                    generate_paper_summary,
+                    paper_id,
+                    summary_path,
+                    request.app.state.llm_client,
+                    request.app.state.pdf_processor,
+                    request.app.state.paper_index,
+                    request.app.state.artifact_store,
+                ),
+            )
+            artifact = await request.app.state.artifact_cache.get(summary_path)
+            if artifact is None:
+                return paper_summary
+        return get_summary_response(request, artifact)
+    except (HTTPException, DeadlineExceededException, ClientDisconnectedException):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_paper_summary_events(
+    paper_id: int,
+    summary_path: str,
+    llm_client: LLMClient,
+    pdf_processor: PdfProcessor,
+    single_flight: SingleFlight,
+    paper_index: PaperIndex,
+    artifact_store: ArtifactStore,
+    deadline: Optional[Deadline] = None,
+) -> AsyncIterator[str]:
+    # a disconnect cancels the response, and with it the page calls
+    current_deadline.set(deadline)
+    try:
+        paper_summary = read_paper_summary(paper_id, summary_path, paper_index)
+        if paper_summary is not None:
+            yield format_sse("final_summary", {"summary": paper_summary})
+            return
 
-        # If the file doesn't exist, generate the summary
-        paper_summary = await PaperSummariser(paper_id=paper_id).get_summary()
+        # a non-streaming request is already generating this summary, wait for it
+        if single_flight.get_in_flight(f"summary:{paper_id}"):
+            yield format_sse("waiting", {"paper_id": paper_id})
+            paper_summary = await single_flight.wait(f"summary:{paper_id}")
+            yield format_sse("final_summary", {"summary": paper_summary})
+            return
 
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+        # a worker of another process is generating it, wait for its summary
+        if artifact_store.is_claimed(paper_id, "summary"):
+            yield format_sse("waiting", {"paper_id": paper_id})
 
-        # Write the paper summary to the file
-        with open(summary_path, "w") as file:
-            file.write(paper_summary)
+        async with artifact_store.claim(paper_id, "summary"):
+            paper_summary = read_paper_summary(paper_id, summary_path, paper_index)
+            if paper_summary is not None:
+                yield format_sse("final_summary", {"summary": paper_summary})
+                return
 
-        return paper_summary
+            async for event, data in PaperSummariser(
+                paper_id=paper_id, llm_client=llm_client, pdf_processor=pdf_processor
+            ).stream_summary():
+                if event == "final_summary":
+                    # Write the paper summary to the file once, atomically
+                    write_file_atomic(summary_path, data["summary"])
+                    await paper_index.record_done(paper_id, "summary")
+                yield format_sse(event, data)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception(f"Failed to stream the summary of paper {paper_id}: {e}")
+        yield format_sse("error", {"detail": str(e)})
+
+
+@app.get("/get_paper_summary/{paper_id}/stream")
+async def stream_paper_summary(paper_id: int, request: Request) -> StreamingResponse:
+    """
+    Server-Sent Events variant of /get_paper_summary: chunk summaries are sent as
+    they complete, then the final summary token by token.
+    """
+    return StreamingResponse(
+        stream_paper_summary_events(
+            paper_id,
+            f"data/summaries/{paper_id}.md",
+            request.app.state.llm_client,
+            request.app.state.pdf_processor,
+            request.app.state.single_flight,
+            request.app.state.paper_index,
+            request.app.state.artifact_store,
+            get_request_deadline(request),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/get_primary_result_table/{paper_id}")
-async def get_primary_result_table(paper_id: int):
+async def get_primary_result_table(paper_id: int, request: Request):
     try:
         # Define the path to the table file
         table_path = f"data/extracted_tables/{paper_id}.csv"
 
-        # Check if the file exists
-        if os.path.exists(table_path):
-            # If the file exists, return its path
+        # Check if the index has the table
+        if request.app.state.paper_index.is_done(paper_id, "table"):
+            # If it does, return its path
             return table_path
 
-        # If the file doesn't exist, generate the table
-        table_path = await TableExtracter(paper_id=paper_id).get_primary_result_table()
-
-        return table_path
+        # If the file doesn't exist, generate the table, sharing any in-flight run
+        return await run_while_connected(
+            request,
+            request.app.state.single_flight.do(
+                f"table:{paper_id}",
+                generate_primary_result_table,
+                paper_id,
+                table_path,
+                request.app.state.llm_client,
+                request.app.state.pdf_processor,
+                request.app.state.paper_index,
+                request.app.state.artifact_store,
+                request.app.state.table_store,
+            ),
+        )
+    except (HTTPException, DeadlineExceededException, ClientDisconnectedException):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def iter_chunks(content: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(content), ARTIFACT_STREAM_CHUNK_SIZE):
+        yield content[start : start + ARTIFACT_STREAM_CHUNK_SIZE]
+
+
+@app.get("/get_primary_result_table/{paper_id}/csv")
+async def get_primary_result_table_csv(paper_id: int, request: Request) -> Response:
+    """
+    The primary result table itself, generated first if needed. It is gzipped
+    for clients that accept it, and answered with a 304 while unchanged.
+    """
+    table_path = await get_primary_result_table(paper_id, request)
+    artifact = await request.app.state.artifact_cache.get(table_path)
+    if artifact is None:
+        raise HTTPException(
+            status_code=404, detail=f"Table of paper {paper_id} not found"
+        )
+
+    content, etag = artifact.content, artifact.etag
+    headers = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(request.headers.get("Accept-Encoding")):
+        gzip_content = await request.app.state.artifact_cache.get_gzip_content(
+            table_path, artifact
+        )
+        if gzip_content is not None:
+            content, etag = gzip_content, artifact.gzip_etag
+            headers["Content-Encoding"] = "gzip"
+
+    not_modified_response = get_not_modified_response(request, etag, headers)
+    if not_modified_response:
+        return not_modified_response
+    return StreamingResponse(
+        iter_chunks(content),
+        media_type="text/csv",
+        headers={
+            **headers,
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Content-Length": str(len(content)),
+            "Content-Disposition": f'attachment; filename="{paper_id}.csv"',
+        },
+    )
+
+
+@app.get("/get_paper_summaries")
+async def get_paper_summaries(
+    request: Request, paper_ids: list[int] = Query()
+) -> GetPaperSummariesResponse:
+    """
+    Stored summaries of many papers in one round trip, answered with a 304 while
+    none of them changed. Summaries are never generated here.
+    """
+    if len(paper_ids) > MAX_BULK_SUMMARIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BULK_SUMMARIES} paper_ids per request, got {len(paper_ids)}",
+        )
+
+    paper_ids = list(dict.fromkeys(paper_ids))
+    artifacts = await asyncio.gather(
+        *[
+            get_stored_artifact(
+                request, paper_id, "summary", f"data/summaries/{paper_id}.md"
+            )
+            for paper_id in paper_ids
+        ]
+    )
+    # the response only changes when a summary does or a missing one appears
+    etag = hashlib.sha256(
+        ",".join(
+            f"{paper_id}:{artifact.etag if artifact else ''}"
+            for paper_id, artifact in zip(paper_ids, artifacts)
+        ).encode()
+    ).hexdigest()[:32]
+    etag = f'"{etag}"'
+    not_modified_response = get_not_modified_response(request, etag)
+    if not_modified_response:
+        return not_modified_response
+
+    paper_summaries = GetPaperSummariesResponse(
+        summaries={
+            paper_id: artifact.content.decode("utf-8")
+            for paper_id, artifact in zip(paper_ids, artifacts)
+            if artifact
+        },
+        missing=[
+            paper_id
+            for paper_id, artifact in zip(paper_ids, artifacts)
+            if artifact is None
+        ],
+    )
+    return Response(
+        content=paper_summaries.model_dump_json(),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/query_tables")
+async def query_tables(
+    request: Request,
+    paper_ids: list[int] = Query([]),
+    column: Optional[str] = None,
+    row_label: Optional[str] = None,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    numeric_only: bool = False,
+    fields: list[str] = Query(list(TABLE_FIELDS)),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(TABLE_QUERY_PAGE_SIZE, ge=1, le=TABLE_QUERY_MAX_ROWS),
+) -> QueryTablesResponse:
+    """
+    Cells of the extracted result tables of every paper, one row per cell,
+    filtered by paper, column name, row label and numeric range and projected
+    onto fields. Served from the table store, no CSV is read.
+    """
+    unknown_fields = set(fields) - set(TABLE_FIELDS)
+    if unknown_fields:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields {sorted(unknown_fields)}, expected some of {list(TABLE_FIELDS)}",
+        )
+
+    started_at = time.monotonic()
+    rows, total, papers = await asyncio.to_thread(
+        request.app.state.table_store.query,
+        paper_ids=paper_ids,
+        column=column,
+        row_label=row_label,
+        min_value=min_value,
+        max_value=max_value,
+        numeric_only=numeric_only,
+        fields=tuple(fields),
+        offset=offset,
+        limit=limit,
+    )
+    return QueryTablesResponse(
+        rows=rows,
+        total=total,
+        papers=papers,
+        next_offset=offset + limit if offset + limit < total else None,
+        elapsed_ms=round((time.monotonic() - started_at) * 1000, 3),
+    )
+
+
+@app.get("/get_table_store_stats")
+async def get_table_store_stats(request: Request) -> GetTableStoreStatsResponse:
+    return GetTableStoreStatsResponse(
+        store=await asyncio.to_thread(request.app.state.table_store.get_stats)
+    )
+
+
+@app.post("/compact_table_store")
+async def compact_table_store(request: Request) -> TableStoreCompactionReport:
+    return await request.app.state.table_store.compact(request.app.state.paper_index)
+
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str,
+    kind: Optional[SearchDocumentKind] = None,
+    paper_ids: list[int] = Query([]),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+) -> SearchResponse:
+    """
+    Pages and summaries containing every word of q ("quoted words" as a phrase),
+    best BM25 match first, with the page number and a snippet of each. Words
+    too common to rank by are left out and listed in common_terms.
+    """
+    if not get_search_terms(q):
+        raise HTTPException(status_code=400, detail="Query has no words to search")
+    if len(paper_ids) > SEARCH_MAX_PAPER_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {SEARCH_MAX_PAPER_IDS} paper_ids per search, got {len(paper_ids)}",
+        )
+
+    started_at = time.monotonic()
+    hits, common_terms, ranked = await asyncio.to_thread(
+        request.app.state.search_index.search,
+        q,
+        kind=kind,
+        paper_ids=paper_ids,
+        offset=offset,
+        limit=limit,
+    )
+    return SearchResponse(
+        hits=hits,
+        common_terms=common_terms,
+        ranked=ranked,
+        next_offset=offset + limit if len(hits) == limit else None,
+        elapsed_ms=round((time.monotonic() - started_at) * 1000, 3),
+    )
+
+
+@app.get("/get_search_index_stats")
+async def get_search_index_stats(request: Request) -> GetSearchIndexStatsResponse:
+    return GetSearchIndexStatsResponse(
+        index=await asyncio.to_thread(request.app.state.search_index.get_stats)
+    )
+
+
+@app.post("/update_search_index")
+async def update_search_index(request: Request) -> SearchIndexUpdateReport:
+    return await request.app.state.search_index.update(
+        request.app.state.paper_index, request.app.state.pdf_processor
+    )
+
+
+@app.get("/analyze/{paper_id}")
+async def analyze_paper(paper_id: int, request: Request) -> AnalyzePaperResponse:
+    """
+    Summary and primary result table together, both stages running at once. The
+    summary's text extraction and the table scan are separate passes over the
+    PDF, sharing the worker processes' open documents and the page store. A
+    stage that fails is reported in stages, the request only fails if both do.
+    """
+    if not request.app.state.paper_index.is_done(paper_id, "download"):
+        raise HTTPException(status_code=404, detail=f"Paper {paper_id} not downloaded")
+
+    analysis = await run_while_connected(
+        request,
+        analyse_paper(
+            paper_id,
+            request.app.state.llm_client,
+            request.app.state.pdf_processor,
+            request.app.state.single_flight,
+            request.app.state.paper_index,
+            request.app.state.artifact_store,
+            request.app.state.table_store,
+        ),
+    )
+    if analysis.summary is None and analysis.table_path is None:
+        raise HTTPException(
+            status_code=500,
+            detail=f"{analysis.stages['summary'].error}; {analysis.stages['table'].error}",
+        )
+    return analysis
+
+
+@app.get("/get_table_candidates/{paper_id}")
+async def get_table_candidates(
+    paper_id: int, request: Request, threshold: float = TABLE_CANDIDATE_THRESHOLD
+) -> GetTableCandidatesResponse:
+    paper_path = f"data/downloaded_papers/{paper_id}.pdf"
+    if not request.app.state.paper_index.is_done(paper_id, "download"):
+        raise HTTPException(status_code=404, detail=f"Paper {paper_id} not downloaded")
+
+    table_candidates = await request.app.state.pdf_processor.score_table_candidates(
+        paper_path, threshold
+    )
+    return GetTableCandidatesResponse(
+        paper_id=paper_id, threshold=threshold, pages=table_candidates
+    )
+
+
+@app.post("/trigger_bulk_analysis")
+async def trigger_bulk_analysis(
+    trigger_bulk_analysis_request: TriggerBulkAnalysisRequest, request: Request
+) -> BulkAnalysisReport:
+    if trigger_bulk_analysis_request.paper_ids:
+        papers = [
+            Paper(
+                paper_id=paper_id,
+                paper_url=f"https://pubmed.ncbi.nlm.nih.gov/{paper_id}",
+            )
+            for paper_id in trigger_bulk_analysis_request.paper_ids
+        ]
+    else:
+        papers = read_paper_links("data/pubmed_paper_links.txt")
+
+    # only pass the concurrency overrides that were set, the rest use the defaults
+    concurrency = trigger_bulk_analysis_request.model_dump(
+        exclude={"paper_ids"}, exclude_none=True
+    )
+    pipeline = AnalysisPipeline(
+        papers=papers,
+        download_scheduler=request.app.state.download_scheduler,
+        llm_client=request.app.state.llm_client,
+        pdf_processor=request.app.state.pdf_processor,
+        single_flight=request.app.state.single_flight,
+        paper_index=request.app.state.paper_index,
+        artifact_store=request.app.state.artifact_store,
+        table_store=request.app.state.table_store,
+        **concurrency,
+    )
+    prune_finished_pipelines(request.app.state.pipelines)
+    request.app.state.pipelines[pipeline.run_id] = pipeline
+
+    pipeline_task = asyncio.create_task(pipeline.run())
+    request.app.state.pipeline_tasks.add(pipeline_task)
+    pipeline_task.add_done_callback(request.app.state.pipeline_tasks.discard)
+    return pipeline.get_report()
+
+
+@app.get("/get_bulk_analysis/{run_id}")
+async def get_bulk_analysis(run_id: str, request: Request) -> BulkAnalysisReport:
+    pipeline = request.app.state.pipelines.get(run_id)
+    if not pipeline:
+        raise HTTPException(status_code=404, detail=f"Bulk analysis {run_id} not found")
+    return pipeline.get_report()
+
+
+@app.get("/get_client_pool_stats")
+async def get_client_pool_stats(request: Request) -> GetClientPoolStatsResponse:
+    return GetClientPoolStatsResponse(
+        pools=request.app.state.client_registry.get_pool_stats()
+    )
+
+
+@app.get("/get_llm_cache_stats")
+async def get_llm_cache_stats(request: Request) -> GetLLMCacheStatsResponse:
+    return GetLLMCacheStatsResponse(
+        cache=request.app.state.llm_client.llm_cache.get_stats()
+    )
+
+
+@app.get("/get_artifact_cache_stats")
+async def get_artifact_cache_stats(request: Request) -> GetArtifactCacheStatsResponse:
+    return GetArtifactCacheStatsResponse(
+        cache=request.app.state.artifact_cache.get_stats()
+    )
+
+
+@app.get("/get_llm_limiter_stats")
+async def get_llm_limiter_stats(request: Request) -> GetLLMLimiterStatsResponse:
+    return GetLLMLimiterStatsResponse(models=request.app.state.llm_limiter.get_stats())
+
+
+@app.get("/get_single_flight_stats")
+async def get_single_flight_stats(request: Request) -> GetSingleFlightStatsResponse:
+    return GetSingleFlightStatsResponse(
+        single_flight=request.app.state.single_flight.get_stats()
+    )
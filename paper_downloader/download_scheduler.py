@@ -0,0 +1,250 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import Optional
+import uuid
+
+import httpx
+
+from db.api_models import GetDownloadJobResponse, PaperDownloadStatusResponse
+from db.artifact_store import ArtifactStore
+from db.models import DownloadJob, DownloadStatus, Paper, PaperDownloadStatus
+from db.paper_index import PaperIndex
+from paper_downloader.paper_downloader import PaperDownloader
+from paper_downloader.rate_limiter import HostRateLimiter
+from utils.const import (
+    DOWNLOAD_JOB_TTL_SECONDS,
+    MAX_CONCURRENT_DOWNLOAD_TASK,
+    MAX_FINISHED_DOWNLOAD_JOBS,
+)
+from utils.metrics import DOWNLOAD_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class DownloadScheduler:
+    """
+    Long-lived download queue running on the application's event loop.
+
+    A fixed pool of workers drains a single queue, so MAX_CONCURRENT_DOWNLOAD_TASK
+    is a global limit no matter how many triggers overlap. A paper that is already
+    queued or running is never queued twice. Callers that need a paper before
+    going on, like the bulk analysis pipeline, await download() and so share
+    the same limit. Finished jobs are dropped after
+    job_ttl_seconds or past max_finished_jobs, with the paper statuses that no
+    remaining job refers to, so a long-running server does not keep every
+    download it ever made.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        paper_index: PaperIndex,
+        artifact_store: ArtifactStore,
+        max_concurrent_downloads: int = MAX_CONCURRENT_DOWNLOAD_TASK,
+        job_ttl_seconds: float = DOWNLOAD_JOB_TTL_SECONDS,
+        max_finished_jobs: int = MAX_FINISHED_DOWNLOAD_JOBS,
+    ):
+        self.client = client
+        self.paper_index = paper_index
+        self.artifact_store = artifact_store
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.job_ttl_seconds = job_ttl_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self.queue: asyncio.Queue[Paper] = asyncio.Queue()
+        self.jobs: dict[str, DownloadJob] = dict()
+        self.paper_statuses: dict[int, PaperDownloadStatus] = dict()
+        # futures of the callers awaiting a paper, resolved when its download ends
+        self.waiters: dict[int, list[asyncio.Future[None]]] = dict()
+        self.workers: list[asyncio.Task[None]] = list()
+        self.rate_limiter: Optional[HostRateLimiter] = None
+        self.downloader: Optional[PaperDownloader] = None
+
+    async def start(self) -> None:
+        self.rate_limiter = HostRateLimiter()
+        self.downloader = PaperDownloader(
+            client=self.client,
+            rate_limiter=self.rate_limiter,
+            paper_index=self.paper_index,
+            artifact_store=self.artifact_store,
+        )
+        self.workers = [
+            asyncio.create_task(self.worker(), name=f"download-worker-{i}")
+            for i in range(self.max_concurrent_downloads)
+        ]
+        logger.info(
+            f"Download scheduler started with {self.max_concurrent_downloads} workers"
+        )
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = list()
+        logger.info("Download scheduler stopped")
+
+    def get_finished_at(self, job: DownloadJob) -> Optional[datetime]:
+        """
+        When the last paper of the job finished, None while any is queued or running.
+        """
+        finished_at = job.created_at
+        for paper_id in job.paper_ids:
+            paper_status = self.paper_statuses[paper_id]
+            if paper_status.finished_at is None:
+                return None
+            finished_at = max(finished_at, paper_status.finished_at)
+        return finished_at
+
+    def prune(self) -> None:
+        expires_before = utc_now() - timedelta(seconds=self.job_ttl_seconds)
+        finished_jobs = sorted(
+            (finished_at, job_id)
+            for job_id, job in self.jobs.items()
+            if (finished_at := self.get_finished_at(job)) is not None
+        )
+        expired_count = sum(
+            finished_at < expires_before for finished_at, _ in finished_jobs
+        )
+        # oldest first, expired ones and then any past the cap
+        drop_count = max(expired_count, len(finished_jobs) - self.max_finished_jobs)
+        if not drop_count:
+            return
+        for _, job_id in finished_jobs[:drop_count]:
+            del self.jobs[job_id]
+
+        kept_paper_ids = {
+            paper_id for job in self.jobs.values() for paper_id in job.paper_ids
+        }
+        for paper_id in list(self.paper_statuses):
+            if paper_id not in kept_paper_ids:
+                del self.paper_statuses[paper_id]
+        logger.info(f"Dropped {drop_count} finished download jobs")
+
+    def submit(self, papers: list[Paper]) -> DownloadJob:
+        self.prune()
+        job = DownloadJob(job_id=uuid.uuid4().hex, created_at=utc_now())
+        self.jobs[job.job_id] = job
+
+        for paper in papers:
+            if paper.paper_id in job.paper_ids:
+                continue
+            job.paper_ids.append(paper.paper_id)
+
+            paper_status = self.paper_statuses.get(paper.paper_id)
+            if paper_status and paper_status.status in (
+                DownloadStatus.QUEUED,
+                DownloadStatus.RUNNING,
+            ):
+                # Already queued or in flight, the job just tracks the existing entry
+                continue
+
+            now = utc_now()
+            if self.paper_index.is_done(paper.paper_id, "download"):
+                self.paper_statuses[paper.paper_id] = PaperDownloadStatus(
+                    paper_id=paper.paper_id,
+                    paper_url=paper.paper_url,
+                    status=DownloadStatus.DONE,
+                    queued_at=now,
+                    started_at=now,
+                    finished_at=now,
+                )
+                continue
+
+            self.paper_statuses[paper.paper_id] = PaperDownloadStatus(
+                paper_id=paper.paper_id, paper_url=paper.paper_url, queued_at=now
+            )
+            self.queue.put_nowait(paper)
+
+        logger.info(
+            f"Download job {job.job_id} submitted with {len(job.paper_ids)} papers"
+        )
+        return job
+
+    async def download(self, paper: Paper) -> None:
+        """
+        Queue the paper like submit and wait for a worker to download it, raising
+        the download's error if it fails.
+        """
+        self.submit([paper])
+        paper_status = self.paper_statuses[paper.paper_id]
+        if paper_status.status == DownloadStatus.DONE:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(paper.paper_id, list()).append(future)
+        await future
+
+    def resolve_waiters(self, paper_id: int, error: Optional[Exception]) -> None:
+        for future in self.waiters.pop(paper_id, list()):
+            if future.done():
+                # the waiter was cancelled
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+    async def worker(self) -> None:
+        while True:
+            paper = await self.queue.get()
+            paper_status = self.paper_statuses[paper.paper_id]
+            paper_status.status = DownloadStatus.RUNNING
+            paper_status.started_at = utc_now()
+            DOWNLOAD_QUEUE_WAIT_SECONDS.observe(paper_status.wait_seconds)
+            error = None
+            try:
+                await self.downloader.download(paper)
+                paper_status.status = DownloadStatus.DONE
+            except Exception as e:
+                error = e
+                paper_status.status = DownloadStatus.FAILED
+                paper_status.error = str(e)
+            finally:
+                paper_status.finished_at = utc_now()
+                self.queue.task_done()
+            self.resolve_waiters(paper.paper_id, error)
+
+    def get_paper_status(self, paper_id: int) -> Optional[PaperDownloadStatusResponse]:
+        paper_status = self.paper_statuses.get(paper_id)
+        if not paper_status:
+            return None
+        return PaperDownloadStatusResponse(
+            **paper_status.model_dump(),
+            wait_seconds=paper_status.wait_seconds,
+            run_seconds=paper_status.run_seconds,
+        )
+
+    def get_job(self, job_id: str) -> Optional[GetDownloadJobResponse]:
+        job = self.jobs.get(job_id)
+        if not job:
+            return None
+
+        papers = [self.get_paper_status(paper_id) for paper_id in job.paper_ids]
+        status_counts = {status: 0 for status in DownloadStatus}
+        for paper in papers:
+            status_counts[paper.status] += 1
+
+        if status_counts[DownloadStatus.RUNNING]:
+            job_status = DownloadStatus.RUNNING
+        elif status_counts[DownloadStatus.QUEUED]:
+            job_status = DownloadStatus.QUEUED
+        elif status_counts[DownloadStatus.FAILED]:
+            job_status = DownloadStatus.FAILED
+        else:
+            job_status = DownloadStatus.DONE
+
+        finished_at = None
+        if job_status in (DownloadStatus.DONE, DownloadStatus.FAILED) and papers:
+            finished_at = max(paper.finished_at for paper in papers)
+
+        return GetDownloadJobResponse(
+            job_id=job.job_id,
+            status=job_status,
+            created_at=job.created_at,
+            finished_at=finished_at,
+            status_counts=status_counts,
+            papers=papers,
+        )
@@ -1,22 +1,46 @@
-import asyncio
 import logging
 import os
+import time
+
 import backoff
 from bs4 import BeautifulSoup
 from fastapi import status
 import httpx
 
+from db.artifact_store import ArtifactStore
 from db.models import Paper
-from utils.const import MAX_CONCURRENT_DOWNLOAD_TASK
-from utils.exception import TooManyRequestsException
-from utils.util import get_paper_id, schedule_task
+from db.paper_index import PaperIndex
+from paper_downloader.rate_limiter import HostRateLimiter
+from utils.const import MAX_HOP_RETRIES, PDF_CONTENT_TYPES, PDF_DOWNLOAD_CHUNK_SIZE
+from utils.exception import (
+    StalePartialDownloadException,
+    TooManyRequestsException,
+)
+from utils.metrics import (
+    DOWNLOAD_BYTES,
+    DOWNLOAD_HOP_SECONDS,
+    DOWNLOAD_RATE_LIMIT_WAIT_SECONDS,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_THROTTLED,
+    PAPER_STAGE_SECONDS,
+)
+from utils.util import parse_retry_after
 
 logger = logging.getLogger(__name__)
 
 
 class PaperDownloader:
-    def __init__(self, papers: list[Paper]):
-        self.papers = papers
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        rate_limiter: HostRateLimiter,
+        paper_index: PaperIndex,
+        artifact_store: ArtifactStore,
+    ):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.paper_index = paper_index
+        self.artifact_store = artifact_store
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36"
         }
@@ -49,25 +73,55 @@ class PaperDownloader:
             raise Exception("PDF URL not found in the page.")
         return pdf_url
 
-    async def fetch_pdf_download_link(self, client: httpx.AsyncClient, url: str) -> str:
-        response = await client.get(url, follow_redirects=True, headers=self.headers)
+    @backoff.on_exception(
+        backoff.expo,  # Exponential backoff
+        TooManyRequestsException,  # Retry on TooManyRequestsException
+        max_tries=MAX_HOP_RETRIES,  # Retry each hop on its own
+        on_backoff=lambda details: DOWNLOAD_RETRIES.labels("page").inc(),
+        on_giveup=lambda details: logger.error(
+            f"retry give up after {MAX_HOP_RETRIES} retries: {details['exception']}"
+        ),
+    )
+    async def fetch(self, url: str) -> httpx.Response:
+        """
+        Fetch a single hop through the per-host rate limiter.
+        429s and 503s feed back into the host's bucket (honouring Retry-After)
+        and only this hop is retried.
+        """
+        host = httpx.URL(url).host
+        with DOWNLOAD_RATE_LIMIT_WAIT_SECONDS.labels(host).time():
+            await self.rate_limiter.acquire(host)
+
+        with DOWNLOAD_HOP_SECONDS.labels(host, "page").time():
+            response = await self.client.get(
+                url, follow_redirects=True, headers=self.headers
+            )
+        self.check_throttled(host, url, response)
+        return response
+
+    def check_throttled(self, host: str, url: str, response: httpx.Response) -> None:
+        if response.status_code in (
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+        ):
+            DOWNLOAD_THROTTLED.labels(host, str(response.status_code)).inc()
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.on_throttle(host, retry_after)
+            raise TooManyRequestsException(url=url, retry_after=retry_after)
+
+        self.rate_limiter.on_success(host)
+
+    async def fetch_pdf_download_link(self, url: str) -> str:
+        response = await self.fetch(url)
         if response.status_code != status.HTTP_200_OK:
-            if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
-                raise TooManyRequestsException()
             raise Exception(
                 f"Failed to fetch the page url: {url}, {response.status_code}"
             )
 
         full_text_pdf_link = PaperDownloader.get_full_text_pdf_link(response.text)
 
-        response = await client.get(
-            url=full_text_pdf_link,
-            follow_redirects=True,
-            headers=self.headers,
-        )
+        response = await self.fetch(full_text_pdf_link)
         if response.status_code != status.HTTP_200_OK:
-            if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
-                raise TooManyRequestsException()
             raise Exception(
                 f"Failed to fetch the full text page: {full_text_pdf_link}, {response.status_code}"
             )
@@ -76,55 +130,121 @@ class PaperDownloader:
         return pdf_url
 
     @backoff.on_exception(
-        backoff.expo,  # Exponential backoff
-        TooManyRequestsException,  # Retry on TooManyRequestsException
-        max_tries=5,  # Retry up to 5 times
+        backoff.expo,
+        # a dropped connection keeps the partial file and resumes with a Range request,
+        # a stale partial file is removed and the retry starts over from byte 0
+        (
+            TooManyRequestsException,
+            httpx.TransportError,
+            StalePartialDownloadException,
+        ),
+        max_tries=MAX_HOP_RETRIES,
+        on_backoff=lambda details: DOWNLOAD_RETRIES.labels("pdf").inc(),
         on_giveup=lambda details: logger.error(
-            f"retry give up after 5 retries: {details['exception']}"
-        ),  # Log error after 5 retries
+            f"retry give up after {MAX_HOP_RETRIES} retries: {details['exception']}"
+        ),
     )
-    async def download_helper(
-        self, client: httpx.AsyncClient, paper_url: str, save_path: str
-    ) -> None:
-        try:
-            download_link = await self.fetch_pdf_download_link(client, paper_url)
-
-            response = await client.get(
-                url=download_link, follow_redirects=True, headers=self.headers
-            )
-            if response.status_code != status.HTTP_200_OK:
-                if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
-                    raise TooManyRequestsException()
+    async def download_pdf(self, download_link: str, save_path: str) -> None:
+        """
+        Stream the PDF into a `.part` file next to save_path and atomically rename
+        it once it is complete and looks like a PDF, so a truncated or HTML file
+        never lands at save_path.
+        """
+        part_path = f"{save_path}.part"
+        # Ensure the directory exists
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+        headers = dict(self.headers)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+
+        host = httpx.URL(download_link).host
+        with DOWNLOAD_RATE_LIMIT_WAIT_SECONDS.labels(host).time():
+            await self.rate_limiter.acquire(host)
+
+        started_at = time.monotonic()
+        async with self.client.stream(
+            "GET", download_link, follow_redirects=True, headers=headers
+        ) as response:
+            if response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE:
+                # the partial file is not usable against this resource, start over
+                os.remove(part_path)
+                raise StalePartialDownloadException(download_link)
+            self.check_throttled(host, download_link, response)
+
+            if response.status_code == status.HTTP_206_PARTIAL_CONTENT:
+                if not response.headers.get("Content-Range", "").startswith(
+                    f"bytes {offset}-"
+                ):
+                    # not a continuation of the partial file, every retry would
+                    # send the same Range again, so drop it and start over
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    raise StalePartialDownloadException(download_link)
+                logger.info(f"Resuming download of {download_link} from byte {offset}")
+                file_mode = "ab"
+            elif response.status_code == status.HTTP_200_OK:
+                file_mode = "wb"
+            else:
                 raise Exception(
                     f"Failed to download the PDF from: {download_link}, {response.status_code}"
                 )
 
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            content_type = response.headers.get("Content-Type", "").split(";")[0]
+            if content_type and content_type.strip().lower() not in PDF_CONTENT_TYPES:
+                raise Exception(
+                    f"Unexpected content type {content_type} for PDF: {download_link}"
+                )
 
-            # Write the PDF content to a file
-            with open(save_path, "wb") as pdf_file:
-                pdf_file.write(response.content)
-        except Exception as e:
-            logger.error(
-                f"An error occurred while downloading the paper from {paper_url}: {e}"
+            # Write the PDF content to the partial file chunk by chunk
+            with open(part_path, file_mode) as pdf_file:
+                async for chunk in response.aiter_bytes(PDF_DOWNLOAD_CHUNK_SIZE):
+                    pdf_file.write(chunk)
+                    DOWNLOAD_BYTES.labels(host).inc(len(chunk))
+        DOWNLOAD_HOP_SECONDS.labels(host, "pdf").observe(time.monotonic() - started_at)
+
+        with open(part_path, "rb") as pdf_file:
+            magic = pdf_file.read(5)
+        if magic != b"%PDF-":
+            os.remove(part_path)
+            raise Exception(f"Downloaded file is not a PDF: {download_link}")
+
+        os.replace(part_path, save_path)
+
+    async def download_helper(self, paper_url: str, save_path: str) -> None:
+        download_link = await self.fetch_pdf_download_link(paper_url)
+        await self.download_pdf(download_link, save_path)
+
+    async def download(self, paper: Paper) -> None:
+        """
+        Download a single paper into data/downloaded_papers, raising on failure.
+        Concurrency across papers is owned by the DownloadScheduler, and the
+        artifact claim keeps workers of other processes off the same .part file.
+        """
+        save_path = self.artifact_store.get_path(paper.paper_id, "download")
+        async with self.artifact_store.claim(paper.paper_id, "download"):
+            # another worker may have downloaded it while this one waited
+            if self.paper_index.is_done(paper.paper_id, "download"):
+                return
+
+            started_at = time.monotonic()
+            try:
+                await self.download_helper(paper.paper_url, save_path)
+            except Exception as e:
+                PAPER_STAGE_SECONDS.labels("download", "failed").observe(
+                    time.monotonic() - started_at
+                )
+                logger.error(
+                    f"An error occurred while downloading the paper from {paper.paper_url}: {e}"
+                )
+                self.paper_index.record_failed(
+                    paper.paper_id, "download", str(e), paper_url=paper.paper_url
+                )
+                raise
+            PAPER_STAGE_SECONDS.labels("download", "done").observe(
+                time.monotonic() - started_at
+            )
+            await self.paper_index.record_done(
+                paper.paper_id, "download", paper_url=paper.paper_url
             )
-
-    async def download(self):
-        async with httpx.AsyncClient(timeout=httpx.Timeout(30)) as client:
-            # could not leverage concurrent calls here as i was getting 429 error code, therefore MAX_CONCURRENT_DOWNLOAD_TASK value is 1
-            semaphore = asyncio.Semaphore(value=MAX_CONCURRENT_DOWNLOAD_TASK)
-            tasks: dict[str, asyncio.Task[str]] = dict()
-            async with asyncio.TaskGroup() as tg:
-                for paper in self.papers:
-                    save_path = f"data/downloaded_papers/{paper.paper_id}.pdf"
-                    if not os.path.exists(save_path):
-                        tasks[save_path] = tg.create_task(
-                            schedule_task(
-                                semaphore,
-                                self.download_helper,
-                                client,
-                                paper.paper_url,
-                                save_path,
-                            )
-                        )
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from typing import Optional
+
+from utils.const import (
+    DEFAULT_HOST_RATE_LIMIT,
+    HOST_RATE_ADDITIVE_INCREASE,
+    HOST_RATE_BURST,
+    HOST_RATE_LIMITS,
+    HOST_RATE_MULTIPLICATIVE_DECREASE,
+    MIN_HOST_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate is tuned with AIMD: it creeps up additively
+    after each success and is cut multiplicatively when the host throttles us.
+    """
+
+    def __init__(self, host: str, rate: float, max_rate: float):
+        self.host = host
+        self.rate = rate
+        self.max_rate = max_rate
+        self.capacity = HOST_RATE_BURST
+        self.tokens = float(HOST_RATE_BURST)
+        self.updated_at = asyncio.get_running_loop().time()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        # the lock makes waiters take tokens in FIFO order
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self.refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self) -> None:
+        self.rate = min(self.max_rate, self.rate + HOST_RATE_ADDITIVE_INCREASE)
+
+    def on_throttle(self, retry_after: Optional[float]) -> None:
+        now = asyncio.get_running_loop().time()
+        self.refill(now)
+        self.rate = max(MIN_HOST_RATE, self.rate * HOST_RATE_MULTIPLICATIVE_DECREASE)
+        self.tokens = 0.0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+        logger.warning(
+            f"Throttled by {self.host}, rate lowered to {self.rate:.2f} req/s, retry after: {retry_after}"
+        )
+
+
+class HostRateLimiter:
+    """
+    One TokenBucket per host so a slow publisher never holds back PubMed or PMC.
+    """
+
+    def __init__(
+        self,
+        host_rate_limits: dict[str, tuple[float, float]] = HOST_RATE_LIMITS,
+        default_rate_limit: tuple[float, float] = DEFAULT_HOST_RATE_LIMIT,
+    ):
+        self.host_rate_limits = host_rate_limits
+        self.default_rate_limit = default_rate_limit
+        self.buckets: dict[str, TokenBucket] = dict()
+
+    def get_rate_limit(self, host: str) -> tuple[float, float]:
+        for domain, rate_limit in self.host_rate_limits.items():
+            if host == domain or host.endswith(f".{domain}"):
+                return rate_limit
+        return self.default_rate_limit
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        if host not in self.buckets:
+            rate, max_rate = self.get_rate_limit(host)
+            self.buckets[host] = TokenBucket(host=host, rate=rate, max_rate=max_rate)
+        return self.buckets[host]
+
+    async def acquire(self, host: str) -> None:
+        await self.get_bucket(host).acquire()
+
+    def on_success(self, host: str) -> None:
+        self.get_bucket(host).on_success()
+
+    def on_throttle(self, host: str, retry_after: Optional[float] = None) -> None:
+        self.get_bucket(host).on_throttle(retry_after)
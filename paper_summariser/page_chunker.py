@@ -0,0 +1,110 @@
+import logging
+import math
+import re
+
+from db.models import PageChunk
+from utils.const import (
+    SUMMARY_CHUNK_TOKEN_BUDGET,
+    SUMMARY_MAX_CHUNKS,
+    SUMMARY_MIN_PAGE_TOKENS,
+)
+from utils.util import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+BACK_MATTER_HEADING_PATTERN = re.compile(
+    r"^\s*(references|bibliography|literature cited|acknowledge?ments?|funding"
+    r"|conflicts? of interest|author contributions|data availability(?: statement)?)"
+    r"\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def strip_back_matter(page_texts: list[str]) -> list[str]:
+    """
+    Drop everything from the first back-matter heading (references,
+    acknowledgements, funding, ...) in the second half of the paper onwards.
+    Headings in the first half are ignored, they are usually table headers or
+    journal sidebars rather than the start of the back matter.
+    """
+    for page_index, page_text in enumerate(page_texts):
+        if page_index + 1 <= len(page_texts) / 2:
+            continue
+        match = BACK_MATTER_HEADING_PATTERN.search(page_text)
+        if match:
+            logger.info(
+                f"Back matter '{match.group(1)}' starts on page {page_index + 1}, skipping the rest"
+            )
+            return page_texts[:page_index] + [page_text[: match.start()]] + [
+                "" for _ in page_texts[page_index + 1 :]
+            ]
+    return page_texts
+
+
+def pack_chunks(
+    page_texts: list[str], token_budget: int, min_page_tokens: int
+) -> list[PageChunk]:
+    page_chunks: list[PageChunk] = list()
+    page_numbers: list[int] = list()
+    texts: list[str] = list()
+    token_count = 0
+
+    def flush() -> None:
+        nonlocal page_numbers, texts, token_count
+        if page_numbers:
+            page_chunks.append(
+                PageChunk(
+                    page_numbers=page_numbers,
+                    text="\n\n".join(texts),
+                    token_count=token_count,
+                )
+            )
+        page_numbers, texts, token_count = list(), list(), 0
+
+    for page_index, page_text in enumerate(page_texts):
+        page_text = page_text.strip()
+        page_tokens = estimate_tokens(page_text)
+        if page_tokens < min_page_tokens:
+            continue
+        if page_tokens > token_budget:
+            # a single oversized page is truncated to the budget
+            page_text = page_text[: token_budget * 4]
+            page_tokens = token_budget
+
+        if token_count + page_tokens > token_budget:
+            flush()
+        page_numbers.append(page_index + 1)
+        texts.append(f"[Page {page_index + 1}]\n{page_text}")
+        token_count += page_tokens
+    flush()
+
+    return page_chunks
+
+
+def pack_pages(
+    page_texts: list[str],
+    token_budget: int = SUMMARY_CHUNK_TOKEN_BUDGET,
+    max_chunks: int = SUMMARY_MAX_CHUNKS,
+) -> list[PageChunk]:
+    """
+    Pack consecutive pages into chunks of at most token_budget tokens, skipping
+    back matter and near-empty pages. The budget grows for very long papers so
+    there are never more than max_chunks chunks. If every page would be skipped,
+    all pages with any text are packed instead.
+    """
+    packed_texts = strip_back_matter(page_texts)
+    min_page_tokens = SUMMARY_MIN_PAGE_TOKENS
+    total_tokens = sum(estimate_tokens(page_text) for page_text in packed_texts)
+    token_budget = max(token_budget, math.ceil(total_tokens / max_chunks))
+
+    page_chunks = pack_chunks(packed_texts, token_budget, min_page_tokens)
+    if not page_chunks:
+        # every page is near-empty or back matter, summarise whatever text there is
+        packed_texts, min_page_tokens = page_texts, 1
+        page_chunks = pack_chunks(packed_texts, token_budget, min_page_tokens)
+
+    # skipped pages and chunk boundaries waste budget, grow it until the cap holds
+    while len(page_chunks) > max_chunks:
+        token_budget = math.ceil(token_budget * len(page_chunks) / max_chunks)
+        page_chunks = pack_chunks(packed_texts, token_budget, min_page_tokens)
+    return page_chunks
@@ -1,36 +1,58 @@
 import asyncio
 import logging
-from openai import AsyncOpenAI
-import pymupdf
+import re
+import time
+from typing import AsyncIterator, Optional
 
-from config import OPENAI_APIKEY
-from utils.const import MAX_CONCURRENT_PAGE_SUMMARISATION_TASK
-from utils.util import schedule_task
+from db.artifact_store import ArtifactStore
+from db.models import LLMPriority, PageChunk
+from db.page_checkpoints import PageCheckpointStore
+from db.paper_index import PaperIndex
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_client import LLMClient
+from paper_summariser.page_chunker import pack_pages
+from pdf_processor.pdf_processor import PdfProcessor
+from utils.const import SUMMARY_REDUCE_TOKEN_BUDGET
+from utils.metrics import PAPER_STAGE_SECONDS
+from utils.util import estimate_tokens, write_file_atomic
 
 logger = logging.getLogger(__name__)
 
 
 class PaperSummariser:
-    def __init__(self, paper_id: int):
+    """
+    LLM calls are made at priority and all run at once; the process-wide
+    LLMLimiter decides how many are in flight. Chunk summaries are checkpointed,
+    so a rerun only summarises the chunks that failed or changed.
+    """
+
+    def __init__(
+        self,
+        paper_id: int,
+        # None when only the request builders are used, as by the batch pipeline
+        llm_client: Optional[LLMClient],
+        pdf_processor: PdfProcessor,
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+    ):
         self.paper_id = paper_id
+        self.llm_client = llm_client
+        self.pdf_processor = pdf_processor
+        self.priority = priority
         self.paper_path = f"data/downloaded_papers/{paper_id}.pdf"
+        self.checkpoints = PageCheckpointStore(paper_id, "summary")
 
-    async def get_final_summary(self, pdf_page_summaries: str) -> str:
-        try:
-            combined_summaries = "\n\n".join(
-                f"Page {i + 1}: {summary}"
-                for i, summary in enumerate(pdf_page_summaries)
-            )
+    def get_final_summary_params(self, pdf_page_summaries: list[str]) -> dict:
+        combined_summaries = "\n\n".join(pdf_page_summaries)
 
-            # Construct the prompt
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are an expert scientific summarizer.",
-                },
-                {
-                    "role": "user",
-                    "content": f"""
+        # Construct the prompt
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an expert scientific summarizer.",
+            },
+            {
+                "role": "user",
+                "content": f"""
                 Below are summaries of individual pages from a scientific paper. Your task is to generate a final consolidated summary 
                 in a structured format with approximately 250 words. 
 
@@ -49,17 +71,24 @@ class PaperSummariser:
 
                 Please provide the consolidated final summary in the format mentioned above:
                 """,
-                },
-            ]
+            },
+        ]
+
+        return dict(
+            model="gpt-4o-mini",  # Chat-based model
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7,
+        )
 
+    async def get_final_summary(self, pdf_page_summaries: list[str]) -> str:
+        try:
             # Call the OpenAI API
-            async with AsyncOpenAI(api_key=OPENAI_APIKEY, max_retries=0) as aclient:
-                response = await aclient.chat.completions.create(
-                    model="gpt-4o-mini",  # Chat-based model
-                    messages=messages,
-                    max_tokens=500,
-                    temperature=0.7,
-                )
+            response = await self.llm_client.chat_completion(
+                caller="summariser",
+                priority=self.priority,
+                **self.get_final_summary_params(pdf_page_summaries),
+            )
 
             # Extract the consolidated summary from the response
             final_summary = response.choices[0].message.content.strip()
@@ -69,68 +98,285 @@ class PaperSummariser:
                 f"An error occurred while generating the final summary for paper: {self.paper_id}: {e}"
             )
 
-    async def get_pdf_page_summary(self, pdf_page_number: int, page_text: str) -> str:
+    @classmethod
+    def get_summaries_label(cls, pdf_page_summaries: list[str]) -> str:
+        # summaries are labelled "Page N: ..." or "Pages N-M: ...", keep the outer range
+        first_page = re.findall(r"\d+", pdf_page_summaries[0].split(":", 1)[0])[0]
+        last_page = re.findall(r"\d+", pdf_page_summaries[-1].split(":", 1)[0])[-1]
+        return f"Pages {first_page}-{last_page}"
+
+    def get_intermediate_summary_params(self, pdf_page_summaries: list[str]) -> dict:
+        combined_summaries = "\n\n".join(pdf_page_summaries)
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an expert scientific summarizer.",
+            },
+            {
+                "role": "user",
+                "content": f"""
+                Below are summaries of consecutive pages from a scientific paper. Merge them into a single concise summary (approximately 150-200 words)
+                that keeps the **main objectives**, **methods** and **key findings** they mention, without repeating information.
+
+                Here are the summaries:
+                {combined_summaries}
+                """,
+            },
+        ]
+
+        return dict(
+            model="gpt-4o-mini",  # Chat-based model
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7,
+        )
+
+    async def get_intermediate_summary(self, pdf_page_summaries: list[str]) -> str:
+        """
+        Condense a group of consecutive page summaries into one, for papers whose
+        page summaries do not fit in a single final prompt.
+        """
+        label = self.get_summaries_label(pdf_page_summaries)
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are an expert scientific summarizer.",
-                },
-                {
-                    "role": "user",
-                    "content": f"""
-                You are given the content of a page from a scientific paper. Your task is to summarize the following text by identifying the key objectives, methods, and key findings. Write a concise summary (approximately 100-150 words) that includes the following:
+            response = await self.llm_client.chat_completion(
+                caller="summariser",
+                priority=self.priority,
+                **self.get_intermediate_summary_params(pdf_page_summaries),
+            )
+            return f"{label}: {response.choices[0].message.content.strip()}"
+        except Exception as e:
+            raise Exception(
+                f"An error occurred while condensing the summaries of {label} for paper: {self.paper_id}: {e}"
+            )
+
+    @classmethod
+    def get_reduce_groups(cls, pdf_page_summaries: list[str]) -> list[list[str]]:
+        """
+        Groups of consecutive summaries to condense for the next reduce level, or
+        an empty list once the summaries fit SUMMARY_REDUCE_TOKEN_BUDGET.
+        """
+        if (
+            len(pdf_page_summaries) <= 1
+            or estimate_tokens("\n\n".join(pdf_page_summaries))
+            <= SUMMARY_REDUCE_TOKEN_BUDGET
+        ):
+            return []
+
+        groups: list[list[str]] = [[]]
+        for summary in pdf_page_summaries:
+            group_tokens = estimate_tokens("\n\n".join(groups[-1] + [summary]))
+            if len(groups[-1]) >= 2 and group_tokens > SUMMARY_REDUCE_TOKEN_BUDGET:
+                groups.append([])
+            groups[-1].append(summary)
+        return groups
+
+    async def reduce_summaries(self, pdf_page_summaries: list[str]) -> list[str]:
+        """
+        Tree-reduce the summaries until they fit SUMMARY_REDUCE_TOKEN_BUDGET, each
+        level condensing groups of consecutive summaries in parallel.
+        """
+        while groups := self.get_reduce_groups(pdf_page_summaries):
+            pdf_page_summaries = await asyncio.gather(
+                *[self.get_intermediate_summary(group) for group in groups]
+            )
+        return pdf_page_summaries
+
+    def get_pdf_page_summary_params(self, page_chunk: PageChunk) -> dict:
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an expert scientific summarizer.",
+            },
+            {
+                "role": "user",
+                "content": f"""
+                You are given the content of one or more consecutive pages from a scientific paper. Your task is to summarize the following text by identifying the key objectives, methods, and key findings. Write a concise summary (approximately 100-150 words) that includes the following:
 
                 - The **main objectives** of the study: What is the study trying to achieve or investigate?
                 - The **methods** used in the study: Briefly describe the techniques, experiments, or data collection methods used.
                 - The **key findings**: What were the most important results or conclusions of the study?
 
-                Here is the content of the page:
-                {page_text}
+                Here is the content of the pages:
+                {page_chunk.text}
                 """,
-                },
-            ]
+            },
+        ]
+
+        return dict(
+            model="gpt-4o-mini",  # Chat-based model
+            messages=messages,
+            max_tokens=500,
+            temperature=0.7,
+        )
 
+    async def request_pdf_page_summary(
+        self, page_chunk: PageChunk, params: dict
+    ) -> str:
+        try:
             # Use the chat completions endpoint
-            async with AsyncOpenAI(api_key=OPENAI_APIKEY, max_retries=0) as aclient:
-                response = await aclient.chat.completions.create(
-                    model="gpt-4o-mini",  # Chat-based model
-                    messages=messages,
-                    max_tokens=500,
-                    temperature=0.7,
-                )
-                page_summary = response.choices[0].message.content
-                return page_summary
+            response = await self.llm_client.chat_completion(
+                caller="summariser", priority=self.priority, **params
+            )
+            page_summary = response.choices[0].message.content
+            return f"{page_chunk.label}: {page_summary}"
         except Exception as e:
-            logger.exception(
-                f"An error occurred while summarizing the page number: {pdf_page_number}: {e}"
+            # a summary missing pages would be stored as if it were complete
+            raise Exception(
+                f"An error occurred while summarizing {page_chunk.label} of paper: {self.paper_id}: {e}"
             )
-            return ""
+
+    async def get_pdf_page_summary(self, page_chunk: PageChunk) -> str:
+        params = self.get_pdf_page_summary_params(page_chunk)
+        return await self.checkpoints.run_page(
+            page_chunk.label,
+            LLMCache.get_key(params),
+            lambda: self.request_pdf_page_summary(page_chunk, params),
+        )
+
+    async def get_pdf_page_summaries(self, page_chunks: list[PageChunk]) -> list[str]:
+        """
+        Every chunk gets its attempt before a failure is raised, so a rerun only
+        redoes the failed ones.
+        """
+        results = await asyncio.gather(
+            *[self.get_pdf_page_summary(page_chunk) for page_chunk in page_chunks],
+            return_exceptions=True,
+        )
+        self.checkpoints.raise_failed([page_chunk.label for page_chunk in page_chunks])
+        return results
+
+    async def get_page_chunks(self) -> list[PageChunk]:
+        self.checkpoints.load()
+        # page texts are small, extract them all off the event loop and pack them
+        page_texts = await self.pdf_processor.extract_page_texts(self.paper_path)
+        page_chunks = pack_pages(page_texts)
+        if not page_chunks:
+            # the final prompt would have no page summaries to consolidate
+            raise Exception(f"No text to summarise in paper {self.paper_id}")
+        logger.info(
+            f"Packed {len(page_texts)} pages of paper {self.paper_id} into {len(page_chunks)} chunks"
+        )
+        return page_chunks
 
     async def get_summary(self) -> str:
         """
-        1. Summarize each page of the paper into 100-200 words using GPT-4o-mini.
-        2. Combine all the page summaries.
-        3. Make a final LLM call to extract the main objectives, methods, and key findings.
+        1. Pack consecutive pages into chunks up to SUMMARY_CHUNK_TOKEN_BUDGET, skipping back matter.
+        2. Summarize each chunk into 100-150 words using GPT-4o-mini, reusing checkpointed chunk summaries.
+        3. Tree-reduce the chunk summaries while they exceed SUMMARY_REDUCE_TOKEN_BUDGET.
+        4. Make a final LLM call to extract the main objectives, methods, and key findings.
         """
+        page_chunks = await self.get_page_chunks()
 
-        pdf_doc = pymupdf.open(self.paper_path)
-        tasks: list[asyncio.Task[str]] = list()
-
-        semaphore = asyncio.Semaphore(value=MAX_CONCURRENT_PAGE_SUMMARISATION_TASK)
-        async with asyncio.TaskGroup() as tg:
-            for pdf_page_number, pdf_page in enumerate(pdf_doc):
-                pdf_page_text = str(pdf_page.get_text())
-                tasks.append(
-                    tg.create_task(
-                        schedule_task(
-                            semaphore,
-                            self.get_pdf_page_summary,
-                            pdf_page_number + 1,
-                            pdf_page_text,
-                        )
-                    )
-                )
-        pdf_page_summaries = [task.result() for task in tasks]
+        pdf_page_summaries = await self.get_pdf_page_summaries(page_chunks)
+        pdf_page_summaries = await self.reduce_summaries(pdf_page_summaries)
 
         return await self.get_final_summary(pdf_page_summaries)
+
+    async def stream_summary(self) -> AsyncIterator[tuple[str, dict]]:
+        """
+        Same pipeline as get_summary, yielding (event, data) pairs as it goes:
+        a "page_summary" as each chunk summary completes, "final_summary_delta"
+        for each streamed token of the final summary, then "final_summary".
+        """
+        page_chunks = await self.get_page_chunks()
+        yield "chunks", {"labels": [page_chunk.label for page_chunk in page_chunks]}
+
+        completed_summaries: asyncio.Queue[Optional[str]] = asyncio.Queue()
+
+        async def summarise(page_chunk: PageChunk) -> str:
+            page_summary = await self.get_pdf_page_summary(page_chunk)
+            completed_summaries.put_nowait(page_summary)
+            return page_summary
+
+        summaries_task = asyncio.gather(
+            *[summarise(page_chunk) for page_chunk in page_chunks],
+            return_exceptions=True,
+        )
+        summaries_task.add_done_callback(lambda _: completed_summaries.put_nowait(None))
+        try:
+            while (page_summary := await completed_summaries.get()) is not None:
+                label, summary = page_summary.split(": ", 1)
+                yield "page_summary", {"label": label, "summary": summary}
+            pdf_page_summaries = await summaries_task
+        finally:
+            summaries_task.cancel()
+        self.checkpoints.raise_failed([page_chunk.label for page_chunk in page_chunks])
+
+        pdf_page_summaries = await self.reduce_summaries(pdf_page_summaries)
+
+        final_summary_parts: list[str] = list()
+        try:
+            async for delta in self.llm_client.stream_chat_completion(
+                caller="summariser",
+                priority=self.priority,
+                **self.get_final_summary_params(pdf_page_summaries),
+            ):
+                final_summary_parts.append(delta)
+                yield "final_summary_delta", {"delta": delta}
+        except Exception as e:
+            raise Exception(
+                f"An error occurred while generating the final summary for paper: {self.paper_id}: {e}"
+            )
+
+        yield "final_summary", {"summary": "".join(final_summary_parts).strip()}
+
+
+def read_paper_summary(
+    paper_id: int, summary_path: str, paper_index: PaperIndex
+) -> Optional[str]:
+    """
+    The stored summary, or None when there is none yet. A summary the index
+    knows about but that was removed from disk is marked missing.
+    """
+    if not paper_index.is_done(paper_id, "summary"):
+        return None
+    try:
+        with open(summary_path, "r") as file:
+            return file.read()
+    except FileNotFoundError:
+        paper_index.record_missing(paper_id, "summary")
+        return None
+
+
+async def generate_paper_summary(
+    paper_id: int,
+    summary_path: str,
+    llm_client: LLMClient,
+    pdf_processor: PdfProcessor,
+    paper_index: PaperIndex,
+    artifact_store: ArtifactStore,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+) -> str:
+    # a concurrent flight may have written the summary since the caller checked
+    paper_summary = read_paper_summary(paper_id, summary_path, paper_index)
+    if paper_summary is not None:
+        return paper_summary
+
+    async with artifact_store.claim(paper_id, "summary"):
+        # or a worker of another process, while this one waited for the claim
+        paper_summary = read_paper_summary(paper_id, summary_path, paper_index)
+        if paper_summary is not None:
+            return paper_summary
+
+        started_at = time.monotonic()
+        try:
+            paper_summary = await PaperSummariser(
+                paper_id=paper_id,
+                llm_client=llm_client,
+                pdf_processor=pdf_processor,
+                priority=priority,
+            ).get_summary()
+        except Exception as e:
+            PAPER_STAGE_SECONDS.labels("summary", "failed").observe(
+                time.monotonic() - started_at
+            )
+            paper_index.record_failed(paper_id, "summary", str(e))
+            raise
+        PAPER_STAGE_SECONDS.labels("summary", "done").observe(
+            time.monotonic() - started_at
+        )
+
+        # Write the paper summary to the file once, atomically
+        write_file_atomic(summary_path, paper_summary)
+        await paper_index.record_done(paper_id, "summary")
+        return paper_summary
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Optional
+
+from pydantic import ValidationError
+
+from db.models import TableCandidate
+from table_extracter.page_image_encoder import MIME_TYPES, PageImage, PageImageOptions
+from utils.const import PAGE_STORE_DIR, PAGE_STORE_VERSION
+from utils.metrics import PAGE_STORE_LOOKUPS
+from utils.util import write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# texts.bin starts with its magic and page count, then page count + 1 offsets
+# into the UTF-8 texts that follow, so one page is read without the others
+TEXTS_MAGIC = b"PGTX"
+TEXTS_HEADER = struct.Struct("<4sI")
+TEXTS_OFFSET = struct.Struct("<Q")
+
+
+class PageStore:
+    """
+    What the PDF work derives from a paper, stored once per PDF content under
+    data/page_store/v{version}/{sha256}/ and shared by every later analysis of
+    it, whatever the prompts:
+
+    - texts.bin: the text of every page, in a layout read through mmap
+    - table_scores.json: the table candidate score of every page
+    - renders/: encoded page images by page, render options and crop
+
+    Entries are written atomically, so concurrent workers at worst derive the
+    same entry twice.
+    """
+
+    def __init__(self, store_dir: str = PAGE_STORE_DIR):
+        self.store_dir = os.path.join(store_dir, f"v{PAGE_STORE_VERSION}")
+        # (path, size, mtime_ns) -> sha256, so an unchanged file is hashed once
+        self.content_keys: dict[tuple[str, int, int], str] = dict()
+
+    def get_content_key(self, paper_path: str) -> str:
+        pdf_stat = os.stat(paper_path)
+        file_key = (paper_path, pdf_stat.st_size, pdf_stat.st_mtime_ns)
+        if file_key not in self.content_keys:
+            with open(paper_path, "rb") as file:
+                self.content_keys[file_key] = hashlib.file_digest(
+                    file, "sha256"
+                ).hexdigest()
+        return self.content_keys[file_key]
+
+    def get_path(self, content_key: str, *names: str) -> str:
+        return os.path.join(self.store_dir, content_key, *names)
+
+    def read_page_count(self, content_key: str) -> Optional[int]:
+        try:
+            with open(self.get_path(content_key, "texts.bin"), "rb") as file:
+                magic, page_count = TEXTS_HEADER.unpack(file.read(TEXTS_HEADER.size))
+        except (FileNotFoundError, struct.error):
+            return None
+        return page_count if magic == TEXTS_MAGIC else None
+
+    def read_page_texts(
+        self, content_key: str, page_numbers: Optional[list[int]] = None
+    ) -> Optional[list[str]]:
+        """
+        Texts of page_numbers (every page by default), or None if the PDF has
+        no stored texts.
+        """
+        try:
+            file = open(self.get_path(content_key, "texts.bin"), "rb")
+        except FileNotFoundError:
+            PAGE_STORE_LOOKUPS.labels("texts", "miss").inc()
+            return None
+        with file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as texts:
+            magic, page_count = TEXTS_HEADER.unpack_from(texts)
+            if magic != TEXTS_MAGIC:
+                PAGE_STORE_LOOKUPS.labels("texts", "miss").inc()
+                return None
+            data_start = TEXTS_HEADER.size + (page_count + 1) * TEXTS_OFFSET.size
+
+            def read_page_text(page_number: int) -> str:
+                offset_at = TEXTS_HEADER.size + (page_number - 1) * TEXTS_OFFSET.size
+                (start,) = TEXTS_OFFSET.unpack_from(texts, offset_at)
+                (end,) = TEXTS_OFFSET.unpack_from(texts, offset_at + TEXTS_OFFSET.size)
+                return texts[data_start + start : data_start + end].decode(
+                    "utf-8", "surrogatepass"
+                )
+
+            PAGE_STORE_LOOKUPS.labels("texts", "hit").inc()
+            return [
+                read_page_text(page_number)
+                for page_number in page_numbers or range(1, page_count + 1)
+            ]
+
+    def write_page_texts(self, content_key: str, page_texts: list[str]) -> None:
+        encoded_texts = [
+            page_text.encode("utf-8", "surrogatepass") for page_text in page_texts
+        ]
+        offsets = [0]
+        for encoded_text in encoded_texts:
+            offsets.append(offsets[-1] + len(encoded_text))
+        write_file_atomic(
+            self.get_path(content_key, "texts.bin"),
+            TEXTS_HEADER.pack(TEXTS_MAGIC, len(page_texts))
+            + b"".join(TEXTS_OFFSET.pack(offset) for offset in offsets)
+            + b"".join(encoded_texts),
+        )
+
+    def read_table_candidates(
+        self, content_key: str, threshold: float
+    ) -> Optional[list[TableCandidate]]:
+        try:
+            with open(self.get_path(content_key, "table_scores.json"), "r") as file:
+                table_candidates = [
+                    TableCandidate.model_validate(table_candidate)
+                    for table_candidate in json.load(file)
+                ]
+        except FileNotFoundError:
+            PAGE_STORE_LOOKUPS.labels("table_scores", "miss").inc()
+            return None
+        except (ValueError, ValidationError) as e:
+            logger.warning(f"Ignoring unreadable table scores of {content_key}: {e}")
+            PAGE_STORE_LOOKUPS.labels("table_scores", "miss").inc()
+            return None
+        PAGE_STORE_LOOKUPS.labels("table_scores", "hit").inc()
+        # the scores do not depend on the threshold, only which pages pass it
+        for table_candidate in table_candidates:
+            table_candidate.is_candidate = table_candidate.score >= threshold
+        return table_candidates
+
+    def write_table_candidates(
+        self, content_key: str, table_candidates: list[TableCandidate]
+    ) -> None:
+        write_file_atomic(
+            self.get_path(content_key, "table_scores.json"),
+            json.dumps(
+                [table_candidate.model_dump() for table_candidate in table_candidates]
+            ),
+        )
+
+    def get_page_image_path(
+        self,
+        content_key: str,
+        page_number: int,
+        table_bboxes: Optional[list[tuple[float, float, float, float]]],
+        options: PageImageOptions,
+    ) -> str:
+        render_key = hashlib.sha256(
+            json.dumps(
+                dict(
+                    options=options.model_dump(),
+                    # the crop only depends on the boxes when cropping
+                    table_bboxes=table_bboxes if options.crop_to_tables else None,
+                ),
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()[:16]
+        return self.get_path(
+            content_key,
+            "renders",
+            f"{page_number}-{render_key}.{options.image_format}",
+        )
+
+    def read_page_image(
+        self,
+        content_key: str,
+        page_number: int,
+        table_bboxes: Optional[list[tuple[float, float, float, float]]],
+        options: PageImageOptions,
+    ) -> Optional[PageImage]:
+        path = self.get_page_image_path(content_key, page_number, table_bboxes, options)
+        try:
+            with open(path, "rb") as file:
+                image_bytes = file.read()
+        except FileNotFoundError:
+            PAGE_STORE_LOOKUPS.labels("render", "miss").inc()
+            return None
+        PAGE_STORE_LOOKUPS.labels("render", "hit").inc()
+        return PageImage(
+            image_bytes=image_bytes, mime_type=MIME_TYPES[options.image_format]
+        )
+
+    def write_page_image(
+        self,
+        content_key: str,
+        page_number: int,
+        table_bboxes: Optional[list[tuple[float, float, float, float]]],
+        options: PageImageOptions,
+        page_image: PageImage,
+    ) -> None:
+        write_file_atomic(
+            self.get_page_image_path(content_key, page_number, table_bboxes, options),
+            page_image.image_bytes,
+        )
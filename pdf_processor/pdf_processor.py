@@ -0,0 +1,263 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+from typing import Any, Callable, Optional
+
+import pymupdf
+from pydantic import BaseModel
+
+from db.models import TableCandidate
+from pdf_processor.page_store import PageStore
+from table_extracter.page_image_encoder import (
+    PageImage,
+    PageImageOptions,
+    render_page_image,
+)
+from table_extracter.table_candidate_scorer import score_pdf_page
+from utils.const import (
+    PAGE_STORE_DIR,
+    PDF_PROCESS_DOCUMENT_CACHE_SIZE,
+    PDF_PROCESS_POOL_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Open documents kept by each worker process, keyed by path and modification time
+_documents: OrderedDict[tuple[str, float], pymupdf.Document] = OrderedDict()
+
+
+def open_document(paper_path: str) -> pymupdf.Document:
+    key = (paper_path, os.path.getmtime(paper_path))
+    if key in _documents:
+        _documents.move_to_end(key)
+        return _documents[key]
+
+    _documents[key] = pymupdf.open(paper_path)
+    while len(_documents) > PDF_PROCESS_DOCUMENT_CACHE_SIZE:
+        _, pdf_doc = _documents.popitem(last=False)
+        pdf_doc.close()
+    return _documents[key]
+
+
+def read_page_count(paper_path: str) -> int:
+    return len(open_document(paper_path))
+
+
+def extract_page_texts(paper_path: str) -> list[str]:
+    return [str(pdf_page.get_text()) for pdf_page in open_document(paper_path)]
+
+
+def score_table_page(
+    paper_path: str, page_number: int, threshold: float
+) -> TableCandidate:
+    return score_pdf_page(
+        open_document(paper_path)[page_number - 1], page_number, threshold
+    )
+
+
+class TableScan(BaseModel):
+    """
+    Table scores of every page and the images of the candidate pages, read in
+    one visit per page.
+    """
+
+    table_candidates: list[TableCandidate]
+    # page number -> image of the candidate pages that were rendered
+    page_images: dict[int, PageImage] = dict()
+
+
+def scan_table_page(
+    paper_path: str,
+    page_number: int,
+    threshold: float,
+    options: Optional[PageImageOptions],
+) -> tuple[TableCandidate, Optional[PageImage]]:
+    """
+    Score a page for tables and render it if it is a candidate, visiting the
+    page once. Nothing is rendered without options.
+    """
+    pdf_page = open_document(paper_path)[page_number - 1]
+    table_candidate = score_pdf_page(pdf_page, page_number, threshold)
+    if options and table_candidate.is_candidate:
+        return table_candidate, render_page_image(
+            pdf_page, table_candidate.table_bboxes, options
+        )
+    return table_candidate, None
+
+
+def render_table_page(
+    paper_path: str,
+    page_number: int,
+    table_bboxes: Optional[list[tuple[float, float, float, float]]],
+    options: PageImageOptions,
+) -> PageImage:
+    return render_page_image(
+        open_document(paper_path)[page_number - 1], table_bboxes, options
+    )
+
+
+class PdfProcessor:
+    """
+    Runs pymupdf work (text extraction, table scoring, page rendering) in a pool
+    of worker processes, keeping the event loop free for other requests.
+
+    What the work derives from a PDF is kept in the PageStore, so a PDF that was
+    already processed, for any analysis or prompt, is not parsed or rendered again.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = PDF_PROCESS_POOL_WORKERS,
+        page_store_dir: str = PAGE_STORE_DIR,
+    ):
+        self.max_workers = max_workers
+        # spawn rather than fork, the parent holds an event loop and threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.page_store = PageStore(page_store_dir)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get_content_key(self, paper_path: str) -> str:
+        return await asyncio.to_thread(self.page_store.get_content_key, paper_path)
+
+    async def read_page_count(self, paper_path: str) -> int:
+        content_key = await self.get_content_key(paper_path)
+        page_count = await asyncio.to_thread(
+            self.page_store.read_page_count, content_key
+        )
+        if page_count is None:
+            page_count = await self.run(read_page_count, paper_path)
+        return page_count
+
+    async def extract_page_texts(self, paper_path: str) -> list[str]:
+        content_key = await self.get_content_key(paper_path)
+        page_texts = await asyncio.to_thread(
+            self.page_store.read_page_texts, content_key
+        )
+        if page_texts is None:
+            page_texts = await self.run(extract_page_texts, paper_path)
+            await asyncio.to_thread(
+                self.page_store.write_page_texts, content_key, page_texts
+            )
+        return page_texts
+
+    async def score_table_candidates(
+        self, paper_path: str, threshold: float
+    ) -> list[TableCandidate]:
+        content_key = await self.get_content_key(paper_path)
+        table_candidates = await asyncio.to_thread(
+            self.page_store.read_table_candidates, content_key, threshold
+        )
+        if table_candidates is not None:
+            return table_candidates
+
+        # pages are scored in parallel across the worker processes
+        page_count = await self.read_page_count(paper_path)
+        table_candidates = await asyncio.gather(
+            *[
+                self.run(score_table_page, paper_path, page_number, threshold)
+                for page_number in range(1, page_count + 1)
+            ]
+        )
+        await asyncio.to_thread(
+            self.page_store.write_table_candidates, content_key, table_candidates
+        )
+        return table_candidates
+
+    async def render_table_page(
+        self,
+        paper_path: str,
+        page_number: int,
+        table_bboxes: Optional[list[tuple[float, float, float, float]]],
+        options: PageImageOptions,
+    ) -> PageImage:
+        content_key = await self.get_content_key(paper_path)
+        pdf_page_image = await asyncio.to_thread(
+            self.page_store.read_page_image,
+            content_key,
+            page_number,
+            table_bboxes,
+            options,
+        )
+        if pdf_page_image is None:
+            pdf_page_image = await self.run(
+                render_table_page, paper_path, page_number, table_bboxes, options
+            )
+            await asyncio.to_thread(
+                self.page_store.write_page_image,
+                content_key,
+                page_number,
+                table_bboxes,
+                options,
+                pdf_page_image,
+            )
+        return pdf_page_image
+
+    async def scan_table_pages(
+        self,
+        paper_path: str,
+        threshold: float,
+        options: PageImageOptions,
+        skip_render_pages: set[int] = set(),
+    ) -> TableScan:
+        """
+        score_table_candidates that also renders the candidate pages not in
+        skip_render_pages while it has them open. With stored scores nothing is
+        rendered here, render_table_page reads the stored renders page by page.
+        """
+        content_key = await self.get_content_key(paper_path)
+        table_candidates = await asyncio.to_thread(
+            self.page_store.read_table_candidates, content_key, threshold
+        )
+        if table_candidates is not None:
+            return TableScan(table_candidates=table_candidates)
+
+        page_count = await self.read_page_count(paper_path)
+        page_scans = await asyncio.gather(
+            *[
+                self.run(
+                    scan_table_page,
+                    paper_path,
+                    page_number,
+                    threshold,
+                    None if page_number in skip_render_pages else options,
+                )
+                for page_number in range(1, page_count + 1)
+            ]
+        )
+        table_scan = TableScan(
+            table_candidates=[table_candidate for table_candidate, _ in page_scans],
+            page_images={
+                table_candidate.page_number: pdf_page_image
+                for table_candidate, pdf_page_image in page_scans
+                if pdf_page_image is not None
+            },
+        )
+        await asyncio.to_thread(self.store_table_scan, content_key, table_scan, options)
+        return table_scan
+
+    def store_table_scan(
+        self, content_key: str, table_scan: TableScan, options: PageImageOptions
+    ) -> None:
+        # renders first, stored scores make readers look for them
+        for table_candidate in table_scan.table_candidates:
+            pdf_page_image = table_scan.page_images.get(table_candidate.page_number)
+            if pdf_page_image is not None:
+                self.page_store.write_page_image(
+                    content_key,
+                    table_candidate.page_number,
+                    table_candidate.table_bboxes,
+                    options,
+                    pdf_page_image,
+                )
+        self.page_store.write_table_candidates(content_key, table_scan.table_candidates)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,384 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+import logging
+from typing import Awaitable, Callable, Optional
+import uuid
+
+from db.api_models import BulkAnalysisReport, PipelineStageReport
+from db.artifact_store import ArtifactStore
+from db.models import LLMPriority, Paper, PipelineStageStats
+from db.paper_index import PaperIndex
+from db.table_store import TableStore
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_client import LLMClient
+from llm_client.llm_limiter import LLMLimiter
+from paper_downloader.download_scheduler import DownloadScheduler
+from paper_summariser.paper_summariser import generate_paper_summary
+from pdf_processor.pdf_processor import PdfProcessor
+from setup_logger import setup_logger
+from table_extracter.table_extracter import generate_primary_result_table
+from utils.client_registry import ClientRegistry
+from utils.const import (
+    BULK_ANALYSIS_TTL_SECONDS,
+    MAX_FINISHED_BULK_ANALYSES,
+    PIPELINE_DOWNLOAD_CONCURRENCY,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_SUMMARY_CONCURRENCY,
+    PIPELINE_TABLE_CONCURRENCY,
+)
+from utils.single_flight import SingleFlight
+from utils.util import read_paper_links
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisPipeline:
+    """
+    Streams papers through download -> summarise -> extract tables. Each stage has
+    its own worker pool and stages are linked by bounded queues, so a paper starts
+    summarising as soon as its PDF lands and a slow stage applies backpressure to
+    the one before it. Stages whose artifact already exists are skipped, which
+    makes an interrupted run resumable. Downloads go through the shared
+    DownloadScheduler, so concurrent runs and download jobs stay within its limit.
+    """
+
+    def __init__(
+        self,
+        papers: list[Paper],
+        download_scheduler: DownloadScheduler,
+        llm_client: LLMClient,
+        pdf_processor: PdfProcessor,
+        single_flight: SingleFlight,
+        paper_index: PaperIndex,
+        artifact_store: ArtifactStore,
+        table_store: TableStore,
+        download_concurrency: int = PIPELINE_DOWNLOAD_CONCURRENCY,
+        summary_concurrency: int = PIPELINE_SUMMARY_CONCURRENCY,
+        table_concurrency: int = PIPELINE_TABLE_CONCURRENCY,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+    ):
+        self.run_id = uuid.uuid4().hex
+        self.papers = papers
+        self.download_scheduler = download_scheduler
+        self.llm_client = llm_client
+        self.pdf_processor = pdf_processor
+        self.single_flight = single_flight
+        self.paper_index = paper_index
+        self.artifact_store = artifact_store
+        self.table_store = table_store
+        self.queue_size = queue_size
+        self.status = "queued"
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.papers_completed = 0
+        self.errors: dict[str, str] = dict()
+        self.stages = {
+            "download": PipelineStageStats(
+                name="download", concurrency=download_concurrency
+            ),
+            "summary": PipelineStageStats(
+                name="summary", concurrency=summary_concurrency
+            ),
+            "table": PipelineStageStats(name="table", concurrency=table_concurrency),
+        }
+
+    async def download_paper(self, paper: Paper) -> bool:
+        if self.paper_index.is_done(paper.paper_id, "download"):
+            return False
+        await self.download_scheduler.download(paper)
+        return True
+
+    async def summarise_paper(self, paper: Paper) -> bool:
+        if self.paper_index.is_done(paper.paper_id, "summary"):
+            return False
+        await self.single_flight.do(
+            f"summary:{paper.paper_id}",
+            generate_paper_summary,
+            paper.paper_id,
+            f"data/summaries/{paper.paper_id}.md",
+            self.llm_client,
+            self.pdf_processor,
+            self.paper_index,
+            self.artifact_store,
+            # interactive endpoint calls are served first
+            LLMPriority.BULK,
+        )
+        return True
+
+    async def extract_paper_table(self, paper: Paper) -> bool:
+        if self.paper_index.is_done(paper.paper_id, "table"):
+            return False
+        await self.single_flight.do(
+            f"table:{paper.paper_id}",
+            generate_primary_result_table,
+            paper.paper_id,
+            f"data/extracted_tables/{paper.paper_id}.csv",
+            self.llm_client,
+            self.pdf_processor,
+            self.paper_index,
+            self.artifact_store,
+            self.table_store,
+            LLMPriority.BULK,
+        )
+        return True
+
+    async def stage_worker(
+        self,
+        stage: PipelineStageStats,
+        in_queue: asyncio.Queue[Optional[Paper]],
+        out_queue: Optional[asyncio.Queue[Optional[Paper]]],
+        process: Callable[[Paper], Awaitable[bool]],
+        forward_on_failure: bool,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            paper = await in_queue.get()
+            if paper is None:
+                # let the sibling workers see the end of the stream too
+                await in_queue.put(None)
+                return
+
+            stage.queued -= 1
+            stage.running += 1
+            started_at = loop.time()
+            forward = True
+            try:
+                if await process(paper):
+                    stage.done += 1
+                    stage.total_seconds += loop.time() - started_at
+                else:
+                    stage.skipped += 1
+            except Exception as e:
+                stage.failed += 1
+                self.errors[f"{stage.name}:{paper.paper_id}"] = str(e)
+                logger.error(
+                    f"Pipeline stage {stage.name} failed for paper {paper.paper_id}: {e}"
+                )
+                forward = forward_on_failure
+            finally:
+                stage.running -= 1
+
+            if out_queue is None:
+                self.papers_completed += 1
+            elif forward:
+                self.stages[self.next_stage_name(stage.name)].queued += 1
+                await out_queue.put(paper)
+            else:
+                self.papers_completed += 1
+
+    @classmethod
+    def next_stage_name(cls, stage_name: str) -> str:
+        return {"download": "summary", "summary": "table"}[stage_name]
+
+    async def run_stage(
+        self,
+        stage: PipelineStageStats,
+        in_queue: asyncio.Queue[Optional[Paper]],
+        out_queue: Optional[asyncio.Queue[Optional[Paper]]],
+        process: Callable[[Paper], Awaitable[bool]],
+        forward_on_failure: bool = True,
+    ) -> None:
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(stage.concurrency):
+                tg.create_task(
+                    self.stage_worker(
+                        stage, in_queue, out_queue, process, forward_on_failure
+                    )
+                )
+        # every worker of this stage is done, close the stream for the next one
+        if out_queue is not None:
+            await out_queue.put(None)
+
+    async def feed(self, download_queue: asyncio.Queue[Optional[Paper]]) -> None:
+        for paper in self.papers:
+            self.stages["download"].queued += 1
+            await download_queue.put(paper)
+        await download_queue.put(None)
+
+    async def run(self) -> BulkAnalysisReport:
+        self.status = "running"
+        self.started_at = datetime.now(timezone.utc)
+        download_queue: asyncio.Queue[Optional[Paper]] = asyncio.Queue(self.queue_size)
+        summary_queue: asyncio.Queue[Optional[Paper]] = asyncio.Queue(self.queue_size)
+        table_queue: asyncio.Queue[Optional[Paper]] = asyncio.Queue(self.queue_size)
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self.feed(download_queue))
+                tg.create_task(
+                    self.run_stage(
+                        self.stages["download"],
+                        download_queue,
+                        summary_queue,
+                        self.download_paper,
+                        # nothing to analyse without the PDF
+                        forward_on_failure=False,
+                    )
+                )
+                tg.create_task(
+                    self.run_stage(
+                        self.stages["summary"],
+                        summary_queue,
+                        table_queue,
+                        self.summarise_paper,
+                    )
+                )
+                tg.create_task(
+                    self.run_stage(
+                        self.stages["table"],
+                        table_queue,
+                        None,
+                        self.extract_paper_table,
+                    )
+                )
+            self.status = "done"
+        except BaseException:
+            self.status = "failed"
+            raise
+        finally:
+            self.finished_at = datetime.now(timezone.utc)
+            logger.info(f"Pipeline run {self.run_id} {self.status}")
+
+        return self.get_report()
+
+    def get_report(self) -> BulkAnalysisReport:
+        finished_at = self.finished_at or datetime.now(timezone.utc)
+        elapsed_seconds = (finished_at - self.started_at).total_seconds()
+        papers_per_minute = 0.0
+        if elapsed_seconds > 0:
+            papers_per_minute = self.papers_completed / elapsed_seconds * 60
+
+        return BulkAnalysisReport(
+            run_id=self.run_id,
+            status=self.status,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            elapsed_seconds=round(elapsed_seconds, 3),
+            paper_count=len(self.papers),
+            papers_completed=self.papers_completed,
+            papers_per_minute=round(papers_per_minute, 3),
+            stages=[
+                PipelineStageReport(
+                    **stage.model_dump(exclude={"total_seconds"}),
+                    average_seconds=stage.average_seconds,
+                )
+                for stage in self.stages.values()
+            ],
+            errors=self.errors,
+        )
+
+
+def prune_finished_pipelines(
+    pipelines: dict[str, AnalysisPipeline],
+    ttl_seconds: float = BULK_ANALYSIS_TTL_SECONDS,
+    max_finished: int = MAX_FINISHED_BULK_ANALYSES,
+) -> None:
+    """
+    Drop finished runs older than ttl_seconds, and the oldest ones past max_finished.
+    Queued and running runs are always kept.
+    """
+    expires_before = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    finished_runs = sorted(
+        (pipeline.finished_at, run_id)
+        for run_id, pipeline in pipelines.items()
+        if pipeline.finished_at is not None
+    )
+    expired_count = sum(
+        finished_at < expires_before for finished_at, _ in finished_runs
+    )
+    drop_count = max(expired_count, len(finished_runs) - max_finished)
+    for _, run_id in finished_runs[:drop_count]:
+        del pipelines[run_id]
+    if drop_count > 0:
+        logger.info(f"Dropped {drop_count} finished bulk analysis runs")
+
+
+async def log_progress(pipeline: AnalysisPipeline, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        report = pipeline.get_report()
+        stages = ", ".join(
+            f"{stage.name}: {stage.done} done / {stage.skipped} skipped / {stage.failed} failed / {stage.running} running"
+            for stage in report.stages
+        )
+        logger.info(
+            f"{report.papers_completed}/{report.paper_count} papers, {report.papers_per_minute} papers/min | {stages}"
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    setup_logger()
+    logger.setLevel(logging.INFO)
+
+    papers = read_paper_links(args.links)
+    if args.limit:
+        papers = papers[: args.limit]
+
+    client_registry = ClientRegistry()
+    await client_registry.start()
+    llm_cache = LLMCache()
+    await asyncio.to_thread(llm_cache.load)
+    pdf_processor = PdfProcessor()
+    paper_index = PaperIndex()
+    paper_index.open()
+    await paper_index.reconcile()
+    artifact_store = ArtifactStore()
+    download_scheduler = DownloadScheduler(
+        client=client_registry.http_client,
+        paper_index=paper_index,
+        artifact_store=artifact_store,
+    )
+    await download_scheduler.start()
+    try:
+        pipeline = AnalysisPipeline(
+            papers=papers,
+            download_scheduler=download_scheduler,
+            llm_client=LLMClient(
+                openai_client=client_registry.openai_client,
+                llm_cache=llm_cache,
+                llm_limiter=LLMLimiter(),
+            ),
+            pdf_processor=pdf_processor,
+            single_flight=SingleFlight(),
+            paper_index=paper_index,
+            artifact_store=artifact_store,
+            table_store=TableStore(),
+            download_concurrency=args.download_concurrency,
+            summary_concurrency=args.summary_concurrency,
+            table_concurrency=args.table_concurrency,
+            queue_size=args.queue_size,
+        )
+        progress_task = asyncio.create_task(
+            log_progress(pipeline, args.progress_interval)
+        )
+        try:
+            report = await pipeline.run()
+        finally:
+            progress_task.cancel()
+        print(report.model_dump_json(indent=2))
+    finally:
+        await download_scheduler.stop()
+        paper_index.close()
+        pdf_processor.close()
+        await client_registry.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Download, summarise and extract tables for a list of PubMed links."
+    )
+    parser.add_argument("--links", default="data/pubmed_paper_links.txt")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument(
+        "--download-concurrency", type=int, default=PIPELINE_DOWNLOAD_CONCURRENCY
+    )
+    parser.add_argument(
+        "--summary-concurrency", type=int, default=PIPELINE_SUMMARY_CONCURRENCY
+    )
+    parser.add_argument(
+        "--table-concurrency", type=int, default=PIPELINE_TABLE_CONCURRENCY
+    )
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE)
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import logging
+from typing import AsyncGenerator, Optional
+import uuid
+
+from openai.types.chat import ChatCompletion
+
+from db.artifact_store import ArtifactStore
+from db.models import BatchRunReport, Paper
+from db.paper_index import PaperIndex
+from db.table_store import TableStore
+from llm_client.batch_client import BatchClient
+from llm_client.llm_cache import LLMCache
+from paper_summariser.paper_summariser import PaperSummariser
+from pdf_processor.pdf_processor import PdfProcessor
+from setup_logger import setup_logger
+from table_extracter.table_extracter import TableExtracter
+from utils.client_registry import ClientRegistry
+from utils.const import BATCH_PIPELINE_PAPERS_PER_RUN, LLM_BATCH_POLL_INTERVAL_SECONDS
+from utils.util import read_paper_links, write_file_atomic
+
+logger = logging.getLogger(__name__)
+
+# a plan yields the requests of its next step and is sent back their responses
+Plan = AsyncGenerator[list[dict], list[Optional[ChatCompletion]]]
+
+
+class BatchPipeline:
+    """
+    Offline variant of AnalysisPipeline for re-processing the corpus through the
+    Batch API, trading latency for throughput and cost.
+
+    The summary and the table extraction of every paper are planned as async
+    generators built on the same request builders as PaperSummariser and
+    TableExtracter. All plans advance in lock step, so each wave is one set of
+    batches: page summaries and page tables first, then the reduce, final summary
+    and primary table steps that depend on them.
+    """
+
+    def __init__(
+        self,
+        papers: list[Paper],
+        batch_client: BatchClient,
+        pdf_processor: PdfProcessor,
+        paper_index: PaperIndex,
+        artifact_store: ArtifactStore,
+        table_store: TableStore,
+        papers_per_run: int = BATCH_PIPELINE_PAPERS_PER_RUN,
+    ):
+        self.run_id = uuid.uuid4().hex
+        self.papers = papers
+        self.batch_client = batch_client
+        self.pdf_processor = pdf_processor
+        self.paper_index = paper_index
+        self.artifact_store = artifact_store
+        self.table_store = table_store
+        self.papers_per_run = papers_per_run
+        self.report = BatchRunReport(run_id=self.run_id, paper_count=len(papers))
+
+    async def plan_summary(self, paper: Paper) -> Plan:
+        # the claim is held across the waves, API workers wait for this paper
+        async with self.artifact_store.claim(paper.paper_id, "summary"):
+            # an API worker may have produced it since the plans were made
+            if self.paper_index.is_done(paper.paper_id, "summary"):
+                self.report.skipped += 1
+                return
+
+            summary_path = f"data/summaries/{paper.paper_id}.md"
+            # requests go through the batch client, not a synchronous LLM client
+            summariser = PaperSummariser(
+                paper_id=paper.paper_id,
+                llm_client=None,
+                pdf_processor=self.pdf_processor,
+                table_store=self.table_store,
+            )
+
+            page_chunks = await summariser.get_page_chunks()
+            responses = yield [
+                summariser.get_pdf_page_summary_params(page_chunk)
+                for page_chunk in page_chunks
+            ]
+            # a summary missing pages would be stored as if it were complete
+            if not all(responses):
+                raise Exception(
+                    f"Failed to summarise the pages of paper {paper.paper_id}"
+                )
+            pdf_page_summaries = [
+                f"{page_chunk.label}: {response.choices[0].message.content}"
+                for page_chunk, response in zip(page_chunks, responses)
+            ]
+
+            while groups := summariser.get_reduce_groups(pdf_page_summaries):
+                responses = yield [
+                    summariser.get_intermediate_summary_params(group)
+                    for group in groups
+                ]
+                if not all(responses):
+                    raise Exception(
+                        f"Failed to condense the page summaries of paper {paper.paper_id}"
+                    )
+                pdf_page_summaries = [
+                    f"{summariser.get_summaries_label(group)}: {response.choices[0].message.content.strip()}"
+                    for group, response in zip(groups, responses)
+                ]
+
+            (response,) = yield [
+                summariser.get_final_summary_params(pdf_page_summaries)
+            ]
+            if not response:
+                raise Exception(
+                    f"Failed to generate the final summary of paper {paper.paper_id}"
+                )
+            write_file_atomic(summary_path, response.choices[0].message.content.strip())
+            await self.paper_index.record_done(paper.paper_id, "summary")
+            self.report.summaries_written += 1
+
+    async def plan_table(self, paper: Paper) -> Plan:
+        # the claim is held across the waves, API workers wait for this paper
+        async with self.artifact_store.claim(paper.paper_id, "table"):
+            # an API worker may have produced it since the plans were made
+            if self.paper_index.is_done(paper.paper_id, "table"):
+                self.report.skipped += 1
+                return
+
+            extracter = TableExtracter(
+                paper_id=paper.paper_id,
+                llm_client=None,
+                pdf_processor=self.pdf_processor,
+            )
+
+            pdf_page_numbers, table_candidates = await extracter.get_table_pages()
+            requests = [
+                extracter.get_tables_from_pdf_page_params(
+                    await extracter.render_pdf_page(
+                        pdf_page_number, table_candidates.get(pdf_page_number)
+                    )
+                )
+                for pdf_page_number in pdf_page_numbers
+            ]
+            responses = yield requests
+            del requests
+
+            pdf_page_tables = [
+                pdf_page_table
+                for pdf_page_number, response in zip(pdf_page_numbers, responses)
+                if response
+                and (
+                    pdf_page_table := extracter.read_pdf_page_tables(
+                        pdf_page_number, response
+                    )
+                )
+            ]
+            if not pdf_page_tables:
+                raise Exception(
+                    f"No tables found in the PDF document with paper id {paper.paper_id}"
+                )
+
+            (response,) = yield [
+                extracter.get_primary_result_table_params(pdf_page_tables)
+            ]
+            if not response or not await extracter.write_primary_result_table(response):
+                raise Exception(
+                    f"Failed to extract the primary result table from the PDF document with paper id {paper.paper_id}"
+                )
+            await self.paper_index.record_done(paper.paper_id, "table")
+            self.report.tables_written += 1
+
+    async def advance(
+        self, plan_name: str, plan: Plan, responses: Optional[list]
+    ) -> Optional[list[dict]]:
+        try:
+            return await plan.asend(responses)
+        except StopAsyncIteration:
+            return None
+        except Exception as e:
+            self.report.errors[plan_name] = str(e)
+            logger.error(f"Batch plan {plan_name} failed: {e}")
+            artifact, paper_id = plan_name.split(":")
+            self.paper_index.record_failed(int(paper_id), artifact, str(e))
+            return None
+
+    def get_plans(self, papers: list[Paper]) -> dict[str, Plan]:
+        plans: dict[str, Plan] = dict()
+        for paper in papers:
+            if not self.paper_index.is_done(paper.paper_id, "download"):
+                self.report.errors[f"paper:{paper.paper_id}"] = "Paper not downloaded"
+                continue
+            if self.paper_index.is_done(paper.paper_id, "summary"):
+                self.report.skipped += 1
+            else:
+                plans[f"summary:{paper.paper_id}"] = self.plan_summary(paper)
+            if self.paper_index.is_done(paper.paper_id, "table"):
+                self.report.skipped += 1
+            else:
+                plans[f"table:{paper.paper_id}"] = self.plan_table(paper)
+        return plans
+
+    async def run_papers(self, papers: list[Paper], run_index: int) -> None:
+        plans = self.get_plans(papers)
+        plan_names = list(plans)
+        pending_requests = await asyncio.gather(
+            *(
+                self.advance(plan_name, plans[plan_name], None)
+                for plan_name in plan_names
+            )
+        )
+
+        wave = 0
+        while any(requests is not None for requests in pending_requests):
+            wave += 1
+            plan_requests = {
+                plan_name: requests
+                for plan_name, requests in zip(plan_names, pending_requests)
+                if requests is not None
+            }
+            responses = await self.batch_client.run(
+                f"{self.run_id}_{run_index}_wave_{wave}",
+                [params for requests in plan_requests.values() for params in requests],
+            )
+
+            # hand every plan back the slice of responses for its own requests
+            plan_names = list(plan_requests)
+            plan_responses: list[list[Optional[ChatCompletion]]] = list()
+            for requests in plan_requests.values():
+                plan_responses.append(responses[: len(requests)])
+                responses = responses[len(requests) :]
+
+            pending_requests = await asyncio.gather(
+                *(
+                    self.advance(plan_name, plans[plan_name], plan_response)
+                    for plan_name, plan_response in zip(plan_names, plan_responses)
+                )
+            )
+
+    async def run(self) -> BatchRunReport:
+        for run_index, start in enumerate(
+            range(0, len(self.papers), self.papers_per_run)
+        ):
+            await self.run_papers(
+                self.papers[start : start + self.papers_per_run], run_index
+            )
+        self.report.waves = self.batch_client.waves
+        return self.report
+
+
+async def main(args: argparse.Namespace) -> None:
+    setup_logger()
+    logger.setLevel(logging.INFO)
+
+    papers = read_paper_links(args.links)
+    if args.limit:
+        papers = papers[: args.limit]
+
+    client_registry = ClientRegistry()
+    await client_registry.start()
+    llm_cache = LLMCache()
+    await asyncio.to_thread(llm_cache.load)
+    pdf_processor = PdfProcessor()
+    paper_index = PaperIndex()
+    paper_index.open()
+    await paper_index.reconcile()
+    try:
+        pipeline = BatchPipeline(
+            papers=papers,
+            batch_client=BatchClient(
+                openai_client=client_registry.openai_client,
+                llm_cache=llm_cache,
+                poll_interval=args.poll_interval,
+            ),
+            pdf_processor=pdf_processor,
+            paper_index=paper_index,
+            artifact_store=ArtifactStore(),
+            table_store=TableStore(),
+            papers_per_run=args.papers_per_run,
+        )
+        report = await pipeline.run()
+        print(report.model_dump_json(indent=2))
+    finally:
+        paper_index.close()
+        pdf_processor.close()
+        await client_registry.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Summarise and extract tables for a list of downloaded papers through the OpenAI Batch API."
+    )
+    parser.add_argument("--links", default="data/pubmed_paper_links.txt")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument(
+        "--papers-per-run", type=int, default=BATCH_PIPELINE_PAPERS_PER_RUN
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=LLM_BATCH_POLL_INTERVAL_SECONDS
+    )
+    asyncio.run(main(parser.parse_args()))
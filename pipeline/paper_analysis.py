@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from db.api_models import AnalyzePaperResponse
+from db.artifact_store import ArtifactStore
+from db.models import ArtifactStatus, LLMPriority, PaperAnalysisStage
+from db.paper_index import PaperIndex
+from db.table_store import TableStore
+from llm_client.llm_client import LLMClient
+from paper_summariser.paper_summariser import generate_paper_summary, read_paper_summary
+from pdf_processor.pdf_processor import PdfProcessor
+from table_extracter.table_extracter import generate_primary_result_table
+from utils.deadline import is_deadline_exceeded
+from utils.exception import DeadlineExceededException
+from utils.single_flight import SingleFlight
+
+
+async def analyse_paper(
+    paper_id: int,
+    llm_client: LLMClient,
+    pdf_processor: PdfProcessor,
+    single_flight: SingleFlight,
+    paper_index: PaperIndex,
+    artifact_store: ArtifactStore,
+    table_store: TableStore,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+) -> AnalyzePaperResponse:
+    """
+    Summary and primary result table of a paper, both fan-outs running at once
+    through the shared LLMLimiter and the same PDF worker processes, which keep
+    the document open between the two. Each stage shares in-flight runs with the
+    separate endpoints, and a stage that fails does not fail the other, unless
+    the deadline passed before either produced anything.
+    """
+    started_at = time.monotonic()
+    summary_path = f"data/summaries/{paper_id}.md"
+    table_path = f"data/extracted_tables/{paper_id}.csv"
+    stages: dict[str, PaperAnalysisStage] = dict()
+
+    summary = read_paper_summary(paper_id, summary_path, paper_index)
+    if summary is not None:
+        stages["summary"] = PaperAnalysisStage(status=ArtifactStatus.DONE, cached=True)
+    if paper_index.is_done(paper_id, "table"):
+        stages["table"] = PaperAnalysisStage(status=ArtifactStatus.DONE, cached=True)
+
+    async def run_stage(
+        stage: str, func: Callable[..., Awaitable[Any]], *args: Any
+    ) -> Optional[Any]:
+        stage_started_at = time.monotonic()
+        try:
+            result = await single_flight.do(f"{stage}:{paper_id}", func, *args)
+        except Exception as e:
+            stages[stage] = PaperAnalysisStage(
+                status=ArtifactStatus.FAILED,
+                seconds=time.monotonic() - stage_started_at,
+                error=str(e),
+            )
+            return None
+        stages[stage] = PaperAnalysisStage(
+            status=ArtifactStatus.DONE, seconds=time.monotonic() - stage_started_at
+        )
+        return result
+
+    pending_stages = dict()
+    if "summary" not in stages:
+        pending_stages["summary"] = run_stage(
+            "summary",
+            generate_paper_summary,
+            paper_id,
+            summary_path,
+            llm_client,
+            pdf_processor,
+            paper_index,
+            artifact_store,
+            priority,
+        )
+    if "table" not in stages:
+        pending_stages["table"] = run_stage(
+            "table",
+            generate_primary_result_table,
+            paper_id,
+            table_path,
+            llm_client,
+            pdf_processor,
+            paper_index,
+            artifact_store,
+            table_store,
+            priority,
+        )
+    results = dict(zip(pending_stages, await asyncio.gather(*pending_stages.values())))
+    if not any(results.values()) and is_deadline_exceeded():
+        raise DeadlineExceededException(f"the analysis of paper {paper_id}")
+
+    return AnalyzePaperResponse(
+        paper_id=paper_id,
+        summary=results.get("summary", summary),
+        table_path=results.get("table", table_path),
+        stages=stages,
+        elapsed_seconds=time.monotonic() - started_at,
+    )
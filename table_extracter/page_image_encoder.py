@@ -0,0 +1,85 @@
+import base64
+from typing import Optional
+
+import pymupdf
+from pydantic import BaseModel
+
+from utils.const import (
+    PAGE_IMAGE_CROP_CAPTION_MARGIN,
+    PAGE_IMAGE_CROP_MARGIN,
+    PAGE_IMAGE_CROP_TO_TABLES,
+    PAGE_IMAGE_DPI,
+    PAGE_IMAGE_FORMAT,
+    PAGE_IMAGE_GRAYSCALE,
+    PAGE_IMAGE_JPEG_QUALITY,
+)
+
+MIME_TYPES = {"jpeg": "image/jpeg", "png": "image/png"}
+
+
+class PageImageOptions(BaseModel):
+    dpi: int = PAGE_IMAGE_DPI
+    grayscale: bool = PAGE_IMAGE_GRAYSCALE
+    image_format: str = PAGE_IMAGE_FORMAT
+    jpeg_quality: int = PAGE_IMAGE_JPEG_QUALITY
+    crop_to_tables: bool = PAGE_IMAGE_CROP_TO_TABLES
+
+
+class PageImage(BaseModel):
+    image_bytes: bytes
+    mime_type: str
+
+    def to_data_url(self) -> str:
+        base64_image = base64.b64encode(self.image_bytes).decode("utf-8")
+        return f"data:{self.mime_type};base64,{base64_image}"
+
+
+def get_table_clip(
+    pdf_page: pymupdf.Page, table_bboxes: list[tuple[float, float, float, float]]
+) -> Optional[pymupdf.Rect]:
+    """
+    Union of the detected table boxes plus a margin (larger above, where the
+    caption usually sits), clamped to the page.
+    """
+    if not table_bboxes:
+        return None
+
+    clip = pymupdf.Rect(table_bboxes[0])
+    for table_bbox in table_bboxes[1:]:
+        clip |= pymupdf.Rect(table_bbox)
+
+    clip = pymupdf.Rect(
+        clip.x0 - PAGE_IMAGE_CROP_MARGIN,
+        clip.y0 - PAGE_IMAGE_CROP_CAPTION_MARGIN,
+        clip.x1 + PAGE_IMAGE_CROP_MARGIN,
+        clip.y1 + PAGE_IMAGE_CROP_MARGIN,
+    )
+    return clip & pdf_page.rect
+
+
+def render_page_image(
+    pdf_page: pymupdf.Page,
+    table_bboxes: Optional[list[tuple[float, float, float, float]]] = None,
+    options: PageImageOptions = PageImageOptions(),
+) -> PageImage:
+    """
+    Render a page (or just its table region) straight to encoded image bytes,
+    without a round trip through the filesystem.
+    """
+    clip = None
+    if options.crop_to_tables and table_bboxes:
+        clip = get_table_clip(pdf_page, table_bboxes)
+
+    pdf_page_pix_map = pdf_page.get_pixmap(
+        dpi=options.dpi,
+        colorspace=pymupdf.csGRAY if options.grayscale else pymupdf.csRGB,
+        clip=clip,
+    )
+    if options.image_format == "jpeg":
+        image_bytes = pdf_page_pix_map.tobytes("jpeg", jpg_quality=options.jpeg_quality)
+    else:
+        image_bytes = pdf_page_pix_map.tobytes("png")
+
+    return PageImage(
+        image_bytes=image_bytes, mime_type=MIME_TYPES[options.image_format]
+    )
@@ -0,0 +1,106 @@
+import logging
+import re
+
+import pymupdf
+
+from db.models import TableCandidate
+from utils.const import TABLE_CANDIDATE_MIN_TEXT_CHARS, TABLE_CANDIDATE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# "Table 2", "TABLE 3." or "Table S1" at the start of a line, not "(Table 2)" in prose
+TABLE_CAPTION_PATTERN = re.compile(r"^\s*table\s+S?\d+\b", re.IGNORECASE | re.MULTILINE)
+NUMERIC_LINE_PATTERN = re.compile(r"^[\s\d.,%±<>=()\-–/:;]+$")
+
+
+def count_rule_lines(pdf_page: pymupdf.Page) -> tuple[int, int]:
+    """
+    Count horizontal and vertical rules drawn on the page, either as line
+    segments or as hairline rectangles.
+    """
+    horizontal_lines = 0
+    vertical_lines = 0
+    for drawing in pdf_page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) < 1 and abs(start.x - end.x) > 20:
+                    horizontal_lines += 1
+                elif abs(start.x - end.x) < 1 and abs(start.y - end.y) > 10:
+                    vertical_lines += 1
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height < 2 and rect.width > 20:
+                    horizontal_lines += 1
+                elif rect.width < 2 and rect.height > 10:
+                    vertical_lines += 1
+    return horizontal_lines, vertical_lines
+
+
+def get_numeric_line_ratio(page_text: str) -> float:
+    """
+    Share of short non-empty lines made only of numbers and punctuation,
+    which is typical for table cells extracted as text.
+    """
+    lines = [line.strip() for line in page_text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    numeric_lines = sum(
+        1 for line in lines if len(line) <= 25 and NUMERIC_LINE_PATTERN.match(line)
+    )
+    return numeric_lines / len(lines)
+
+
+def score_pdf_page(
+    pdf_page: pymupdf.Page,
+    page_number: int,
+    threshold: float = TABLE_CANDIDATE_THRESHOLD,
+) -> TableCandidate:
+    """
+    Cheap local estimate (0-1) of how likely the page holds a table.
+    """
+    page_text = str(pdf_page.get_text())
+    image_count = len(pdf_page.get_images())
+    caption_count = len(TABLE_CAPTION_PATTERN.findall(page_text))
+    horizontal_lines, vertical_lines = count_rule_lines(pdf_page)
+    numeric_line_ratio = get_numeric_line_ratio(page_text)
+
+    # find_tables is by far the slowest signal, only run it when a cheap one fires
+    tables = []
+    if caption_count or horizontal_lines >= 3 or numeric_line_ratio >= 0.15:
+        try:
+            tables = pdf_page.find_tables().tables
+        except Exception as e:
+            logger.warning(f"find_tables failed on page number {page_number}: {e}")
+
+    score = 0.0
+    if tables:
+        score += 0.5
+    if caption_count:
+        score += 0.3
+    if horizontal_lines >= 3:
+        score += 0.1
+    if horizontal_lines >= 3 and vertical_lines >= 3:
+        score += 0.1
+    if numeric_line_ratio >= 0.15:
+        score += 0.2
+
+    # scanned or image-only pages cannot be judged from the text layer
+    if image_count and len(page_text.strip()) < TABLE_CANDIDATE_MIN_TEXT_CHARS:
+        score = 1.0
+
+    score = min(1.0, score)
+    return TableCandidate(
+        page_number=page_number,
+        score=round(score, 3),
+        is_candidate=score >= threshold,
+        table_count=len(tables),
+        caption_count=caption_count,
+        horizontal_lines=horizontal_lines,
+        vertical_lines=vertical_lines,
+        numeric_line_ratio=round(numeric_line_ratio, 3),
+        text_chars=len(page_text),
+        image_count=image_count,
+        table_bboxes=[tuple(table.bbox) for table in tables],
+    )
+
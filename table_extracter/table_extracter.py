@@ -1,199 +1,338 @@
 import asyncio
-import base64
 import csv
+import hashlib
+import io
 import json
 import logging
 import os
+import time
 from typing import Optional
 
-from openai import AsyncOpenAI
-import pymupdf
+from openai.types.chat import ChatCompletion
 
-from config import OPENAI_APIKEY
-from utils.const import MAX_CONCURRENT_PAGE_TABLE_EXTRACTION_TASK
-from utils.util import schedule_task
+from db.artifact_store import ArtifactStore
+from db.models import ArtifactStatus, LLMPriority, TableCandidate
+from db.page_checkpoints import PageCheckpointStore
+from db.paper_index import PaperIndex
+from db.table_store import TableStore
+from llm_client.llm_cache import LLMCache
+from llm_client.llm_client import LLMClient
+from pdf_processor.pdf_processor import PdfProcessor
+from table_extracter.page_image_encoder import PageImage, PageImageOptions
+from utils.const import MAX_PAGE_IMAGES_IN_MEMORY, TABLE_CANDIDATE_THRESHOLD
+from utils.metrics import PAPER_STAGE_SECONDS
+from utils.util import map_bounded, write_file_atomic
 
 logger = logging.getLogger(__name__)
 
 
 class TableExtracter:
-    def __init__(self, paper_id: int):
+    """
+    The tables found on each page are checkpointed, so a failed page or a failed
+    primary result table pick only redoes that call on the next run.
+    """
+
+    def __init__(
+        self,
+        paper_id: int,
+        # None when only the request builders are used, as by the batch pipeline
+        llm_client: Optional[LLMClient],
+        pdf_processor: PdfProcessor,
+        table_store: TableStore,
+        page_image_options: PageImageOptions = PageImageOptions(),
+        priority: LLMPriority = LLMPriority.INTERACTIVE,
+    ):
         self.paper_id = paper_id
+        self.llm_client = llm_client
+        self.pdf_processor = pdf_processor
+        self.page_image_options = page_image_options
+        self.priority = priority
         self.paper_path = f"data/downloaded_papers/{paper_id}.pdf"
+        self.checkpoints = PageCheckpointStore(paper_id, "table")
+        self.table_store = table_store
+        # candidate pages rendered while they were scored, by page number
+        self.page_images: dict[int, PageImage] = dict()
+
+    async def render_pdf_page(
+        self, pdf_page_number: int, table_candidate: Optional[TableCandidate] = None
+    ) -> PageImage:
+        return await self.pdf_processor.render_table_page(
+            self.paper_path,
+            pdf_page_number,
+            table_candidate.table_bboxes if table_candidate else None,
+            self.page_image_options,
+        )
+
+    def get_tables_from_pdf_page_params(self, pdf_page_image: PageImage) -> dict:
+        # Define the enhanced prompt for table extraction
+        prompt_text = (
+            "Analyze the image provided and extract all tables, presenting the results in **JSON format**. "
+            "Each table should include its headers, rows, and any associated metadata (e.g., table captions or titles if visible). "
+            "Ensure the JSON is well-structured and clearly differentiates between headers and data rows. "
+            "If no tables are found, respond with exactly: 'No tables found in this image.' Avoid providing any additional information or commentary."
+        )
+
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt_text,
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {"url": pdf_page_image.to_data_url()},
+                        },
+                    ],
+                }
+            ],
+        )
+
+    def read_pdf_page_tables(
+        self, pdf_page_number: int, response: ChatCompletion
+    ) -> Optional[str]:
+        # Parse the response and handle cases with or without tables
+        extracted_content = response.choices[0].message.content.strip()
+        if extracted_content == "No tables found in this image.":
+            logger.exception(
+                f"No tables found in page number {pdf_page_number} of paer id {self.paper_id}"
+            )
+            return None
+        else:
+            return extracted_content
 
     async def get_tables_from_pdf_page(
-        self, pdf_page_number: int, pdf_page_pix_map: pymupdf.Pixmap
+        self, pdf_page_number: int, pdf_page_image: PageImage
     ) -> Optional[str]:
         """
         Extract tables from the image of a PDF page using OpenAI GPT-4o in JSON.
         """
         try:
-            async with AsyncOpenAI(api_key=OPENAI_APIKEY, max_retries=0) as aclient:
-                pdf_page_image_path = (
-                    f"data/temp/pdf_page_{self.paper_id}_{pdf_page_number}.png"
-                )
-                # Ensure the directory exists
-                os.makedirs(os.path.dirname(pdf_page_image_path), exist_ok=True)
-                pdf_page_pix_map.save(pdf_page_image_path)
-
-                # Read the image and encode it in base64
-                with open(pdf_page_image_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-
-                # Define the enhanced prompt for table extraction
-                prompt_text = (
-                    "Analyze the image provided and extract all tables, presenting the results in **JSON format**. "
-                    "Each table should include its headers, rows, and any associated metadata (e.g., table captions or titles if visible). "
-                    "Ensure the JSON is well-structured and clearly differentiates between headers and data rows. "
-                    "If no tables are found, respond with exactly: 'No tables found in this image.' Avoid providing any additional information or commentary."
-                )
-
-                # Make the request to the chat model
-                response = await aclient.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": prompt_text,
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{base64_image}"
-                                    },
-                                },
-                            ],
-                        }
-                    ],
-                )
-
-                os.remove(pdf_page_image_path)
-
-                # Parse the response and handle cases with or without tables
-                extracted_content = response.choices[0].message.content.strip()
-                if extracted_content == "No tables found in this image.":
-                    logger.exception(
-                        f"No tables found in page number {pdf_page_number} of paer id {self.paper_id}"
-                    )
-                    return None
-                else:
-                    return extracted_content
+            # Make the request to the chat model
+            response = await self.llm_client.chat_completion(
+                caller="table_extracter",
+                priority=self.priority,
+                **self.get_tables_from_pdf_page_params(pdf_page_image),
+            )
+            return self.read_pdf_page_tables(pdf_page_number, response)
         except Exception as e:
-            os.remove(pdf_page_image_path)
-            logger.exception(
+            # the primary result table may be on the page that failed
+            raise Exception(
                 f"An error occurred while extracting tables from page number {pdf_page_number} of paper id {self.paper_id}: {e}"
             )
-            return None
 
-    async def get_primary_result_table_helper(
-        self, pdf_page_tables: list[str]
-    ) -> Optional[str]:
+    def get_pdf_page_input_key(
+        self, pdf_page_number: int, table_candidate: Optional[TableCandidate]
+    ) -> str:
         """
-        Processes a list of tables, identifies the main result table, and exports it to a CSV file.
+        Key of the request for a page without rendering it: the prompt plus what
+        the image is rendered from.
         """
+        params = self.get_tables_from_pdf_page_params(
+            PageImage(image_bytes=b"", mime_type="")
+        )
+        pdf_stat = os.stat(self.paper_path)
+        return LLMCache.get_key(
+            dict(
+                params,
+                pdf_page_number=pdf_page_number,
+                pdf_size=pdf_stat.st_size,
+                pdf_mtime_ns=pdf_stat.st_mtime_ns,
+                table_bboxes=table_candidate.table_bboxes if table_candidate else None,
+                page_image_options=self.page_image_options.model_dump(),
+            )
+        )
+
+    async def get_checkpointed_pdf_page_tables(
+        self, pdf_page_number: int, table_candidate: Optional[TableCandidate]
+    ) -> None:
+        async def extract() -> Optional[str]:
+            pdf_page_image = self.page_images.pop(pdf_page_number, None)
+            if pdf_page_image is None:
+                pdf_page_image = await self.render_pdf_page(
+                    pdf_page_number, table_candidate
+                )
+            return await self.get_tables_from_pdf_page(pdf_page_number, pdf_page_image)
+
         try:
-            # Prompt text to identify main result table
-            prompt_text = (
-                "From the following list of tables, choose the main result table. "
-                "Provide the table columns and rows in a structured format suitable for CSV export. "
-                "Tables:\n" + "\n".join(pdf_page_tables)
+            await self.checkpoints.run_page(
+                f"Page {pdf_page_number}",
+                self.get_pdf_page_input_key(pdf_page_number, table_candidate),
+                extract,
             )
+        except Exception:
+            # recorded in the checkpoint and raised once every page had its attempt
+            pass
 
-            # Define the function for creating a CSV
-            functions = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "create_result_table_csv",
-                        "description": "Create a CSV file from the main result table",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "columns": {
+    def get_primary_result_table_params(self, pdf_page_tables: list[str]) -> dict:
+        # Prompt text to identify main result table
+        prompt_text = (
+            "From the following list of tables, choose the main result table. "
+            "Provide the table columns and rows in a structured format suitable for CSV export. "
+            "Tables:\n" + "\n".join(pdf_page_tables)
+        )
+
+        # Define the function for creating a CSV
+        functions = [
+            {
+                "type": "function",
+                "function": {
+                    "name": "create_result_table_csv",
+                    "description": "Create a CSV file from the main result table",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "columns": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "List of column names",
+                            },
+                            "rows": {
+                                "type": "array",
+                                "items": {
                                     "type": "array",
                                     "items": {"type": "string"},
-                                    "description": "List of column names",
-                                },
-                                "rows": {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "array",
-                                        "items": {"type": "string"},
-                                    },
-                                    "description": "2D array of row data",
                                 },
+                                "description": "2D array of row data",
                             },
-                            "required": ["columns", "rows"],
                         },
+                        "required": ["columns", "rows"],
                     },
-                }
-            ]
+                },
+            }
+        ]
 
-            # Make the OpenAI request
-            async with AsyncOpenAI(api_key=OPENAI_APIKEY, max_retries=0) as aclient:
-                response = await aclient.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": prompt_text}],
-                    tools=functions,
-                )
+        return dict(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt_text}],
+            tools=functions,
+        )
 
-            if response.choices[0].message.tool_calls:
-                # Parse the arguments
-                args = json.loads(
-                    response.choices[0].message.tool_calls[0].function.arguments
-                )
+    async def write_primary_result_table(
+        self, response: ChatCompletion
+    ) -> Optional[str]:
+        if not response.choices[0].message.tool_calls:
+            return None
 
-                csv_save_path = f"data/extracted_tables/{self.paper_id}.csv"
+        # Parse the arguments
+        args = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
 
-                columns = args.get("columns", [])
-                rows = args.get("rows", [])
+        csv_save_path = f"data/extracted_tables/{self.paper_id}.csv"
 
-                os.makedirs(os.path.dirname(csv_save_path), exist_ok=True)
+        columns = args.get("columns", [])
+        rows = args.get("rows", [])
 
-                # Write to CSV
-                with open(csv_save_path, "w", newline="") as csvfile:
-                    csvwriter = csv.writer(csvfile)
-                    csvwriter.writerow(columns)
-                    csvwriter.writerows(rows)
+        # Write to CSV in memory, then atomically into place
+        csv_buffer = io.StringIO(newline="")
+        csvwriter = csv.writer(csv_buffer)
+        csvwriter.writerow(columns)
+        csvwriter.writerows(rows)
+        csv_content = csv_buffer.getvalue().encode("utf-8")
+        write_file_atomic(csv_save_path, csv_content)
 
-                return csv_save_path
+        # the next compaction backfills the table from its CSV if this fails
+        try:
+            await asyncio.to_thread(
+                self.table_store.append,
+                self.paper_id,
+                columns,
+                rows,
+                hashlib.sha256(csv_content).hexdigest(),
+            )
+        except Exception as e:
+            logger.warning(
+                f"Failed to append the table of paper id {self.paper_id} to the table store: {e}"
+            )
+
+        return csv_save_path
 
+    async def get_primary_result_table_helper(
+        self, pdf_page_tables: list[str]
+    ) -> Optional[str]:
+        """
+        Processes a list of tables, identifies the main result table, and exports it to a CSV file.
+        """
+        try:
+            # Make the OpenAI request
+            response = await self.llm_client.chat_completion(
+                caller="table_extracter",
+                priority=self.priority,
+                **self.get_primary_result_table_params(pdf_page_tables),
+            )
+            return await self.write_primary_result_table(response)
         except Exception as e:
-            logger.exception(f"An error occurred while processing tables: {e}")
-            return None
+            raise Exception(
+                f"An error occurred while processing the tables of paper id {self.paper_id}: {e}"
+            )
+
+    def get_checkpointed_page_numbers(self) -> set[int]:
+        return {
+            int(label.removeprefix("Page "))
+            for label, page in self.checkpoints.checkpoints.pages.items()
+            if page.status == ArtifactStatus.DONE
+        }
+
+    async def get_table_pages(self) -> tuple[list[int], dict[int, TableCandidate]]:
+        """
+        Page numbers to send to the model and the table candidates among them.
+        Only pages the local pre-pass considers likely to hold a table are sent,
+        or every page if none qualifies. Candidate pages are rendered in the same
+        visit as they are scored, unless their tables are already checkpointed.
+        A PDF scored before reuses its stored scores and renders instead.
+        """
+        table_scan = await self.pdf_processor.scan_table_pages(
+            self.paper_path,
+            TABLE_CANDIDATE_THRESHOLD,
+            self.page_image_options,
+            self.get_checkpointed_page_numbers(),
+        )
+        self.page_images = table_scan.page_images
+        table_candidates = {
+            table_candidate.page_number: table_candidate
+            for table_candidate in table_scan.table_candidates
+            if table_candidate.is_candidate
+        }
+        if table_candidates:
+            return sorted(table_candidates), table_candidates
+
+        logger.info(
+            f"No table candidates found for paper id {self.paper_id}, sending all pages"
+        )
+        return list(range(1, len(table_scan.table_candidates) + 1)), table_candidates
 
     async def get_primary_result_table(self):
         """
-        1. Iterate through all pages of the PDF document.
-        2. Convert each page into an image.
-        3. Use OpenAI GPT-4o to extract tables from the image of each page in JSON format.
+        1. Iterate through all pages of the PDF document and score them locally for tables.
+        2. Render each candidate page (cropped to its detected tables) into a compact image in memory while it is scored.
+        3. Use OpenAI GPT-4o to extract tables from the image of each page in JSON format, checkpointing each page.
         4. Concatenate all the extracted tables.
         5. Create an OpenAI function call that processes the concatenated tables using a tool LLM.
         6. The LLM will return the columns and rows of the primary result table.
-        7. Save the primary result table as a CSV file.
+        7. Save the primary result table as a CSV file and append its cells to the table store.
         """
-        pdf_doc = pymupdf.open(self.paper_path)
-        tasks: list[asyncio.Task[str]] = list()
-
-        semaphore = asyncio.Semaphore(value=MAX_CONCURRENT_PAGE_TABLE_EXTRACTION_TASK)
-        async with asyncio.TaskGroup() as tg:
-            for pdf_page_number, pdf_page in enumerate(pdf_doc):
-                pdf_page_pix_map: pymupdf.Pixmap = pdf_page.get_pixmap()
-                tasks.append(
-                    tg.create_task(
-                        schedule_task(
-                            semaphore,
-                            self.get_tables_from_pdf_page,
-                            pdf_page_number + 1,
-                            pdf_page_pix_map,
-                        )
-                    )
-                )
+        self.checkpoints.load()
+        pdf_page_numbers, table_candidates = await self.get_table_pages()
 
-        pdf_page_tables = [task.result() for task in tasks if task.result() is not None]
+        # pages without a candidate image are rendered in the process pool only
+        # when a slot frees up. Checkpointed pages are neither rendered nor sent again.
+        await map_bounded(
+            pdf_page_numbers,
+            consume=lambda pdf_page_number: self.get_checkpointed_pdf_page_tables(
+                pdf_page_number, table_candidates.get(pdf_page_number)
+            ),
+            max_concurrency=MAX_PAGE_IMAGES_IN_MEMORY,
+            name="page_table",
+        )
+        labels = [f"Page {pdf_page_number}" for pdf_page_number in pdf_page_numbers]
+        self.checkpoints.raise_failed(labels)
+        pdf_page_tables = [
+            pdf_page_table
+            for pdf_page_table in self.checkpoints.get_outputs(labels)
+            if pdf_page_table is not None
+        ]
 
         if not pdf_page_tables or len(pdf_page_tables) == 0:
             raise Exception(
@@ -210,3 +349,44 @@ class TableExtracter:
             )
 
         return pdf_result_table_path
+
+
+async def generate_primary_result_table(
+    paper_id: int,
+    table_path: str,
+    llm_client: LLMClient,
+    pdf_processor: PdfProcessor,
+    paper_index: PaperIndex,
+    artifact_store: ArtifactStore,
+    table_store: TableStore,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+) -> str:
+    if paper_index.is_done(paper_id, "table"):
+        return table_path
+
+    async with artifact_store.claim(paper_id, "table"):
+        # a worker of another process may have extracted it while this one waited
+        if paper_index.is_done(paper_id, "table"):
+            return table_path
+
+        started_at = time.monotonic()
+        try:
+            table_path = await TableExtracter(
+                paper_id=paper_id,
+                llm_client=llm_client,
+                pdf_processor=pdf_processor,
+                table_store=table_store,
+                priority=priority,
+            ).get_primary_result_table()
+        except Exception as e:
+            PAPER_STAGE_SECONDS.labels("table", "failed").observe(
+                time.monotonic() - started_at
+            )
+            paper_index.record_failed(paper_id, "table", str(e))
+            raise
+        PAPER_STAGE_SECONDS.labels("table", "done").observe(
+            time.monotonic() - started_at
+        )
+
+        await paper_index.record_done(paper_id, "table")
+        return table_path
@@ -0,0 +1,144 @@
+import logging
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import OPENAI_APIKEY, OPENAI_BASE_URL
+from db.models import ClientPoolStats
+from utils.const import (
+    HTTP2_ENABLED,
+    HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_TIMEOUT_SECONDS,
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PooledClient:
+    """
+    A long-lived httpx.AsyncClient that counts requests and new connections,
+    so the reuse ratio of its pool can be reported.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+    ):
+        self.name = name
+        self.requests = 0
+        self.new_connections = 0
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            event_hooks={"request": [self.on_request]},
+        )
+
+    async def on_request(self, request: httpx.Request) -> None:
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    def get_pool_stats(self) -> ClientPoolStats:
+        # httpcore does not expose pool state publicly, read it defensively
+        pool = getattr(self.client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        pending_requests = list(getattr(pool, "_requests", []))
+        idle_connections = sum(1 for connection in connections if connection.is_idle())
+
+        reuse_ratio = 0.0
+        if self.requests:
+            reuse_ratio = max(0.0, 1 - self.new_connections / self.requests)
+
+        return ClientPoolStats(
+            name=self.name,
+            http2=HTTP2_ENABLED,
+            requests=self.requests,
+            new_connections=self.new_connections,
+            reuse_ratio=round(reuse_ratio, 4),
+            connections=len(connections),
+            active_connections=len(connections) - idle_connections,
+            idle_connections=idle_connections,
+            waiters=sum(1 for request in pending_requests if request.is_queued()),
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class ClientRegistry:
+    """
+    Application-wide HTTP clients built once in the lifespan and injected into
+    PaperDownloader, PaperSummariser and TableExtracter, so every call reuses
+    pooled keep-alive (and HTTP/2) connections instead of a fresh handshake.
+    """
+
+    def __init__(
+        self,
+        openai_api_key: str = OPENAI_APIKEY,
+        openai_base_url: Optional[str] = OPENAI_BASE_URL,
+    ):
+        self.openai_api_key = openai_api_key
+        self.openai_base_url = openai_base_url
+        self.http: Optional[PooledClient] = None
+        self.openai_http: Optional[PooledClient] = None
+        self.openai_client: Optional[AsyncOpenAI] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self.http.client
+
+    async def start(self) -> None:
+        self.http = PooledClient(
+            name="http",
+            timeout=HTTP_TIMEOUT_SECONDS,
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        self.openai_http = PooledClient(
+            name="openai",
+            timeout=OPENAI_TIMEOUT_SECONDS,
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        self.openai_client = AsyncOpenAI(
+            api_key=self.openai_api_key,
+            base_url=self.openai_base_url,
+            max_retries=0,
+            http_client=self.openai_http.client,
+        )
+        logger.info(f"Client registry started, http2: {HTTP2_ENABLED}")
+
+    async def close(self) -> None:
+        if self.openai_client:
+            await self.openai_client.close()
+        if self.http:
+            await self.http.aclose()
+        logger.info("Client registry closed")
+
+    def get_pool_stats(self) -> list[ClientPoolStats]:
+        return [
+            pooled_client.get_pool_stats()
+            for pooled_client in (self.http, self.openai_http)
+            if pooled_client
+        ]
@@ -1,3 +1,196 @@
-MAX_CONCURRENT_DOWNLOAD_TASK = 5
-MAX_CONCURRENT_PAGE_SUMMARISATION_TASK = 5
-MAX_CONCURRENT_PAGE_TABLE_EXTRACTION_TASK = 5
+import os
+
+MAX_CONCURRENT_DOWNLOAD_TASK = 10
+# Finished download jobs, and the paper statuses only they refer to, are kept
+# for DOWNLOAD_JOB_TTL_SECONDS, and at most MAX_FINISHED_DOWNLOAD_JOBS of them
+DOWNLOAD_JOB_TTL_SECONDS = 3600
+MAX_FINISHED_DOWNLOAD_JOBS = 1000
+# Pages of one paper rendered at once when they are not rendered while scored
+# (no table candidate found, or a checkpoint that no longer matches)
+MAX_PAGE_IMAGES_IN_MEMORY = 8
+
+# Per-host token bucket rates in requests per second: (initial rate, max rate).
+# Hosts are matched exactly or by domain suffix, anything else uses the default.
+HOST_RATE_LIMITS = {
+    "pubmed.ncbi.nlm.nih.gov": (2.0, 3.0),
+    "pmc.ncbi.nlm.nih.gov": (3.0, 10.0),
+    "www.ncbi.nlm.nih.gov": (3.0, 10.0),
+    "europepmc.org": (3.0, 10.0),
+    "silverchair.com": (1.0, 4.0),
+}
+DEFAULT_HOST_RATE_LIMIT = (1.0, 4.0)
+MIN_HOST_RATE = 0.1
+HOST_RATE_BURST = 2
+# AIMD: add this many requests per second after each success, multiply on throttling
+HOST_RATE_ADDITIVE_INCREASE = 0.05
+HOST_RATE_MULTIPLICATIVE_DECREASE = 0.5
+MAX_HOP_RETRIES = 5
+
+PDF_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PDF_CONTENT_TYPES = (
+    "application/pdf",
+    "application/x-pdf",
+    "application/octet-stream",
+    "binary/octet-stream",
+)
+
+# Shared connection pools built in the app lifespan
+HTTP2_ENABLED = True
+HTTP_TIMEOUT_SECONDS = 30
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 30
+OPENAI_TIMEOUT_SECONDS = 120
+OPENAI_MAX_CONNECTIONS = 50
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 50
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = 60
+
+# Request deadlines, given in seconds by the X-Request-Timeout header or the
+# timeout query parameter, apply to every LLM call made for the request
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+REQUEST_TIMEOUT_QUERY_PARAM = "timeout"
+MAX_REQUEST_TIMEOUT_SECONDS = 3600
+# Status logged for a request whose client went away before the response
+CLIENT_CLOSED_REQUEST_STATUS = 499
+
+LLM_CACHE_DIR = "data/llm_cache"
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Local pre-pass deciding which pages are sent to the vision model
+TABLE_CANDIDATE_THRESHOLD = 0.3
+TABLE_CANDIDATE_MIN_TEXT_CHARS = 200
+
+# Page images sent to the vision model. pymupdf encodes "png" and "jpeg" natively.
+PAGE_IMAGE_DPI = 110
+PAGE_IMAGE_GRAYSCALE = True
+PAGE_IMAGE_FORMAT = "jpeg"
+PAGE_IMAGE_JPEG_QUALITY = 80
+PAGE_IMAGE_CROP_TO_TABLES = True
+# points of context kept around detected tables, more above for the caption
+PAGE_IMAGE_CROP_MARGIN = 12
+PAGE_IMAGE_CROP_CAPTION_MARGIN = 60
+
+# Worker processes used for PDF text extraction, table scoring and page rendering
+PDF_PROCESS_POOL_WORKERS = min(4, os.cpu_count() or 1)
+PDF_PROCESS_DOCUMENT_CACHE_SIZE = 4
+# Page texts, table scores and page renders derived once per PDF content (sha256).
+# Bump the version when text extraction, table scoring or rendering changes.
+PAGE_STORE_DIR = "data/page_store"
+PAGE_STORE_VERSION = 1
+
+# Page packing for summarisation, token counts are estimated at ~4 characters per token
+SUMMARY_CHUNK_TOKEN_BUDGET = 3000
+SUMMARY_MAX_CHUNKS = 12
+SUMMARY_REDUCE_TOKEN_BUDGET = 4000
+SUMMARY_MIN_PAGE_TOKENS = 25
+
+# In-memory LRU of the summaries and tables served by the API, larger files are
+# served without being kept. Responses of at least ARTIFACT_GZIP_MIN_BYTES are
+# gzipped for clients that accept it.
+ARTIFACT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ARTIFACT_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+ARTIFACT_GZIP_MIN_BYTES = 1024
+ARTIFACT_STREAM_CHUNK_SIZE = 64 * 1024
+MAX_BULK_SUMMARIES = 500
+
+# Columnar store of every extracted result table, one row per cell. Each table is
+# appended as a segment, and segments are merged once enough have accumulated.
+# Bump the version when the schema or the cell normalisation changes.
+TABLE_STORE_DIR = "data/table_store"
+TABLE_STORE_VERSION = 1
+TABLE_STORE_COMPACT_MIN_SEGMENTS = 64
+TABLE_STORE_COMPACT_INTERVAL_SECONDS = 300
+TABLE_QUERY_PAGE_SIZE = 1000
+TABLE_QUERY_MAX_ROWS = 10000
+
+# Full-text index over page texts and summaries, kept in line with the paper index.
+# A document's rowid is paper_id * SEARCH_ROWID_STRIDE + page number, 0 for the summary.
+SEARCH_INDEX_PATH = "data/search_index.sqlite3"
+SEARCH_ROWID_STRIDE = 100000
+SEARCH_INDEX_UPDATE_INTERVAL_SECONDS = 10
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_SNIPPET_TOKENS = 24
+# terms matching at least this many documents are too costly to rank by
+SEARCH_MAX_RANKED_DOCUMENTS = 3000
+SEARCH_MAX_PAPER_IDS = 100
+
+# Per-page outputs of the summary and table stages, kept so a rerun only redoes failed pages
+PAGE_CHECKPOINT_DIR = "data/checkpoints"
+
+# Bulk analysis pipeline: workers per stage and size of the queues between stages
+PIPELINE_DOWNLOAD_CONCURRENCY = 5
+PIPELINE_SUMMARY_CONCURRENCY = 3
+PIPELINE_TABLE_CONCURRENCY = 2
+PIPELINE_QUEUE_SIZE = 10
+# Finished bulk analysis runs are reported for BULK_ANALYSIS_TTL_SECONDS, and at
+# most MAX_FINISHED_BULK_ANALYSES of them are kept
+BULK_ANALYSIS_TTL_SECONDS = 3600
+MAX_FINISHED_BULK_ANALYSES = 100
+
+# Offline Batch API mode. OpenAI caps a batch at 50,000 requests and a 200 MB input file.
+LLM_BATCH_DIR = "data/llm_batches"
+LLM_BATCH_COMPLETION_WINDOW = "24h"
+LLM_BATCH_MAX_REQUESTS = 50000
+LLM_BATCH_MAX_BYTES = 190 * 1024 * 1024
+LLM_BATCH_POLL_INTERVAL_SECONDS = 30
+LLM_BATCH_UPLOAD_TIMEOUT_SECONDS = 600
+# papers planned together, their page images are held in memory for a wave
+BATCH_PIPELINE_PAPERS_PER_RUN = 200
+
+# Paper metadata index and the artifact each of its status columns tracks
+PAPER_INDEX_PATH = "data/paper_index.sqlite3"
+PAPER_ARTIFACT_PATHS = {
+    "download": "data/downloaded_papers/{paper_id}.pdf",
+    "summary": "data/summaries/{paper_id}.md",
+    "table": "data/extracted_tables/{paper_id}.csv",
+}
+PAPER_INDEX_PAGE_SIZE = 100
+PAPER_INDEX_MAX_PAGE_SIZE = 1000
+
+# Cross-process claims on producing an artifact, one lock file per paper and artifact.
+# A waiting worker polls with a backoff between these intervals.
+ARTIFACT_CLAIM_DIR = "data/claims"
+ARTIFACT_CLAIM_POLL_INTERVAL_SECONDS = 0.05
+ARTIFACT_CLAIM_MAX_POLL_INTERVAL_SECONDS = 1.0
+# temp files of atomic writes older than this were left by a crashed worker
+ARTIFACT_STALE_TEMP_FILE_SECONDS = 3600
+
+# USD per million (prompt, completion) tokens, used for the cost metric only
+LLM_PRICES_PER_MILLION_TOKENS = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+LLM_BATCH_PRICE_DISCOUNT = 0.5
+
+# Process-wide LLM concurrency per model, sized by AIMD between these bounds
+LLM_INITIAL_CONCURRENCY = 8
+LLM_MIN_CONCURRENCY = 1
+LLM_MAX_CONCURRENCY = 64
+# the limit grows by 1 per window of successes, and is multiplied on 429/5xx
+LLM_CONCURRENCY_DECREASE = 0.5
+# or multiplied by this when recent latency exceeds LLM_LATENCY_TOLERANCE x baseline
+LLM_LATENCY_DECREASE = 0.9
+LLM_LATENCY_TOLERANCE = 2.0
+LLM_LATENCY_RECENT_ALPHA = 0.3
+LLM_LATENCY_BASELINE_ALPHA = 0.02
+# (requests per minute, tokens per minute) per model, 0 for no limit. OpenAI usage
+# tier 1 defaults, override per deployment with the LLM_RATE_LIMITS env var.
+LLM_RATE_LIMITS = {
+    "gpt-4o-mini": (500, 200000),
+    "gpt-4o": (500, 30000),
+}
+DEFAULT_LLM_RATE_LIMIT = (500, 30000)
+# tokens budgeted for a request before its usage is known
+LLM_IMAGE_TOKENS = 765
+LLM_DEFAULT_COMPLETION_TOKENS = 500
+LLM_MAX_RETRIES = 5
+EVENT_LOOP_LAG_INTERVAL_SECONDS = 0.1
+
+# Benchmark harness (benchmark/run_benchmark.py) and its local stand-in servers
+BENCHMARK_PAPERS = 20
+BENCHMARK_CONCURRENCY_LEVELS = (1, 4, 16)
+BENCHMARK_PAPER_ID_START = 90000000
+BENCHMARK_RESULTS_DIR = "benchmark/results"
+BENCHMARK_SERVER_START_TIMEOUT_SECONDS = 60
+BENCHMARK_RSS_SAMPLE_INTERVAL_SECONDS = 0.1
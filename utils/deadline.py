@@ -0,0 +1,151 @@
+import asyncio
+from contextvars import ContextVar
+import logging
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import HTTPException, Request, status
+
+from utils.const import (
+    MAX_REQUEST_TIMEOUT_SECONDS,
+    REQUEST_TIMEOUT_HEADER,
+    REQUEST_TIMEOUT_QUERY_PARAM,
+)
+from utils.exception import ClientDisconnectedException, DeadlineExceededException
+from utils.metrics import REQUESTS_ABANDONED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """
+    The time.monotonic() by which a request must be answered, None for no limit.
+    A SingleFlight run holds its own Deadline, lifted to the latest deadline of
+    the callers waiting on it.
+    """
+
+    def __init__(self, expires_at: Optional[float] = None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def get_remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def extend(self, other: Optional["Deadline"]) -> None:
+        if self.expires_at is None:
+            return
+        if other is None or other.expires_at is None:
+            self.expires_at = None
+        else:
+            self.expires_at = max(self.expires_at, other.expires_at)
+
+
+# deadline of the request the current task works for, copied into the tasks it starts
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "current_deadline", default=None
+)
+
+
+def get_remaining_time() -> Optional[float]:
+    deadline = current_deadline.get()
+    return deadline.get_remaining() if deadline else None
+
+
+def is_deadline_exceeded() -> bool:
+    remaining = get_remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def get_call_timeout(default: float, waiting_for: str) -> float:
+    """
+    Timeout for the next call: default, or less if the current deadline is sooner.
+    """
+    remaining = get_remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceededException(waiting_for)
+    return min(default, remaining)
+
+
+async def wait_within_deadline(awaitable: Awaitable[T], waiting_for: str) -> T:
+    """
+    Await awaitable, cancelling it and raising DeadlineExceededException if the
+    current deadline passes first.
+    """
+    remaining = get_remaining_time()
+    if remaining is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, remaining))
+    except TimeoutError:
+        raise DeadlineExceededException(waiting_for) from None
+
+
+def get_request_deadline(request: Request) -> Optional[Deadline]:
+    timeout = request.headers.get(REQUEST_TIMEOUT_HEADER) or request.query_params.get(
+        REQUEST_TIMEOUT_QUERY_PARAM
+    )
+    if not timeout:
+        return None
+    try:
+        seconds = float(timeout)
+    except ValueError:
+        seconds = 0.0
+    if not 0 < seconds <= MAX_REQUEST_TIMEOUT_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Request timeout must be a number of seconds up to {MAX_REQUEST_TIMEOUT_SECONDS}, got {timeout}",
+        )
+    return Deadline.after(seconds)
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    # the request body is already read, the next message is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def run_while_connected(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await the work of a request under its deadline, cancelling the work if the
+    client disconnects or the deadline passes. Pages finished before that are
+    already checkpointed, so a retry picks up where this attempt stopped.
+    """
+    deadline = get_request_deadline(request)
+    route = request.scope.get("route")
+    path = route.path if route else request.url.path
+
+    async def run() -> T:
+        current_deadline.set(deadline)
+        return await wait_within_deadline(awaitable, request.url.path)
+
+    work = asyncio.create_task(run())
+    disconnect = asyncio.create_task(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not work.done():
+            work.cancel()
+            # let the cancellation reach the page calls before answering
+            await asyncio.wait({work})
+
+    if work.cancelled():
+        REQUESTS_ABANDONED.labels(path, "disconnect").inc()
+        logger.info(f"Cancelled {request.url.path} after the client disconnected")
+        raise ClientDisconnectedException(request.url.path)
+    exception = work.exception()
+    if exception and deadline and deadline.get_remaining() <= 0:
+        REQUESTS_ABANDONED.labels(path, "deadline").inc()
+        if not isinstance(exception, DeadlineExceededException):
+            # a page call cut short by the deadline, reported as whatever it raised
+            raise DeadlineExceededException(request.url.path) from exception
+    return work.result()
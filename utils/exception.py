@@ -1,2 +1,26 @@
+from typing import Optional
+
+
 class TooManyRequestsException(Exception):
-    pass
+    def __init__(self, url: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"Too many requests for {url}, retry after: {retry_after}")
+        self.url = url
+        self.retry_after = retry_after
+
+
+class DeadlineExceededException(Exception):
+    def __init__(self, waiting_for: str = ""):
+        super().__init__(f"Request deadline exceeded while waiting for {waiting_for}")
+        self.waiting_for = waiting_for
+
+
+class ClientDisconnectedException(Exception):
+    def __init__(self, path: str = ""):
+        super().__init__(f"Client disconnected from {path}")
+        self.path = path
+
+
+class StalePartialDownloadException(Exception):
+    def __init__(self, url: str = ""):
+        super().__init__(f"Partial download no longer matches {url}, restarting")
+        self.url = url
@@ -0,0 +1,159 @@
+import asyncio
+from typing import Optional
+
+from openai.types import CompletionUsage
+from prometheus_client import Counter, Gauge, Histogram
+
+from utils.const import EVENT_LOOP_LAG_INTERVAL_SECONDS, LLM_PRICES_PER_MILLION_TOKENS
+
+# page fetches and PDF downloads take from tens of milliseconds to minutes
+HOP_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+STAGE_LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+DOWNLOAD_HOP_SECONDS = Histogram(
+    "paper_download_hop_seconds",
+    "Latency of each request made while downloading a paper",
+    ["host", "hop"],
+    buckets=HOP_LATENCY_BUCKETS,
+)
+DOWNLOAD_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "paper_download_rate_limit_wait_seconds",
+    "Time a request waited for its host's rate limiter",
+    ["host"],
+    buckets=WAIT_BUCKETS,
+)
+DOWNLOAD_THROTTLED = Counter(
+    "paper_download_throttled_total",
+    "Responses asking the downloader to slow down (429/503)",
+    ["host", "status_code"],
+)
+DOWNLOAD_RETRIES = Counter(
+    "paper_download_retries_total",
+    "Retries of a download hop after throttling or a transport error",
+    ["hop"],
+)
+DOWNLOAD_BYTES = Counter("paper_download_bytes_total", "PDF bytes downloaded", ["host"])
+DOWNLOAD_QUEUE_WAIT_SECONDS = Histogram(
+    "paper_download_queue_wait_seconds",
+    "Time a paper waited in the download queue before a worker picked it up",
+    buckets=WAIT_BUCKETS,
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds",
+    "Latency of chat completion calls that reached the API",
+    ["caller", "model"],
+    buckets=LLM_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens used by chat completions", ["caller", "model", "kind"]
+)
+LLM_COST_USD = Counter(
+    "llm_cost_usd_total",
+    "Estimated cost of chat completions from LLM_PRICES_PER_MILLION_TOKENS",
+    ["caller", "model"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Failed chat completion calls", ["caller", "model", "error"]
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "llm_cache_lookups_total", "LLM response cache lookups", ["caller", "result"]
+)
+PAGE_STORE_LOOKUPS = Counter(
+    "page_store_lookups_total",
+    "Lookups of page texts, table scores and renders derived from a PDF",
+    ["artifact", "result"],
+)
+ARTIFACT_CACHE_LOOKUPS = Counter(
+    "artifact_cache_lookups_total",
+    "Lookups of summaries and tables in the in-memory artifact cache",
+    ["result"],
+)
+ARTIFACT_CLAIM_WAIT_SECONDS = Histogram(
+    "artifact_claim_wait_seconds",
+    "Time a worker waited for another worker to finish producing the same artifact",
+    ["artifact"],
+    buckets=WAIT_BUCKETS,
+)
+LLM_LIMITER_WAIT_SECONDS = Histogram(
+    "llm_limiter_wait_seconds",
+    "Time a chat completion waited for a concurrency slot and rate limit budget",
+    ["model", "priority"],
+    buckets=WAIT_BUCKETS,
+)
+LLM_CONCURRENCY_LIMIT = Gauge(
+    "llm_concurrency_limit", "Adaptive concurrency limit of a model", ["model"]
+)
+LLM_REQUESTS_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight", "Chat completions holding a slot", ["model"]
+)
+
+BOUNDED_TASK_WAIT_SECONDS = Histogram(
+    "bounded_task_wait_seconds",
+    "Time an item waited for a map_bounded concurrency slot",
+    ["name"],
+    buckets=WAIT_BUCKETS,
+)
+BOUNDED_TASKS_IN_PROGRESS = Gauge(
+    "bounded_tasks_in_progress", "Items holding a map_bounded slot", ["name"]
+)
+
+PAPER_STAGE_SECONDS = Histogram(
+    "paper_stage_seconds",
+    "Time to download, summarise or extract the table of one paper",
+    ["stage", "result"],
+    buckets=STAGE_LATENCY_BUCKETS,
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "Latency of API requests by route",
+    ["method", "route", "status_code"],
+    buckets=STAGE_LATENCY_BUCKETS,
+)
+REQUESTS_ABANDONED = Counter(
+    "http_requests_abandoned_total",
+    "Requests whose work was cancelled on a client disconnect or a passed deadline",
+    ["route", "reason"],
+)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop resumed a task sleeping for EVENT_LOOP_LAG_INTERVAL_SECONDS",
+    buckets=LOOP_LAG_BUCKETS,
+)
+
+
+async def monitor_event_loop_lag(
+    interval: float = EVENT_LOOP_LAG_INTERVAL_SECONDS,
+) -> None:
+    """
+    Sleep for interval in a loop and observe how late each wake-up is. Anything
+    blocking the loop (CPU work, sync I/O) shows up as lag.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started_at = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started_at - interval))
+
+
+def observe_llm_usage(
+    caller: str, model: str, usage: Optional[CompletionUsage], discount: float = 1.0
+) -> None:
+    if not usage:
+        return
+    LLM_TOKENS.labels(caller, model, "prompt").inc(usage.prompt_tokens)
+    LLM_TOKENS.labels(caller, model, "completion").inc(usage.completion_tokens)
+
+    prices = LLM_PRICES_PER_MILLION_TOKENS.get(model)
+    if prices:
+        prompt_price, completion_price = prices
+        cost = (
+            usage.prompt_tokens * prompt_price
+            + usage.completion_tokens * completion_price
+        ) / 1_000_000
+        LLM_COST_USD.labels(caller, model).inc(cost * discount)
@@ -0,0 +1,90 @@
+import asyncio
+from contextvars import copy_context
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from db.models import SingleFlightStats
+from utils.deadline import Deadline, current_deadline, wait_within_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller starts the work,
+    later callers await the same task until it finishes.
+
+    The work runs under a deadline lifted to the latest of its callers' deadlines
+    (none if any caller has none). Each caller stops waiting at its own deadline,
+    and the work is cancelled once no caller is waiting for it.
+    """
+
+    def __init__(self):
+        self.in_flight: dict[str, asyncio.Task] = dict()
+        self.deadlines: dict[str, Deadline] = dict()
+        # callers waiting on each in-flight task
+        self.waiters: dict[asyncio.Task, int] = dict()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(
+        self, key: str, func: Callable[..., Awaitable[Any]], *args: Any
+    ) -> Any:
+        self.calls += 1
+        if key in self.in_flight:
+            self.coalesced += 1
+            logger.info(f"Coalesced request for {key} onto the in-flight call")
+        else:
+            self.executions += 1
+            caller_deadline = current_deadline.get()
+            deadline = Deadline(caller_deadline.expires_at if caller_deadline else None)
+            context = copy_context()
+            context.run(current_deadline.set, deadline)
+            task = asyncio.create_task(func(*args), context=context)
+            self.in_flight[key] = task
+            self.deadlines[key] = deadline
+            task.add_done_callback(lambda task: self.forget(key, task))
+        return await self.wait(key)
+
+    async def wait(self, key: str) -> Any:
+        """
+        Wait for the in-flight call for key, as one more caller of it.
+        """
+        task = self.in_flight[key]
+        self.deadlines[key].extend(current_deadline.get())
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            # shield so one caller going away does not cancel the work for the others
+            return await wait_within_deadline(asyncio.shield(task), key)
+        except BaseException:
+            if not task.done() and self.waiters[task] == 1:
+                self.cancelled += 1
+                logger.info(f"Cancelling {key}, no caller is waiting for it anymore")
+                task.cancel()
+                # the next call for key starts afresh rather than joining the
+                # cancelled task while it unwinds
+                self.forget(key, task)
+            raise
+        finally:
+            if task in self.waiters:
+                self.waiters[task] -= 1
+
+    def forget(self, key: str, task: asyncio.Task) -> None:
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+            del self.deadlines[key]
+        self.waiters.pop(task, None)
+
+    def get_in_flight(self, key: str) -> Optional[asyncio.Task]:
+        return self.in_flight.get(key)
+
+    def get_stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            calls=self.calls,
+            executions=self.executions,
+            coalesced=self.coalesced,
+            cancelled=self.cancelled,
+            in_flight=len(self.in_flight),
+        )
@@ -1,13 +1,17 @@
 import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import json
 import logging
+import os
 import re
+from typing import Optional
+import uuid
 
-logger = logging.getLogger(__name__)
-
+from db.models import Paper
+from utils.metrics import BOUNDED_TASK_WAIT_SECONDS, BOUNDED_TASKS_IN_PROGRESS
 
-def run_async_task(coro):
-    """Wrapper to run a coroutine in a synchronous function."""
-    asyncio.run(coro)
+logger = logging.getLogger(__name__)
 
 
 def get_paper_id(url: str) -> tuple[str, bool]:
@@ -19,6 +23,125 @@ def get_paper_id(url: str) -> tuple[str, bool]:
     return match.group(1), True
 
 
-async def schedule_task(semaphore: asyncio.Semaphore, func, *args):
-    async with semaphore:
-        return await func(*args)
+def read_paper_links(path: str) -> list[Paper]:
+    papers: list[Paper] = []
+    with open(path, "r") as file:
+        urls = [line.strip() for line in file.readlines()]
+        for url in urls:
+            paper_id, is_paper_id_present = get_paper_id(url)
+            if is_paper_id_present:
+                papers.append(Paper(paper_id=paper_id, paper_url=url))
+    return papers
+
+
+async def map_bounded(
+    items, consume, max_concurrency: int, produce=None, name: str = "default"
+) -> list:
+    """
+    For each item run `consume(item, await produce(item))` (or `consume(item)`
+    without a producer) with at most max_concurrency items in flight. The next
+    item is only produced once a slot frees up, so at most max_concurrency
+    produced values are held in memory. Results are returned in input order;
+    the first failure cancels the remaining items and is raised. name labels
+    the slot wait and in-progress metrics.
+    """
+    semaphore = asyncio.Semaphore(value=max_concurrency)
+    in_progress = BOUNDED_TASKS_IN_PROGRESS.labels(name)
+
+    async def process(item):
+        try:
+            # counted once running, a task cancelled before it starts never runs the finally
+            in_progress.inc()
+            if produce is None:
+                return await consume(item)
+            return await consume(item, await produce(item))
+        finally:
+            in_progress.dec()
+            semaphore.release()
+
+    loop = asyncio.get_running_loop()
+    tasks: list[asyncio.Task] = list()
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for item in items:
+                started_at = loop.time()
+                await semaphore.acquire()
+                BOUNDED_TASK_WAIT_SECONDS.labels(name).observe(loop.time() - started_at)
+                tasks.append(tg.create_task(process(item)))
+    except ExceptionGroup as eg:
+        # the remaining items were cancelled, raise the failure like gather does
+        raise eg.exceptions[0]
+    return [task.result() for task in tasks]
+
+
+def write_file_atomic(path: str, content: str | bytes) -> None:
+    """
+    Write to a temp file in the same directory and rename it over path,
+    so readers only ever see the previous or the complete new content.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    mode = "wb" if isinstance(content, bytes) else "w"
+    try:
+        with open(temp_path, mode) as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token for English text), good enough
+    for budgeting requests without a tokenizer dependency.
+    """
+    return (len(text) + 3) // 4
+
+
+def format_sse(event: str, data: dict) -> str:
+    """
+    Format a single Server-Sent Events message.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def is_etag_match(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches etag, comparing weakly as RFC 9110
+    asks for If-None-Match.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {
+        candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")
+    }
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either as delay-seconds or as an HTTP-date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())